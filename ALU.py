@@ -1,61 +1,73 @@
-from tabulate import tabulate
+from typing import Optional
+
+from MachineState import MachineState
+from Renderer import grid
+
+# R and S operands of every data select: AQ, AB, ZQ, ZB, ZA, DA, DQ, DZ
+OPERAND_SOURCES = (
+    lambda registers, q, a, b, d: (registers[a], q),
+    lambda registers, q, a, b, d: (registers[a], registers[b]),
+    lambda registers, q, a, b, d: (0, q),
+    lambda registers, q, a, b, d: (0, registers[b]),
+    lambda registers, q, a, b, d: (0, registers[a]),
+    lambda registers, q, a, b, d: (d, registers[a]),
+    lambda registers, q, a, b, d: (d, q),
+    lambda registers, q, a, b, d: (d, 0),
+)
+
+OPERATIONS = (
+    lambda R, S, c_n: R + S + c_n,          # ADD
+    lambda R, S, c_n: S - R - c_n,          # SUBR
+    lambda R, S, c_n: R - S - c_n,          # SUBS
+    lambda R, S, c_n: R | S,                # OR
+    lambda R, S, c_n: R & S,                # AND
+    lambda R, S, c_n: (R ^ 0xFFFF) & S,     # NOTRS
+    lambda R, S, c_n: R ^ S,                # EXOR
+    lambda R, S, c_n: (R ^ S) ^ 0xFFFF,     # EXNOR
+)
+OPERATION_NAMES = ("ADD", "SUBR", "SUBS", "OR", "AND", "NOTRS", "EXOR", "EXNOR")
+
+# (operand source, operation, result select) of every 9-bit instruction, None for unsupported result selects
+INSTRUCTIONS = tuple((OPERAND_SOURCES[instruction & 0b111], OPERATIONS[(instruction >> 3) & 0b111], instruction >> 6)
+                     if instruction >> 6 <= 0b011 else None for instruction in range(1 << 9))
+
 
 class ALU:
-    def __init__(self):
-        self._q_reg = 0
-        self._registers = [0] * 16
+    def __init__(self, state: Optional[MachineState] = None):
+        # The registers and Q live in the state shared with the other units
+        self._state = state if state is not None else MachineState()
 
     def run(self, instruction: int, a: int, b: int, d: int, c_n: int):
-        data_select = instruction & 0b111
-        opcode = (instruction >> 3) & 0b111
-        result_select = instruction >> 6
-        if result_select > 0b011:
+        decoded = INSTRUCTIONS[instruction] if 0 <= instruction < 1 << 9 else None
+        if decoded is None:
             raise Exception("ALU: unsupported result select")
+        operands, operation, result_select = decoded
 
-        R = self._registers[a] if data_select <= 0b001 else 0 if data_select <= 0b100 else d
-        S = self._q_reg if data_select in [0b000, 0b010, 0b110] else self._registers[b] if data_select in [0b001, 0b011] else self._registers[a] if data_select in [0b100, 0b101] else 0
-
-        res = 0
-        if opcode == 0b000: # ADD
-            res = R + S + c_n
-        if opcode == 0b001: # SUBR
-            res = S - R - c_n
-        if opcode == 0b010: # SUBS
-            res = R - S - c_n
-        if opcode == 0b011: # OR
-            res = R | S
-        if opcode == 0b100: # AND
-            res = R & S
-        if opcode == 0b101: # NOTRS
-            res = (R ^ 0xFFFF) & S
-        if opcode == 0b110: # EXOR
-            res = R ^ S
-        if opcode == 0b111: # EXNOR
-            res = (R ^ S) ^ 0xFFFF
-
-        overflow = res > 0xFFFF or res < 0
-        negative = res < 0
-        res = res & 0xFFFF
-        output = self._registers[a] if result_select == 0b010 else res
+        state = self._state
+        registers = state.registers
+        R, S = operands(registers, state.q, a, b, d)
+        res = operation(R, S, c_n)
+        if res < 0:
+            res &= 0xFFFF
+            status = 0b1110 if res else 0b1111
+        elif res > 0xFFFF:
+            res &= 0xFFFF
+            status = 0b1100 if res else 0b1101
+        else:
+            status = 0 if res else 0b0001
 
+        if result_select == 0b000:
+            return res, status
         if result_select == 0b001:
-            self._q_reg = res
-        if result_select == 0b010 or result_select == 0b011:
-            self._registers[b] = res
-
-        status = 0
-        if overflow:
-            status += 0b1100
-        if negative:
-            status += 0b0010
-        if res == 0:
-            status += 0b0001
-
-        return output, status 
+            state.q = res
+            return res, status
+        output = registers[a] if result_select == 0b010 else res
+        registers[b] = res
+        return output, status
 
     def __str__(self):
         table = [
             ["r00", "r01", "r02", "r03", "r04", "r05", "r06", "r07", "r08", "r09", "r10", "r11", "r12", "r13", "r14", "r15"],
-            ["0" if r == 0 else "{}\n0x{:04X}".format(r, r) for r in  self._registers]
+            ["0" if r == 0 else "{}\n0x{:04X}".format(r, r) for r in  self._state.registers]
         ]
-        return "------------ ALU status ------------\nRegisters\n" + tabulate(table, headers="firstrow", tablefmt="grid") + "\nQ register: {:04X} ({})\n".format(self._q_reg, self._q_reg)
\ No newline at end of file
+        return "------------ ALU status ------------\nRegisters\n" + grid(table) + "\nQ register: {:04X} ({})\n".format(self._state.q, self._state.q)
\ No newline at end of file
@@ -1,5 +1,10 @@
+import argparse
+import os
 import re
-from typing import List, Tuple, Dict
+from array import array
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from ObjectFile import OBJECT_CACHE_DIRECTORY, OBJECT_SUFFIX, ObjectFile, source_digest, write_object
 
 '''
 Supported instructions:
@@ -23,120 +28,319 @@ JLE <r_b>           Opcode 0x10
 JLE const           Opcode 0x11
 WTF                 Opcode 0x12
 UPP <r_a> <r_b>     Opcode 0x13
+
+A line may start with a label (`loop:`), which can be used wherever a constant is expected, also as a memory value.
+Everything after `;` is a comment. The lines after `memory:` are `address:value` pairs.
 '''
 
-def is_register(s: str) -> bool:
-    return s[0] == "r" and s[1:].isnumeric() and int(s[1:]) <= 15 and int(s[1:]) >= 0
+OPCODE_NAMES = {
+    0x01: "MOV_REG_REG", 0x02: "MOV_CONST_REG", 0x03: "MOV_MEM_REG", 0x04: "MOV_REG_MEM", 0x05: "ADD", 0x06: "SUB",
+    0x07: "CMP", 0x08: "XOR", 0x09: "TEST", 0x0A: "JMP_REG", 0x0B: "JMP_CONST", 0x0C: "JZ_REG", 0x0D: "JZ_CONST",
+    0x0E: "JL_REG", 0x0F: "JL_CONST", 0x10: "JLE_REG", 0x11: "JLE_CONST", 0x12: "WTF", 0x13: "UPP", 0xFF: "HALT"
+}
+
+# Optional label, mnemonic, up to 2 operands and a comment
+LINE = re.compile(r"\s*(?:([a-z_.][a-z0-9_.]*)\s*:)?\s*(?:([a-z]+)(?:\s+([^\s;]+))?(?:\s+([^\s;]+))?)?\s*(?:;.*)?")
+MEMORY_LINE = re.compile(r"\s*([^\s:;]+)\s*:\s*([^\s;]+)\s*(?:;.*)?")
+# The group which matched is the kind of the operand: 1 register, 2 memory request, 3 constant, 4 label
+OPERAND = re.compile(r"r([0-9]+)|\[r([0-9]+)\]|(0x[0-9a-f]+|0b[01]+|[0-9]+)|([a-z_.][a-z0-9_.]*)")
+REGISTER, MEMORY_REQUEST, CONSTANT, LABEL = 1, 2, 3, 4
+HALT_WORD = 0xFF << 8
+
+Operand = Union[int, str]
+
+
+class AssemblerError(Exception):
+    def __init__(self, line: int, message: str):
+        super().__init__("Assembler: line {}: {}".format(line, message))
+        self.line = line
+
+
+# Encoders write an instruction with its operands at its address
+Encoder = Callable[[array, int, int, Tuple[int, ...]], None]
+# Line number, address, opcode, encoder and operands of an instruction
+Instruction = Tuple[int, int, int, Encoder, Tuple[Operand, ...]]
+# Line number, address and value of a memory line
+MemoryLine = Tuple[int, Operand, Operand]
+
+def _encode_registers(words: array, address: int, opcode: int, operands: Tuple[int, ...]) -> None:
+    words[address] = opcode << 8 | operands[0] << 4 | operands[1]
+
+def _encode_register(words: array, address: int, opcode: int, operands: Tuple[int, ...]) -> None:
+    words[address] = opcode << 8 | operands[0]
+
+def _encode_constant_register(words: array, address: int, opcode: int, operands: Tuple[int, ...]) -> None:
+    words[address] = opcode << 8 | operands[1]
+    words[address + 1] = operands[0]
 
-def is_memory_request(s: str) -> bool:
-    return s[0] == "[" and s[-1] == "]" and is_register(s[1:-1])
+def _encode_constant(words: array, address: int, opcode: int, operands: Tuple[int, ...]) -> None:
+    words[address] = opcode << 8
+    words[address + 1] = operands[0]
+
+def _encode_none(words: array, address: int, opcode: int, operands: Tuple[int, ...]) -> None:
+    words[address] = opcode << 8
+
+
+R, M, C = REGISTER, MEMORY_REQUEST, CONSTANT
+# Mnemonic -> operand kinds (labels count as constants) -> opcode, size in words and encoder
+INSTRUCTIONS: Dict[str, Dict[Tuple[int, ...], Tuple[int, int, Encoder]]] = {
+    "mov": {(R, R): (0x01, 1, _encode_registers), (C, R): (0x02, 2, _encode_constant_register),
+            (M, R): (0x03, 1, _encode_registers), (R, M): (0x04, 1, _encode_registers)},
+    "add": {(R, R): (0x05, 1, _encode_registers)},
+    "sub": {(R, R): (0x06, 1, _encode_registers)},
+    "cmp": {(R, R): (0x07, 1, _encode_registers)},
+    "xor": {(R, R): (0x08, 1, _encode_registers)},
+    "test": {(R, R): (0x09, 1, _encode_registers)},
+    "jmp": {(R,): (0x0A, 1, _encode_register), (C,): (0x0B, 2, _encode_constant)},
+    "jz": {(R,): (0x0C, 1, _encode_register), (C,): (0x0D, 2, _encode_constant)},
+    "jl": {(R,): (0x0E, 1, _encode_register), (C,): (0x0F, 2, _encode_constant)},
+    "jle": {(R,): (0x10, 1, _encode_register), (C,): (0x11, 2, _encode_constant)},
+    "wtf": {(): (0x12, 1, _encode_none)},
+    "upp": {(R, R): (0x13, 1, _encode_registers)},
+}
 
-def is_constant(s: str) -> bool:
-    if s.isnumeric():
-        return int(s) < 2**16
-    if s.startswith("0x"):
-        return int(s[2:], 16) < 2**16
-    if s.startswith("0b") and s[2:].isnumeric():
-        return int(s[2:], 2) < 2**16
-    return False
 
 class Assembler:
+    '''
+    Two passes: the first one tokenizes every line with a single regular expression, picks the encoder by the
+    mnemonic and the operand kinds and assigns the addresses of the labels, the second one encodes the instructions
+    into a preallocated array with the labels resolved.
+    '''
+    @staticmethod
+    def assemble_string(program: str) -> Tuple[array, Dict[int, int]]:
+        labels, instructions, memory_lines, size, _ = Assembler._parse(program)
+        return Assembler._encode(labels, instructions, memory_lines, size)
+
     @staticmethod
-    def assemble_string(program: str) -> Tuple[List[int], Dict[int, int]]:
-        instructions = []
-        memory = {}
-        loadingMemory = False
-        for l in program.split("\n"):
-            line = re.sub(r'[ ]+', " ", re.sub(r'\s', ' ', l)).strip().lower()
-            if line == "":
+    def _parse(program: str, first_line: int = 1) -> Tuple[Dict[str, int], List[Instruction], List[MemoryLine], int, Optional[int]]:
+        '''The first pass: labels, instructions, memory lines, size in words and the line of `memory:`.'''
+        labels: Dict[str, int] = {}
+        instructions: List[Instruction] = []
+        memory_lines: List[MemoryLine] = []
+        # Kind and value of every operand seen so far, generated programs repeat the same few a lot
+        known_operands: Dict[str, Tuple[int, Operand]] = {}
+        address = 0
+        memory_start = None
+        loading_memory = False
+        for number, line in enumerate(program.lower().split("\n"), first_line):
+            if loading_memory:
+                stripped = line.strip()
+                if not stripped or stripped[0] == ";":
+                    continue
+                match = MEMORY_LINE.fullmatch(line)
+                if match is None:
+                    raise AssemblerError(number, "invalid memory request: {}".format(line.strip()))
+                memory_lines.append((number, Assembler._parse_constant(number, match.group(1)), Assembler._parse_constant(number, match.group(2))))
                 continue
-            if line == "memory:":
-                loadingMemory = True
+
+            match = LINE.fullmatch(line)
+            if match is None:
+                raise AssemblerError(number, "invalid syntax: {}".format(line.strip()))
+            label, mnemonic, first, second = match.groups()
+            if label is not None:
+                if label == "memory" and mnemonic is None:
+                    loading_memory = True
+                    memory_start = number
+                    continue
+                if label in labels:
+                    raise AssemblerError(number, "label {} is already defined".format(label))
+                if label == "memory" or OPERAND.fullmatch(label).lastindex != LABEL:
+                    raise AssemblerError(number, "{} can not be a label".format(label))
+                labels[label] = address
+            if mnemonic is None:
                 continue
-            if loadingMemory:
-                data = line.split(":")
-                assert len(data) == 2 and is_constant(data[0]) and is_constant(data[1]), "Invalid memory request: {}".format(line)
-                memory[Assembler._parse_constant(data[0])] = Assembler._parse_constant(data[1])
+
+            forms = INSTRUCTIONS.get(mnemonic)
+            if forms is None:
+                raise AssemblerError(number, "unknown instruction {}".format(mnemonic))
+            if first is None:
+                kinds, operands = (), ()
             else:
-                instructions += Assembler._parse_instruction(line)
-        instructions += [Assembler._build_instruction(0b11111111, 0, 0)]
-        return instructions, memory
+                parsed = known_operands.get(first)
+                if parsed is None:
+                    parsed = known_operands[first] = Assembler._parse_operand(number, first)
+                if second is None:
+                    kinds, operands = (parsed[0],), (parsed[1],)
+                else:
+                    second_parsed = known_operands.get(second)
+                    if second_parsed is None:
+                        second_parsed = known_operands[second] = Assembler._parse_operand(number, second)
+                    kinds, operands = (parsed[0], second_parsed[0]), (parsed[1], second_parsed[1])
+            form = forms.get(kinds)
+            if form is None:
+                raise AssemblerError(number, "invalid operands for {}: {}".format(mnemonic, line.strip()))
+            opcode, size, encoder = form
+            instructions.append((number, address, opcode, encoder, operands))
+            address += size
+            if address >= 1 << 16:
+                raise AssemblerError(number, "program does not fit into the memory")
+        return labels, instructions, memory_lines, address, memory_start
 
     @staticmethod
-    def _parse_instruction(line: str) -> List[int]:
-        operands = line.split(" ")
-        if operands[0] == "mov":
-            assert len(operands) == 3 and ((is_register(operands[1]) and is_register(operands[2])) or (is_constant(operands[1]) and is_register(operands[2])) or (is_memory_request(operands[1]) and is_register(operands[2])) or (is_register(operands[1]) and is_memory_request(operands[2]))), "Invalid instruction: {}".format(line)
-            if is_register(operands[1]) and is_register(operands[2]):
-                return [Assembler._build_instruction(1, int(operands[1][1:]), int(operands[2][1:]))]
-            elif is_constant(operands[1]) and is_register(operands[2]):
-                return [Assembler._build_instruction(2, 0, int(operands[2][1:])), Assembler._parse_constant(operands[1])]
-            elif is_memory_request(operands[1]) and is_register(operands[2]):
-                return [Assembler._build_instruction(3, int(operands[1][2:-1]), int(operands[2][1:]))]
-            elif is_register(operands[1]) and is_memory_request(operands[2]):
-                return [Assembler._build_instruction(4, int(operands[1][1:]), int(operands[2][2:-1]))]
-        if operands[0] == "add":
-            assert len(operands) == 3 and is_register(operands[1]) and is_register(operands[2]), "Invalid instruction: {}".format(line)
-            return [Assembler._build_instruction(5, int(operands[1][1:]), int(operands[2][1:]))]
-        if operands[0] == "sub":
-            assert len(operands) == 3 and is_register(operands[1]) and is_register(operands[2]), "Invalid instruction: {}".format(line)
-            return [Assembler._build_instruction(6, int(operands[1][1:]), int(operands[2][1:]))]
-        if operands[0] == "cmp":
-            assert len(operands) == 3 and is_register(operands[1]) and is_register(operands[2]), "Invalid instruction: {}".format(line)
-            return [Assembler._build_instruction(7, int(operands[1][1:]), int(operands[2][1:]))]
-        if operands[0] == "xor":
-            assert len(operands) == 3 and is_register(operands[1]) and is_register(operands[2]), "Invalid instruction: {}".format(line)
-            return [Assembler._build_instruction(8, int(operands[1][1:]), int(operands[2][1:]))]
-        if operands[0] == "test":
-            assert len(operands) == 3 and is_register(operands[1]) and is_register(operands[2]), "Invalid instruction: {}".format(line)
-            return [Assembler._build_instruction(9, int(operands[1][1:]), int(operands[2][1:]))]
-        if operands[0] == "jmp":
-            assert len(operands) == 2 and is_register(operands[1]) or is_constant(operands[1]), "Invalid instruction: {}".format(line)
-            if is_register(operands[1]):
-                return [Assembler._build_instruction(10, 0, int(operands[1][1:]))]
-            else:
-                return [Assembler._build_instruction(11, 0, 0), Assembler._parse_constant(operands[1])]
-        if operands[0] == "jz":
-            assert len(operands) == 2 and is_register(operands[1]) or is_constant(operands[1]), "Invalid instruction: {}".format(line)
-            if is_register(operands[1]):
-                return [Assembler._build_instruction(12, 0, int(operands[1][1:]))]
-            else:
-                return [Assembler._build_instruction(13, 0, 0), Assembler._parse_constant(operands[1])]
-        if operands[0] == "jl":
-            assert len(operands) == 2 and is_register(operands[1]) or is_constant(operands[1]), "Invalid instruction: {}".format(line)
-            if is_register(operands[1]):
-                return [Assembler._build_instruction(14, 0, int(operands[1][1:]))]
-            else:
-                return [Assembler._build_instruction(15, 0, 0), Assembler._parse_constant(operands[1])]
-        if operands[0] == "jle":
-            assert len(operands) == 2 and is_register(operands[1]) or is_constant(operands[1]), "Invalid instruction: {}".format(line)
-            if is_register(operands[1]):
-                return [Assembler._build_instruction(16, 0, int(operands[1][1:]))]
-            else:
-                return [Assembler._build_instruction(17, 0, 0), Assembler._parse_constant(operands[1])]
-        if operands[0] == "wtf":
-            assert len(operands) == 1, "Invalid instruction: {}".format(line)
-            return [Assembler._build_instruction(18, 0, 0)]
-        if operands[0] == "upp":
-            assert len(operands) == 3 and is_register(operands[1]) and is_register(operands[2]), "Invalid instruction: {}".format(line)
-            return [Assembler._build_instruction(19, int(operands[1][1:]), int(operands[2][1:]))]
+    def _encode(labels: Dict[str, int], instructions: List[Instruction], memory_lines: List[MemoryLine],
+                size: int) -> Tuple[array, Dict[int, int]]:
+        '''The second pass: the program words with the halt word after them and the memory.'''
+        words = array("H", bytes(2 * (size + 1)))
+        for number, address, opcode, encoder, operands in instructions:
+            # Only the constant, always the first operand, can be a label
+            if operands and type(operands[0]) is str:
+                operands = (Assembler._resolve(number, operands[0], labels),) + operands[1:]
+            encoder(words, address, opcode, operands)
+        words[-1] = HALT_WORD
+        memory = {Assembler._resolve(number, address, labels): Assembler._resolve(number, value, labels)
+                  for number, address, value in memory_lines}
+        return words, memory
+
+    @staticmethod
+    def _parse_operand(number: int, operand: str) -> Tuple[int, Operand]:
+        match = OPERAND.fullmatch(operand)
+        if match is None:
+            raise AssemblerError(number, "invalid operand {}".format(operand))
+        kind = match.lastindex
+        if kind == REGISTER or kind == MEMORY_REQUEST:
+            register = int(match.group(kind))
+            if register > 15:
+                raise AssemblerError(number, "invalid register {}".format(operand))
+            return kind, register
+        return CONSTANT, Assembler._parse_constant(number, operand, match)
 
     @staticmethod
-    def _build_instruction(opcode: int, reg_a: int, reg_b: int) -> int:
-        return opcode << 8 | reg_a << 4 | reg_b
-    
+    def _parse_constant(number: int, s: str, match=None) -> Operand:
+        '''The value of a constant, or the name of a label to resolve in the second pass.'''
+        if s.isascii() and s.isdigit():
+            value = int(s)
+        else:
+            if match is None:
+                match = OPERAND.fullmatch(s)
+            if match is None or match.lastindex not in (CONSTANT, LABEL):
+                raise AssemblerError(number, "invalid constant {}".format(s))
+            if match.lastindex == LABEL:
+                return s
+            value = int(s[2:], 16 if s[1] == "x" else 2)
+        if value >= 1 << 16:
+            raise AssemblerError(number, "constant {} does not fit into 16 bits".format(s))
+        return value
+
     @staticmethod
-    def _parse_constant(s: str) -> int:
-        if s.isnumeric():
-            return int(s)
-        if s.startswith("0x"):
-            return int(s[2:], 16)
-        if s.startswith("0b") and s[2:].isnumeric():
-            return int(s[2:], 2)
-        return 0
-
-    
+    def _resolve(number: int, value: Operand, labels: Dict[str, int]) -> int:
+        if type(value) is int:
+            return value
+        address = labels.get(value)
+        if address is None:
+            raise AssemblerError(number, "undefined label {}".format(value))
+        return address
+
     @staticmethod
-    def assemble(file: str) -> Tuple[List[int], Dict[int, int]]:
+    def assemble(file: str) -> Tuple[array, Dict[int, int]]:
         with open(file, "r") as f:
             return Assembler.assemble_string(f.read())
+
+    @staticmethod
+    def write_object(file: str, output: str):
+        with open(file, "rb") as f:
+            source = f.read()
+        program, memory = Assembler.assemble_string(source.decode())
+        write_object(output, program, memory, source_digest(source))
+
+    @staticmethod
+    def assemble_object(file: str, cache_directory: str = OBJECT_CACHE_DIRECTORY) -> ObjectFile:
+        '''The mapped object of a program, kept in the cache by the hash of its source so unchanged programs skip assembly.'''
+        with open(file, "rb") as f:
+            source = f.read()
+        digest = source_digest(source)
+        path = os.path.join(cache_directory, digest.hex() + OBJECT_SUFFIX)
+        if os.path.exists(path):
+            try:
+                return ObjectFile(path)
+            except Exception:
+                # Objects of an older format or damaged ones are assembled again
+                pass
+        program, memory = Assembler.assemble_string(source.decode())
+        write_object(path, program, memory, digest)
+        return ObjectFile(path)
+
+
+class IncrementalAssembler:
+    '''
+    Assembles a program and keeps the result of the first pass, so a new version of the source is assembled only
+    where it differs. The changed lines are parsed alone and encoded in place as long as the program keeps its
+    lines, every changed line keeps its size and its label and the memory section stays the same. Anything else
+    assembles the whole program again.
+    '''
+    def __init__(self, source: str):
+        self._assemble(source)
+
+    def _assemble(self, source: str):
+        labels, instructions, memory_lines, size, memory_start = Assembler._parse(source)
+        self.program, self.memory = Assembler._encode(labels, instructions, memory_lines, size)
+        self._lines = source.lower().split("\n")
+        self._labels = labels
+        self._instructions = {instruction[0]: instruction for instruction in instructions}
+        self._memory_start = memory_start
+
+    def update(self, source: str) -> Dict[int, Optional[int]]:
+        '''
+        Assembles the new version of the source. Returns the words which changed in the memory once it is loaded,
+        with the program over the memory, as loaded_changes does. On an error the previous version stays.
+        '''
+        lines = source.lower().split("\n")
+        patches = self._patches(lines) if len(lines) == len(self._lines) else None
+        if patches is None:
+            program, memory = self.program, self.memory
+            self._assemble(source)
+            return loaded_changes(program, memory, self.program, self.memory)
+        changes = {}
+        for number, address, opcode, encoder, operands in patches:
+            self._instructions[number] = (number, address, opcode, encoder, operands)
+            previous = self.program[address:address + 2]
+            encoder(self.program, address, opcode, operands)
+            changes.update((address + offset, self.program[address + offset]) for offset, word in enumerate(previous)
+                           if self.program[address + offset] != word)
+        self._lines = lines
+        return changes
+
+    def _patches(self, lines: List[str]) -> Optional[List[Instruction]]:
+        '''The instructions of the changed lines resolved at their addresses, None when they can not be patched in place.'''
+        patches = []
+        for number, (old, new) in enumerate(zip(self._lines, lines), 1):
+            if old == new:
+                continue
+            if self._memory_start is not None and number >= self._memory_start:
+                return None
+            old_labels, _, _, old_size, _ = Assembler._parse(old, number)
+            labels, instructions, _, size, memory_start = Assembler._parse(new, number)
+            if memory_start is not None or labels.keys() != old_labels.keys() or size != old_size:
+                return None
+            if not instructions:
+                continue
+            _, _, opcode, encoder, operands = instructions[0]
+            if operands and type(operands[0]) is str:
+                operands = (Assembler._resolve(number, operands[0], self._labels),) + operands[1:]
+            patches.append((number, self._instructions[number][1], opcode, encoder, operands))
+        return patches
+
+
+def loaded_changes(old_program: Sequence[int], old_memory: Dict[int, int], program: Sequence[int],
+                   memory: Dict[int, int]) -> Dict[int, Optional[int]]:
+    '''
+    The words which differ between two programs loaded over their memory, with their new values. A word the new
+    program no longer loads is None.
+    '''
+    def word(words: Sequence[int], values: Dict[int, int], address: int) -> Optional[int]:
+        return words[address] if address < len(words) else values.get(address)
+    addresses = set(range(max(len(old_program), len(program)))) | old_memory.keys() | memory.keys()
+    return {address: word(program, memory, address) for address in addresses
+            if word(old_program, old_memory, address) != word(program, memory, address)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Assemble a program into an object file")
+    parser.add_argument("program", help=".prd file")
+    parser.add_argument("-o", "--output", default=None, help="object file (default: the program with the {} suffix)".format(OBJECT_SUFFIX))
+    args = parser.parse_args()
+
+    try:
+        Assembler.write_object(args.program, args.output or os.path.splitext(args.program)[0] + OBJECT_SUFFIX)
+    except AssemblerError as e:
+        print(e)
+        exit(1)
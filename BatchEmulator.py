@@ -0,0 +1,262 @@
+from typing import Dict, List, Optional, Tuple
+from ControlUnit import STACK_SIZE
+from Memory import MEMORY_SIZE
+from MIInstruction import DecodedMicroInstruction, decode_micro_program
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+ALU_OPERATIONS = [
+    lambda R, S, c_n: R + S + c_n,          # ADD
+    lambda R, S, c_n: S - R - c_n,          # SUBR
+    lambda R, S, c_n: R - S - c_n,          # SUBS
+    lambda R, S, c_n: R | S,                # OR
+    lambda R, S, c_n: R & S,                # AND
+    lambda R, S, c_n: (R ^ 0xFFFF) & S,     # NOTRS
+    lambda R, S, c_n: R ^ S,                # EXOR
+    lambda R, S, c_n: (R ^ S) ^ 0xFFFF,     # EXNOR
+]
+
+SSCU_TESTS = {
+    0b000100: lambda C, Z: Z ^ 1,
+    0b000101: lambda C, Z: Z,
+    0b001010: lambda C, Z: C,
+    0b001011: lambda C, Z: C ^ 1,
+    0b001100: lambda C, Z: (C ^ 1) & (Z ^ 1),
+    0b001101: lambda C, Z: C | Z,
+}
+
+
+class BatchEmulator:
+    '''
+    Runs many machines with the same microcode in lockstep. The state of every lane lives in NumPy arrays and each
+    step applies one microinstruction to all active lanes, lanes sitting on the same micro address are evaluated
+    together. Lanes retire when they reach the halt microinstruction or when their microinstruction fails, the
+    results match Emulator.run and Emulator.get_status of the corresponding single machine. Every lane has a memory
+    of its own, 128 KB of words and 8 KB of present bits, so a thousand lanes take about 136 MB and the lane count
+    is bounded by the RAM rather than by the speed.
+    '''
+    def __init__(self, micro_macro_mapping_PROM: Dict[int, int], micro_program_memory: Dict[int, int], lanes: int):
+        if np is None:
+            raise Exception("BatchEmulator: numpy is required")
+        self._micro_macro_mapping_PROM = micro_macro_mapping_PROM
+        self._decoded_micro_program: Dict[int, DecodedMicroInstruction] = decode_micro_program(micro_program_memory)
+        self._lanes = lanes
+
+        self._registers = np.zeros((lanes, 16), np.int64)
+        self._q_reg = np.zeros(lanes, np.int64)
+        self._micro_status = np.zeros(lanes, np.int64)
+        self._macro_status = np.zeros(lanes, np.int64)
+        self._instruction_counter = np.zeros(lanes, np.int64)
+        self._instruction_register = np.zeros(lanes, np.int64)
+        self._data_BUS = np.zeros(lanes, np.int64)
+        self._address_BUS = np.zeros(lanes, np.int64)
+        self._mic = np.zeros(lanes, np.int64)
+        self._stack = np.zeros((lanes, STACK_SIZE), np.int64)
+        self._stack_size = np.zeros(lanes, np.int64)
+        self._memory = np.zeros((lanes, MEMORY_SIZE), np.uint16)
+        self._present = np.zeros((lanes, MEMORY_SIZE // 8), np.uint8)
+
+        self._active = np.ones(lanes, bool)
+        self._ticks = np.zeros(lanes, np.int64)
+        self._finished = np.zeros(lanes, bool)
+        self._errors: List[Optional[str]] = [None] * lanes
+
+        # -1 marks opcodes missing in the PROM, opcode 0 maps to micro address 0
+        self._prom_table = np.full(256, -1, np.int64)
+        for opcode, address in micro_macro_mapping_PROM.items():
+            if 0 <= opcode <= 0xFF:
+                self._prom_table[opcode] = address
+        self._prom_table[0] = 0
+
+    def init_memory(self, lane: int, memory: Dict[int, int]):
+        self._memory[lane] = 0
+        self._present[lane] = 0
+        if memory:
+            addresses = np.fromiter(memory.keys(), np.int64) & 0xFFFF
+            self._memory[lane, addresses] = np.fromiter(memory.values(), np.int64) & 0xFFFF
+            self._mark_present(np.full(len(addresses), lane), addresses)
+
+    def insert_program(self, lane: int, program: List[int]):
+        self._memory[lane, :len(program)] = np.asarray(program, np.int64) & 0xFFFF
+        self._mark_present(np.full(len(program), lane), np.arange(len(program)))
+
+    def init_registers(self, lane: int, registers: List[int]):
+        self._registers[lane] = registers
+
+    def init_status_register(self, lane: int, status_register: int):
+        self._macro_status[lane] = status_register
+
+    def get_status(self, lane: int):
+        chunks = np.flatnonzero(self._present[lane])
+        bits = np.unpackbits(self._present[lane, chunks][:, None], axis=1, bitorder="little").astype(bool)
+        present = (chunks[:, None] * 8 + np.arange(8))[bits]
+        return {
+            "memory": dict(zip(present.tolist(), self._memory[lane, present].tolist())),
+            "instruction_counter": int(self._instruction_counter[lane]),
+            "instruction_register": int(self._instruction_register[lane]),
+            "data_bus": int(self._data_BUS[lane]),
+            "address_bus": int(self._address_BUS[lane]),
+            "cu_stack": self._stack[lane, :self._stack_size[lane]].tolist(),
+            "micro_status_register": int(self._micro_status[lane]),
+            "macro_status_register": int(self._macro_status[lane]),
+            "q_register": int(self._q_reg[lane]),
+            "registers": self._registers[lane].tolist()
+        }
+
+    def get_error(self, lane: int) -> Optional[str]:
+        return self._errors[lane]
+
+    def run(self, instructions_limit: int = 1000000) -> List[Tuple[Optional[dict], int]]:
+        for tick in range(instructions_limit):
+            lanes = np.flatnonzero(self._active)
+            if len(lanes) == 0:
+                break
+            self._ticks[lanes] = tick
+            mics = self._mic[lanes]
+            order = np.argsort(mics, kind="stable")
+            addresses, starts = np.unique(mics[order], return_index=True)
+            for address, group in zip(addresses.tolist(), np.split(lanes[order], starts[1:])):
+                mi = self._decoded_micro_program.get(address)
+                if mi is None:
+                    self._fail(group, "KeyError({})".format(address))
+                elif mi.halt:
+                    self._active[group] = False
+                    self._finished[group] = True
+                else:
+                    self._execute(address, mi, group)
+        else:
+            self._ticks[self._active] = instructions_limit
+        return [(self.get_status(lane) if self._finished[lane] else None, int(self._ticks[lane])) for lane in range(self._lanes)]
+
+    def _execute(self, address: int, mi: DecodedMicroInstruction, lanes):
+        # IC
+        if mi.ic_error:
+            return self._fail(lanes, "More than 1 instruction counter control bits were set to 1")
+        if mi.ic == 0b0001:
+            self._address_BUS[lanes] = self._instruction_counter[lanes]
+        elif mi.ic == 0b0010:
+            self._instruction_counter[lanes] = (self._instruction_counter[lanes] + 1) & 0xFFFF
+        elif mi.ic == 0b0100:
+            self._data_BUS[lanes] = self._instruction_counter[lanes]
+
+        # ALU
+        data_select = mi.alu_instruction & 0b111
+        opcode = (mi.alu_instruction >> 3) & 0b111
+        result_select = mi.alu_instruction >> 6
+        if result_select > 0b011:
+            return self._fail(lanes, "ALU: unsupported result select")
+        size = len(lanes)
+        zero = np.zeros(size, np.int64)
+        status = zero
+        if result_select != 0b000 or mi.y_mux or mi.srM or mi.srm:
+            a = mi.ra_addr if mi.a_mux else (self._instruction_register[lanes] >> 4) & 0b1111
+            b = mi.rb_addr if mi.b_mux else self._instruction_register[lanes] & 0b1111
+            d = np.full(size, mi.constant, np.int64) if mi.k_mux else self._data_BUS[lanes]
+            R = self._registers[lanes, a] if data_select <= 0b001 else zero if data_select <= 0b100 else d
+            S = self._q_reg[lanes] if data_select in (0b000, 0b010, 0b110) else self._registers[lanes, b] if data_select in (0b001, 0b011) \
+                else self._registers[lanes, a] if data_select in (0b100, 0b101) else zero
+            c_n = (self._micro_status[lanes] & 0b0100) >> 2 if opcode <= 0b010 else 0
+            res = ALU_OPERATIONS[opcode](R, S, c_n)
+            if mi.srM or mi.srm:
+                status = np.where((res > 0xFFFF) | (res < 0), 0b1100, 0) | np.where(res < 0, 0b0010, 0)
+                res = res & 0xFFFF
+                status |= res == 0
+            else:
+                res = res & 0xFFFF
+            output = self._registers[lanes, a] if result_select == 0b010 else res
+            if result_select == 0b001:
+                self._q_reg[lanes] = res
+            elif result_select != 0b000:
+                self._registers[lanes, b] = res
+            if mi.y_mux & 0b01:
+                self._address_BUS[lanes] = output
+            if mi.y_mux & 0b10:
+                self._data_BUS[lanes] = output
+
+        if mi.ic == 0b1000:
+            self._instruction_counter[lanes] = self._data_BUS[lanes]
+        # IR
+        if mi.ir:
+            self._instruction_register[lanes] = self._data_BUS[lanes]
+
+        # SSCU
+        sscu_opcode = mi.sscu_instruction & 0b111111
+        select = (mi.sscu_instruction >> 10) & 0b11
+        if select == 0b11:
+            return self._fail(lanes, "SSCUnit: select can not be 0b11")
+        test = zero
+        if select != 0b00 and mi.ccen == 1 and mi.controller_instruction in (0b0001, 0b0011, 0b1010, 0b1011):
+            source = self._micro_status[lanes] if select == 0b10 else self._macro_status[lanes]
+            if sscu_opcode in SSCU_TESTS:
+                test = SSCU_TESTS[sscu_opcode]((source & 0b0100) >> 2, source & 0b0001)
+        if mi.srM:
+            self._macro_status[lanes] = status
+        if mi.srm:
+            self._micro_status[lanes] = status
+
+        # Controller, the PROM check only has to be repeated when the instruction register changes
+        target = zero
+        if mi.ir or mi.controller_instruction == 0b0010:
+            opcode = (self._instruction_register[lanes] >> 8) & 0b11111111
+            target = self._prom_table[opcode]
+            missing = target < 0
+            if missing.any():
+                for lane, lane_opcode in zip(lanes[missing].tolist(), opcode[missing].tolist()):
+                    self._fail(np.array([lane]), f"Opcode {lane_opcode} is not present in PROM")
+                lanes, target, test = lanes[~missing], target[~missing], test[~missing]
+        lanes = self._control(address, mi, lanes, test, target)
+
+        # Memory
+        memory_address = self._address_BUS[lanes] & 0xFFFF
+        if mi.mwe:
+            self._memory[lanes, memory_address] = self._data_BUS[lanes] & 0xFFFF
+            self._mark_present(lanes, memory_address)
+        else:
+            self._data_BUS[lanes] = self._memory[lanes, memory_address]
+
+    def _control(self, address: int, mi: DecodedMicroInstruction, lanes, test, target):
+        instruction = mi.controller_instruction
+        following = np.full(len(lanes), address + 1, np.int64)
+        jump = ~((mi.ccen == 1) & (test == 0))
+        if instruction == 0b0000: # JZ
+            self._stack_size[lanes] = 0
+            self._mic[lanes] = 0
+        elif instruction == 0b0010: # JMAP
+            self._mic[lanes] = target
+        elif instruction == 0b1110: # CONT
+            self._mic[lanes] = following
+        elif instruction == 0b0011: # CJP
+            self._mic[lanes] = np.where(jump, mi.bar, following)
+        elif instruction in (0b0001, 0b0100): # CJS, PUSH
+            push = jump if instruction == 0b0001 else np.ones(len(lanes), bool)
+            overflow = push & (self._stack_size[lanes] == STACK_SIZE)
+            self._fail(lanes[overflow], "ControlUnit: stack overflow")
+            lanes, push, following = lanes[~overflow], push[~overflow], following[~overflow]
+            pushing = lanes[push]
+            self._stack[pushing, self._stack_size[pushing]] = address + 1 if instruction == 0b0001 else mi.bar
+            self._stack_size[pushing] += 1
+            self._mic[lanes] = np.where(push, mi.bar, following) if instruction == 0b0001 else following
+        elif instruction in (0b1010, 0b1011): # CRTN, CJPP
+            underflow = jump & (self._stack_size[lanes] == 0)
+            self._fail(lanes[underflow], "ControlUnit: stack underflow")
+            lanes, jump, following = lanes[~underflow], jump[~underflow], following[~underflow]
+            popping = lanes[jump]
+            self._stack_size[popping] -= 1
+            popped = self._stack[popping, self._stack_size[popping]]
+            self._mic[lanes] = following
+            self._mic[popping] = popped if instruction == 0b1010 else mi.bar
+        else:
+            self._fail(lanes, "ControlUnit: invalid instruction 0b" + format(instruction, "04b"))
+            return lanes[:0]
+        return lanes
+
+    def _fail(self, lanes, message: str):
+        for lane in lanes.tolist():
+            self._errors[lane] = message
+        self._active[lanes] = False
+
+    def _mark_present(self, lanes, addresses):
+        np.bitwise_or.at(self._present, (lanes, addresses >> 3), (1 << (addresses & 0b111)).astype(np.uint8))
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+import argparse
+import glob
+import hashlib
+import importlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional
+
+from Assembler import Assembler
+from Emulator import Emulator, EmulatorRunModes
+from MemoryImage import DIFF_SUFFIX
+
+CACHE_DIRECTORY = ".emulator_cache"
+
+
+def find_programs(pattern: str) -> List[str]:
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, "*.prd")
+    return sorted(path for path in glob.glob(pattern) if os.path.isfile(path))
+
+
+def load_microcode(module_name: str):
+    module = importlib.import_module(module_name)
+    return module.micro_macro_mapping_PROM, module.micro_program_memory
+
+
+def microcode_digest(micro_macro_mapping_PROM: Dict[int, int], micro_program_memory: Dict[int, int]) -> str:
+    digest = hashlib.sha256()
+    digest.update(repr(sorted(micro_program_memory.items())).encode())
+    digest.update(repr(sorted(micro_macro_mapping_PROM.items())).encode())
+    return digest.hexdigest()
+
+
+def result_key(source: str, microcode: str, instructions_limit: int, detect_loops: bool = False, memory_image: str = "") -> str:
+    return hashlib.sha256("{}\0{}\0{}\0{}\0{}".format(microcode, instructions_limit, detect_loops, memory_image, source).encode()).hexdigest()
+
+
+def image_digest(path: Optional[str]) -> str:
+    if path is None:
+        return ""
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def run_program(path: str, microcode_module: str, mode: str, instructions_limit: int, detect_loops: bool = False,
+                time_limit: Optional[float] = None, object_directory: Optional[str] = None, memory_image: Optional[str] = None,
+                dump_directory: Optional[str] = None) -> dict:
+    result = {"program": path, "status": None, "ticks": None, "stop_reason": None, "wall_time": None, "error": None}
+    start = time.perf_counter()
+    micro_macro_mapping_PROM, micro_program_memory = load_microcode(microcode_module)
+    emulator = Emulator(micro_macro_mapping_PROM=micro_macro_mapping_PROM, micro_program_memory=micro_program_memory)
+    try:
+        if object_directory is None:
+            program, memory = Assembler.assemble(path)
+            if memory_image is None:
+                emulator.init_memory(memory)
+            else:
+                emulator.init_memory_image(memory_image)
+                for address, value in memory.items():
+                    emulator.set_memory_value(address, value)
+            emulator.insert_program(program)
+        else:
+            with Assembler.assemble_object(path, object_directory) as object_file:
+                emulator.load_object(object_file, memory_image)
+    except Exception as e:
+        result["error"] = "Failed to assemble the program: {}".format(e)
+        return result
+    try:
+        result["status"], result["ticks"] = emulator.run(EmulatorRunModes[mode], instructions_limit, quiet=True,
+                                                         detect_loops=detect_loops, time_limit=time_limit)
+        result["stop_reason"] = emulator.get_stop_reason()
+    except Exception as e:
+        result["error"] = "{}: {}".format(type(e).__name__, e)
+    if dump_directory is not None and result["status"] is not None:
+        # The final memory goes to a diff against the initial image instead of into the result
+        result["memory_diff"] = os.path.join(dump_directory, os.path.splitext(os.path.basename(path))[0] + DIFF_SUFFIX)
+        os.makedirs(dump_directory, exist_ok=True)
+        emulator.dump_memory_diff(result["memory_diff"], memory_image)
+        del result["status"]["memory"]
+    result["wall_time"] = time.perf_counter() - start
+    return result
+
+
+class BatchRunner:
+    def __init__(self, microcode_module: str = "MicroProgram", mode: str = "TRANSLATED", instructions_limit: int = 1000000,
+                 workers: Optional[int] = None, cache_directory: Optional[str] = CACHE_DIRECTORY, detect_loops: bool = False,
+                 time_limit: Optional[float] = None, memory_image: Optional[str] = None, dump_directory: Optional[str] = None):
+        self._microcode_module = microcode_module
+        self._mode = mode
+        self._instructions_limit = instructions_limit
+        self._workers = workers
+        self._detect_loops = detect_loops
+        self._time_limit = time_limit
+        self._cache_directory = os.path.join(cache_directory, "results") if cache_directory else None
+        self._object_directory = os.path.join(cache_directory, "objects") if cache_directory else None
+        self._memory_image = memory_image
+        self._dump_directory = dump_directory
+        self._microcode_digest = microcode_digest(*load_microcode(microcode_module))
+        self._image_digest = image_digest(memory_image)
+
+    def run(self, paths: List[str]) -> Iterator[dict]:
+        '''
+        Yields one result per program as soon as it is available, programs with unchanged inputs come from the cache.
+        A cached result has no wall_time, as nothing was measured in this run.
+        '''
+        pending = {}
+        for path in paths:
+            with open(path, "r") as f:
+                key = result_key(f.read(), self._microcode_digest, self._instructions_limit, self._detect_loops, self._image_digest)
+            # The dumps are written by the runs, so no result comes from the cache while dumping
+            cached = self._load_cached(key) if self._dump_directory is None else None
+            if cached is not None:
+                cached["program"] = path
+                cached["wall_time"] = None
+                cached["cached"] = True
+                yield cached
+            else:
+                pending[path] = key
+        if not pending:
+            return
+
+        with ProcessPoolExecutor(max_workers=self._workers) as executor:
+            futures = {executor.submit(run_program, path, self._microcode_module, self._mode, self._instructions_limit, self._detect_loops,
+                                       self._time_limit, self._object_directory, self._memory_image, self._dump_directory): path
+                       for path in pending}
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {"program": path, "status": None, "ticks": None, "stop_reason": None, "wall_time": None,
+                              "error": "{}: {}".format(type(e).__name__, e)}
+                else:
+                    # Results are handed out in their JSON form so fresh and cached ones look the same
+                    result = json.loads(json.dumps(result))
+                    # A run cut by the wall clock depends on the machine load, it is not worth caching, neither are
+                    # runs whose memory went to a dump which may be gone by the next run
+                    if not (result["stop_reason"] or "").startswith("time limit") and "memory_diff" not in result:
+                        self._store_cached(pending[path], result)
+                result["cached"] = False
+                yield result
+
+    def _load_cached(self, key: str) -> Optional[dict]:
+        if self._cache_directory is None:
+            return None
+        try:
+            with open(os.path.join(self._cache_directory, key + ".json"), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _store_cached(self, key: str, result: dict):
+        if self._cache_directory is None:
+            return
+        os.makedirs(self._cache_directory, exist_ok=True)
+        path = os.path.join(self._cache_directory, key + ".json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(result, f)
+        os.replace(path + ".tmp", path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Assemble and emulate every program of a directory or a glob in parallel")
+    parser.add_argument("programs", help="directory with .prd files or a glob pattern")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="number of worker processes (default: CPU count)")
+    parser.add_argument("-m", "--microcode", default="MicroProgram", help="module with micro_program_memory and micro_macro_mapping_PROM")
+    parser.add_argument("--mode", default="TRANSLATED", choices=[mode.name for mode in EmulatorRunModes if mode.name not in ("DEBUG", "FULL_DEBUG")])
+    parser.add_argument("--limit", type=int, default=1000000, help="instructions limit of every run")
+    parser.add_argument("--detect-loops", action="store_true", help="stop runs as soon as their state repeats")
+    parser.add_argument("--time-limit", type=float, default=None, help="wall clock budget of every run in seconds")
+    parser.add_argument("--no-cache", action="store_true", help="neither read nor store cached results and objects")
+    parser.add_argument("--memory-image", default=None, help="raw image the memory of every run starts from")
+    parser.add_argument("--dump-memory", default=None, metavar="DIRECTORY", help="write the final memory of every run as a diff against the initial one")
+    args = parser.parse_args()
+
+    runner = BatchRunner(args.microcode, args.mode, args.limit, args.workers, None if args.no_cache else CACHE_DIRECTORY,
+                         args.detect_loops, args.time_limit, args.memory_image, args.dump_memory)
+    for result in runner.run(find_programs(args.programs)):
+        print(json.dumps(result), flush=True)
@@ -1,63 +1,82 @@
-STACK_SIZE = 5
+from typing import Optional
+
+from MachineState import STACK_SIZE, MachineState
 
 
 class ControlUnit:
-    def __init__(self):
-        self._stack = []
-        self._mic = 0
+    def __init__(self, state: Optional[MachineState] = None):
+        # The mic and the return stack live in the state shared with the other units
+        self._state = state if state is not None else MachineState()
+        # Action of every instruction, it gets the condition (ccen == 1 and cc == 0), bar and d and returns the next mic
+        self._actions = {
+            0b0000: self._jz,
+            0b0001: self._cjs,
+            0b0010: self._jmap,
+            0b0011: self._cjp,
+            0b0100: self._push,
+            0b1010: self._crtn,
+            0b1011: self._cjpp,
+            0b1110: self._cont,
+        }
 
     def get_mic(self):
-        return self._mic
+        return self._state.mic
 
     def run(self, instruction: int, bar: int, ccen: int, cc: int, d: int):
-        res = -1
-        cond = ccen == 1 and cc == 0
-        if instruction == 0b0000: # JZ
-            self._stack = []
-            res = 0
-        if instruction == 0b0001: # CJS
-            if cond:
-                res = self._mic + 1
-            else:
-                if len(self._stack) == STACK_SIZE:
-                    raise Exception("ControlUnit: stack overflow")
-                self._stack.append(self._mic + 1)
-                res = bar
-        if instruction == 0b0010: # JMAP
-            res = d
-        if instruction == 0b0011: # CJP
-            if cond:
-                res = self._mic + 1
-            else:
-                res = bar
-        if instruction == 0b0100: # PUSH
-            if len(self._stack) == STACK_SIZE:
-                raise Exception("ControlUnit: stack overflow")
-            self._stack.append(bar)
-            res = self._mic + 1
-        if instruction == 0b1010: # CRTN
-            if cond:
-                res = self._mic + 1
-            else:
-                if len(self._stack) == 0:
-                    raise Exception("ControlUnit: stack underflow")
-                res = self._stack.pop()
-        if instruction == 0b1011: # CJPP
-            if cond:
-                res = self._mic + 1
-            else:
-                if len(self._stack) == 0:
-                    raise Exception("ControlUnit: stack underflow")
-                self._stack.pop()
-                res = bar
-        if instruction == 0b1110: # CONT
-            res = self._mic + 1
-
-        if res < 0:
+        action = self._actions.get(instruction)
+        if action is None:
             raise Exception("ControlUnit: invalid instruction 0b" + format(instruction, "04b"))
-        
-        self._mic = res
-        return res
+        self._state.mic = action(ccen == 1 and cc == 0, bar, d)
+        return self._state.mic
+
+    def _jz(self, cond: bool, bar: int, d: int) -> int:
+        self._state.stack_pointer = 0
+        return 0
+
+    def _cjs(self, cond: bool, bar: int, d: int) -> int:
+        state = self._state
+        if cond:
+            return state.mic + 1
+        if state.stack_pointer == STACK_SIZE:
+            raise Exception("ControlUnit: stack overflow")
+        state.stack[state.stack_pointer] = state.mic + 1
+        state.stack_pointer += 1
+        return bar
+
+    def _jmap(self, cond: bool, bar: int, d: int) -> int:
+        return d
+
+    def _cjp(self, cond: bool, bar: int, d: int) -> int:
+        return self._state.mic + 1 if cond else bar
+
+    def _push(self, cond: bool, bar: int, d: int) -> int:
+        state = self._state
+        if state.stack_pointer == STACK_SIZE:
+            raise Exception("ControlUnit: stack overflow")
+        state.stack[state.stack_pointer] = bar
+        state.stack_pointer += 1
+        return state.mic + 1
+
+    def _crtn(self, cond: bool, bar: int, d: int) -> int:
+        state = self._state
+        if cond:
+            return state.mic + 1
+        if state.stack_pointer == 0:
+            raise Exception("ControlUnit: stack underflow")
+        state.stack_pointer -= 1
+        return state.stack[state.stack_pointer]
+
+    def _cjpp(self, cond: bool, bar: int, d: int) -> int:
+        state = self._state
+        if cond:
+            return state.mic + 1
+        if state.stack_pointer == 0:
+            raise Exception("ControlUnit: stack underflow")
+        state.stack_pointer -= 1
+        return bar
+
+    def _cont(self, cond: bool, bar: int, d: int) -> int:
+        return self._state.mic + 1
     
     def __str__(self):
-        return "------------ Control unit status ------------\nStack: " + str(self._stack) + "\n"
\ No newline at end of file
+        return "------------ Control unit status ------------\nStack: " + str(self._state.get_stack()) + "\n"
\ No newline at end of file
@@ -0,0 +1,171 @@
+from typing import Dict, List, NamedTuple, Optional, Set
+
+from Emulator import Emulator, EmulatorRunModes
+
+
+class Stop(NamedTuple):
+    reason: str
+    cycle: int
+    detail: Optional[str] = None
+
+
+class Debugger:
+    '''
+    Non-interactive debugger on top of Emulator.run. Cycles are executed one by one while a breakpoint or a
+    watchpoint is set and in chunks otherwise. Every checkpoint_interval cycles a snapshot is kept, stepping back
+    restores the nearest earlier snapshot and replays the remaining cycles. Once there are more than
+    max_checkpoints snapshots every other one is dropped and the interval doubles, so the memory stays bounded.
+    Stepping back and editing the state drop the checkpoints after the current cycle, as the run may take another
+    course from there, so edits go through set_register and set_memory.
+    '''
+    def __init__(self, emulator: Emulator, checkpoint_interval: int = 1000, max_checkpoints: int = 256,
+                 mode: EmulatorRunModes = EmulatorRunModes.TRANSLATED):
+        if checkpoint_interval < 1:
+            raise Exception("Debugger: checkpoint interval has to be positive")
+        self._emulator = emulator
+        self._checkpoint_interval = checkpoint_interval
+        self._max_checkpoints = max_checkpoints
+        self._mode = mode
+        self._cycle = 0
+        self._checkpoints: Dict[int, bytes] = {0: emulator.snapshot()}
+        self._micro_breakpoints: Set[int] = set()
+        self._instruction_breakpoints: Set[int] = set()
+        self._memory_breakpoints: Set[int] = set()
+        self._register_watchpoints: Set[int] = set()
+        self._memory_watchpoints: Set[int] = set()
+
+    @property
+    def cycle(self) -> int:
+        return self._cycle
+
+    @property
+    def emulator(self) -> Emulator:
+        return self._emulator
+
+    def status(self):
+        return self._emulator.get_status()
+
+    def break_at_micro_address(self, address: int):
+        self._micro_breakpoints.add(address)
+
+    def break_at_instruction(self, instruction_counter: int):
+        '''Stops before the macro-instruction at the address is fetched.'''
+        self._instruction_breakpoints.add(instruction_counter)
+
+    def break_at_memory(self, address: int):
+        '''Stops after a cycle which accessed the memory address.'''
+        self._memory_breakpoints.add(address & 0xFFFF)
+
+    def watch_register(self, register: int):
+        if register < 0 or register > 15:
+            raise Exception("Debugger: invalid register r{}".format(register))
+        self._register_watchpoints.add(register)
+
+    def watch_memory(self, address: int):
+        self._memory_watchpoints.add(address & 0xFFFF)
+
+    def clear(self):
+        for points in (self._micro_breakpoints, self._instruction_breakpoints, self._memory_breakpoints,
+                       self._register_watchpoints, self._memory_watchpoints):
+            points.clear()
+
+    def step(self, cycles: int = 1) -> Stop:
+        return self._advance(cycles, True)
+
+    def cont(self, cycles_limit: int = 1000000) -> Stop:
+        return self._advance(cycles_limit, True)
+
+    def run_to_cycle(self, cycle: int, stop_at_breakpoints: bool = True) -> Stop:
+        if cycle < self._cycle:
+            return self.step_back(self._cycle - cycle)
+        return self._advance(cycle - self._cycle, stop_at_breakpoints)
+
+    def step_back(self, cycles: int = 1) -> Stop:
+        target = max(0, self._cycle - cycles)
+        self._drop_checkpoints_after(target)
+        checkpoint = max(self._checkpoints)
+        self._emulator.restore(self._checkpoints[checkpoint])
+        self._cycle = checkpoint
+        stop = self._advance(target - checkpoint, False)
+        return Stop("cycle", self._cycle) if stop.reason == "cycle" else stop
+
+    def set_register(self, register: int, value: int):
+        if register < 0 or register > 15:
+            raise Exception("Debugger: invalid register r{}".format(register))
+        self._emulator.set_register(register, value)
+        self._state_changed()
+
+    def set_memory(self, address: int, value: int):
+        self._emulator.set_memory_value(address, value)
+        self._state_changed()
+
+    def _state_changed(self):
+        '''The edited state replaces the timeline after the current cycle, a checkpoint at it is taken again.'''
+        self._drop_checkpoints_after(self._cycle - 1)
+        if self._cycle % self._checkpoint_interval == 0:
+            self._checkpoints[self._cycle] = self._emulator.snapshot()
+
+    def _drop_checkpoints_after(self, cycle: int):
+        self._checkpoints = {c: s for c, s in self._checkpoints.items() if c <= cycle}
+
+    def _halted(self) -> bool:
+        return self._emulator.get_decoded_micro_program()[self._emulator.get_mic()].halt
+
+    def _checking(self) -> bool:
+        return bool(self._micro_breakpoints or self._instruction_breakpoints or self._memory_breakpoints or
+                    self._register_watchpoints or self._memory_watchpoints)
+
+    def _advance(self, cycles: int, stop_at_breakpoints: bool) -> Stop:
+        end = self._cycle + cycles
+        checking = stop_at_breakpoints and self._checking()
+        while self._cycle < end:
+            if self._halted():
+                return Stop("halted", self._cycle)
+            if checking:
+                stop = self._step_checked()
+                if stop is not None:
+                    return stop
+            else:
+                boundary = (self._cycle // self._checkpoint_interval + 1) * self._checkpoint_interval
+                self._run(min(end, boundary) - self._cycle, self._mode)
+        if self._halted():
+            return Stop("halted", self._cycle)
+        return Stop("cycle", self._cycle)
+
+    def _run(self, cycles: int, mode: EmulatorRunModes):
+        _, ticks = self._emulator.run(mode, cycles, quiet=True)
+        self._cycle += ticks
+        if self._cycle % self._checkpoint_interval == 0 and self._cycle not in self._checkpoints:
+            self._checkpoints[self._cycle] = self._emulator.snapshot()
+            if len(self._checkpoints) > self._max_checkpoints:
+                self._checkpoint_interval *= 2
+                self._checkpoints = {c: s for c, s in self._checkpoints.items() if c % self._checkpoint_interval == 0}
+
+    def _step_checked(self) -> Optional[Stop]:
+        emulator = self._emulator
+        registers = emulator.get_registers()
+        old_registers = [registers[r] for r in self._register_watchpoints]
+        memory = [emulator.get_memory_value(a) for a in self._memory_watchpoints]
+        self._run(1, EmulatorRunModes.RUN)
+
+        reasons: List[str] = []
+        registers = emulator.get_registers()
+        for register, old in zip(self._register_watchpoints, old_registers):
+            if registers[register] != old:
+                reasons.append("r{} 0x{:04X} -> 0x{:04X}".format(register, old, registers[register]))
+        for address, old in zip(self._memory_watchpoints, memory):
+            value = emulator.get_memory_value(address)
+            if value != old:
+                reasons.append("[0x{:04X}] 0x{:04X} -> 0x{:04X}".format(address, old, value))
+        if reasons:
+            return Stop("watchpoint", self._cycle, ", ".join(reasons))
+        address_bus = emulator.get_address_bus() & 0xFFFF
+        if address_bus in self._memory_breakpoints:
+            return Stop("breakpoint", self._cycle, "memory 0x{:04X}".format(address_bus))
+        mic = emulator.get_mic()
+        if mic in self._micro_breakpoints:
+            return Stop("breakpoint", self._cycle, "micro-address 0x{:03X}".format(mic))
+        instruction_counter = emulator.get_instruction_counter()
+        if mic == 0 and instruction_counter in self._instruction_breakpoints:
+            return Stop("breakpoint", self._cycle, "instruction 0x{:04X}".format(instruction_counter))
+        return None
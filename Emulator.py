@@ -1,80 +1,352 @@
 import os
+import struct
 from enum import Enum
-from tabulate import tabulate
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple, Union
 from ControlUnit import ControlUnit
 from ALU import ALU
+from MachineState import STATE, MachineState
 from SSCUnit import SSCUnit
-from MIInstruction import MicroInstruction
+from Memory import Memory
+from MemoryImage import write_diff
+from MIInstruction import DecodedMicroInstruction, decode_micro_program
+from MicroAnalyzer import MicroAnalysis, MicroAnalyzer
+from MicroCompiler import BlockCache, MicroCompiler
+from ObjectFile import ObjectFile
+from PerformanceCounters import PerformanceCounters, TimingModel
+from Profiler import Profiler
+from Renderer import Renderer
+from Trace import FLAG_WRITE, TraceRingBuffer, TraceWriter
+from Watchdog import Watchdog
+
+SNAPSHOT_MAGIC = b"MPSN"
+SNAPSHOT_VERSION = 1
+# magic and version, the machine state and the memory follow
+SNAPSHOT_HEADER = struct.Struct("<4sH")
 
 class EmulatorRunModes(Enum):
     RUN = 0
     DEBUG = 1
     FULL_DEBUG = 2
+    COMPILED = 3
+    TRANSLATED = 4
 
 class Emulator:
     def __init__(self, micro_macro_mapping_PROM: Dict[int, int], micro_program_memory: Dict[int, int]):
-        self._data_BUS: int = 0
-        self._address_BUS: int = 0
-        self._memory: Dict[int, int] = {}
+        # Counters, buses, registers, status registers, mic and stack, the units work on the same state
+        self._state = MachineState()
+        self._memory = Memory()
         self._micro_macro_mapping_PROM: Dict[int, int] = micro_macro_mapping_PROM
         self._micro_program_memory: Dict[int, int] = micro_program_memory
-        self._instruction_register: int = 0
-        self._mi_register: int = 0
-        self._instruction_counter: int = 0
-        self._control_unit = ControlUnit()
-        self._alu = ALU()
-        self._ssc_unit = SSCUnit()
+        self._decoded_micro_program: Dict[int, DecodedMicroInstruction] = decode_micro_program(micro_program_memory)
+        self._compiled_micro_program: Optional[Dict[int, Optional[Callable]]] = None
+        self._block_cache: Optional[BlockCache] = None
+        self._validated = False
+        self._control_unit = ControlUnit(self._state)
+        self._alu = ALU(self._state)
+        self._ssc_unit = SSCUnit(self._state)
         self._run_mode = EmulatorRunModes.RUN
+        self._quiet = False
+        self._stop_reason: Optional[str] = None
+        self._renderer = Renderer(self)
+
+    def set_micro_program_memory(self, micro_program_memory: Dict[int, int]):
+        self._micro_program_memory = micro_program_memory
+        self._decoded_micro_program = decode_micro_program(micro_program_memory)
+        self._compiled_micro_program = None
+        self._block_cache = None
+        self._validated = False
+
+    def set_micro_macro_mapping_PROM(self, micro_macro_mapping_PROM: Dict[int, int]):
+        self._micro_macro_mapping_PROM = micro_macro_mapping_PROM
+        self._compiled_micro_program = None
+        self._block_cache = None
+        self._validated = False
+
+    def update_micro_program(self, micro_program_memory: Dict[int, int]) -> Set[int]:
+        '''
+        Switches to an edited micro-program keeping everything the edit did not touch: only the changed words are
+        decoded and compiled again and only the translated blocks built from them are dropped. The decoded store is
+        updated in place, as the compiled code refers to it. Returns the changed micro addresses.
+        '''
+        decoded_micro_program = self._decoded_micro_program
+        changed = {address for address, instruction in micro_program_memory.items()
+                   if address not in decoded_micro_program or decoded_micro_program[address].raw != instruction}
+        removed = decoded_micro_program.keys() - micro_program_memory.keys()
+        for address in removed:
+            del decoded_micro_program[address]
+        for address in changed:
+            decoded_micro_program[address] = DecodedMicroInstruction(micro_program_memory[address])
+        self._micro_program_memory = micro_program_memory
+        if self._compiled_micro_program is not None:
+            for address in removed:
+                del self._compiled_micro_program[address]
+            self._compiled_micro_program.update(MicroCompiler(self._micro_macro_mapping_PROM, decoded_micro_program).compile(changed))
+        changed |= removed
+        if changed:
+            if self._block_cache is not None:
+                self._block_cache.invalidate(changed, set())
+            self._validated = False
+        return changed
+
+    def update_micro_macro_mapping_PROM(self, micro_macro_mapping_PROM: Dict[int, int]) -> Set[int]:
+        '''
+        Switches to an edited PROM, the counterpart of update_micro_program. The PROM the emulator was created with is
+        updated in place, as the compiled code looks the JMAP targets up in it. Returns the changed opcodes.
+        '''
+        prom = self._micro_macro_mapping_PROM
+        changed = {opcode for opcode in prom.keys() | micro_macro_mapping_PROM.keys()
+                   if prom.get(opcode) != micro_macro_mapping_PROM.get(opcode)}
+        for opcode in changed:
+            if opcode in micro_macro_mapping_PROM:
+                prom[opcode] = micro_macro_mapping_PROM[opcode]
+            else:
+                del prom[opcode]
+        if changed:
+            if self._block_cache is not None:
+                self._block_cache.invalidate(set(), changed)
+            self._validated = False
+        return changed
 
-        self._last_instruction_address = 0
+    def get_micro_macro_mapping_PROM(self) -> Dict[int, int]:
+        '''The PROM in use, kept up to date by update_micro_macro_mapping_PROM. It is read only for the caller.'''
+        return self._micro_macro_mapping_PROM
+
+    def get_decoded_micro_program(self) -> Dict[int, DecodedMicroInstruction]:
+        '''The decoded micro-words in use, kept up to date by update_micro_program. They are read only for the caller.'''
+        return self._decoded_micro_program
+
+    def validate(self) -> MicroAnalysis:
+        '''
+        Analyzes the micro-program. When it has no errors, the interpreter leaves out the checks which the analysis
+        proved to never fail and checks the opcode only when the instruction register is loaded.
+        '''
+        analysis = MicroAnalyzer(self._micro_macro_mapping_PROM, self._decoded_micro_program).analyze()
+        self._validated = analysis.valid
+        return analysis
 
     def clear_memory(self):
-        self._memory = {}
+        self._memory.clear()
 
     def set_memory_value(self, address: int, value: int):
         self._memory[address] = value
 
+    def get_memory_value(self, address: int) -> int:
+        return self._memory[address]
+
+    def clear_memory_value(self, address: int):
+        '''Drops the word from the memory, so it is no longer part of the status.'''
+        self._memory.discard(address)
+
     def init_memory(self, memory: Dict[int, int]):
-        self._memory = memory
+        self._memory.load(memory)
+
+    def init_memory_image(self, path: str):
+        '''Maps the initial memory from a raw image copy-on-write, see Memory.load_image.'''
+        self._memory.load_image(path)
+
+    def dump_memory_image(self, path: str):
+        self._memory.write_image(path)
+
+    def dump_memory_diff(self, path: str, base_image: Optional[str] = None):
+        '''Writes the words which differ from the base image, from the zeroed memory without one.'''
+        write_diff(path, self._memory, base_image)
+
+    def load_object(self, object_file: ObjectFile, memory_image: Optional[str] = None):
+        '''
+        Loads the memory and the program of an assembled object, like init_memory followed by insert_program. With
+        an image the memory starts from it instead of the zeroed one.
+        '''
+        if memory_image is None:
+            self._memory.clear()
+        else:
+            self._memory.load_image(memory_image)
+        for start, words in object_file.memory_runs:
+            self._memory.load_words(start, words)
+        self.insert_program(object_file.program)
 
     def insert_program(self, program: List[int]):
-        for i in range(len(program)):
-            self._memory[i] = program[i]
+        self._memory.load_words(0, program)
 
-        self._last_instruction_address = len(program) - 1
+        self._state.last_instruction_address = len(program) - 1
+
+    def set_program_length(self, length: int):
+        '''For a program patched in memory with set_memory_value, the words after it are shown as data.'''
+        self._state.last_instruction_address = length - 1
+
+    def get_program_length(self) -> int:
+        return self._state.last_instruction_address + 1
 
     def init_registers(self, registers: List[int]):
-        self._alu._registers = registers
+        self._state.registers = list(registers)
+
+    def set_register(self, register: int, value: int):
+        self._state.registers[register] = value & 0xFFFF
 
     def init_status_register(self, status_register: int):
-        self._ssc_unit._macro_status = status_register
+        self._state.macro_status = status_register
+
+    def get_mic(self) -> int:
+        return self._state.mic
+
+    def get_instruction_counter(self) -> int:
+        return self._state.instruction_counter
+
+    def get_instruction_register(self) -> int:
+        return self._state.instruction_register
+
+    def get_address_bus(self) -> int:
+        return self._state.address_bus
+
+    def get_data_bus(self) -> int:
+        return self._state.data_bus
+
+    def get_memory_words(self) -> Sequence[int]:
+        '''The whole memory as 64K words, a view of the emulator memory which is read only for the caller.'''
+        return self._memory._words
+
+    def get_memory_pages(self) -> List[int]:
+        '''Pages written since the memory was last cleared, the words of all the others are 0.'''
+        return self._memory.dirty_pages()
+
+    def get_registers(self) -> List[int]:
+        return list(self._state.registers)
+
+    def get_q_register(self) -> int:
+        return self._state.q
+
+    def get_status_register(self) -> int:
+        return self._state.macro_status
+
+    def get_micro_status_register(self) -> int:
+        return self._state.micro_status
+
+    def get_cu_stack(self) -> List[int]:
+        return self._state.get_stack()
+
+    def get_run_mode(self) -> EmulatorRunModes:
+        return self._run_mode
+
+    def get_units(self) -> Tuple[ALU, SSCUnit, ControlUnit]:
+        return self._alu, self._ssc_unit, self._control_unit
 
     def get_status(self):
+        state = self._state
         return {
-            "memory": self._memory,
-            "instruction_counter": self._instruction_counter,
-            "instruction_register": self._instruction_register,
-            "data_bus": self._data_BUS,
-            "address_bus": self._address_BUS,
-            "cu_stack": self._control_unit._stack,
-            "micro_status_register": self._ssc_unit._micro_status,
-            "macro_status_register": self._ssc_unit._macro_status,
-            "q_register": self._alu._q_reg,
-            "registers": self._alu._registers
+            "memory": self._memory.to_dict(),
+            "instruction_counter": state.instruction_counter,
+            "instruction_register": state.instruction_register,
+            "data_bus": state.data_bus,
+            "address_bus": state.address_bus,
+            "cu_stack": state.get_stack(),
+            "micro_status_register": state.micro_status,
+            "macro_status_register": state.macro_status,
+            "q_register": state.q,
+            "registers": list(state.registers)
         }
+
+    def performance_counters(self, profiler: Profiler, timing_model: Optional[TimingModel] = None) -> PerformanceCounters:
+        '''Counters and the estimated time of the run made with the profiler.'''
+        return PerformanceCounters(profiler, self._decoded_micro_program, timing_model)
+
+    def snapshot(self) -> bytes:
+        '''Serializes the whole machine state, the memory only with its dirty pages.'''
+        return SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION) + self._state.to_bytes() + self._memory.to_bytes()
+
+    def restore(self, snapshot: bytes):
+        '''Loads a snapshot into the existing state, so the units and the compiled code keep working on it.'''
+        if len(snapshot) < SNAPSHOT_HEADER.size + STATE.size or snapshot[:4] != SNAPSHOT_MAGIC:
+            raise Exception("Emulator: invalid snapshot")
+        _, version = SNAPSHOT_HEADER.unpack_from(snapshot)
+        if version != SNAPSHOT_VERSION:
+            raise Exception("Emulator: unsupported snapshot version {}".format(version))
+        offset = self._state.load_bytes(snapshot, SNAPSHOT_HEADER.size)
+        self._memory.load_bytes(snapshot, offset)
+        # The validated interpreter checks the opcode only when a word loads the instruction register
+        opcode = (self._state.instruction_register >> 8) & 0b11111111
+        if opcode not in self._micro_macro_mapping_PROM and opcode != 0:
+            self._validated = False
+
+    def fork(self) -> "Emulator":
+        '''
+        Independent copy of the emulator which shares the decoded, compiled and translated micro-program. The memory
+        is a flat array, so it is copied in one go instead of page by page on write.
+        '''
+        emulator = Emulator.__new__(Emulator)
+        emulator.__dict__.update(self.__dict__)
+        emulator._memory = self._memory.copy()
+        emulator._state = self._state.copy()
+        emulator._control_unit = ControlUnit(emulator._state)
+        emulator._alu = ALU(emulator._state)
+        emulator._ssc_unit = SSCUnit(emulator._state)
+        emulator._renderer = Renderer(emulator)
+        return emulator
     
-    def run(self, mode: EmulatorRunModes = EmulatorRunModes.RUN, instructions_limit: int = 1000000):
+    def run(self, mode: EmulatorRunModes = EmulatorRunModes.RUN, instructions_limit: int = 1000000, profiler: Optional[Profiler] = None,
+            tracer: Optional[Union[TraceWriter, TraceRingBuffer]] = None, quiet: bool = False, detect_loops: bool = False,
+            time_limit: Optional[float] = None, watchdog: Optional[Watchdog] = None):
+        '''
+        With a profiler every micro-instruction is recorded into it, with a tracer every tick is appended to the trace.
+        Both need the per-word interpreter, so the COMPILED and TRANSLATED modes fall back to it while one is attached.
+        A quiet run does not print the final state, it is only returned. With detect_loops the run stops as soon as
+        the state at a macro-instruction boundary repeats, time_limit is a wall clock budget in seconds. A watchdog
+        passed in replaces both and keeps watching across the runs it is passed to, so a loop longer than one run is
+        found too. Why the run stopped is kept for get_stop_reason().
+        '''
         self._run_mode = mode
+        self._quiet = quiet
+        self._stop_reason = None
+        if watchdog is None and (detect_loops or time_limit is not None):
+            watchdog = Watchdog(detect_loops, time_limit)
+        if watchdog is None:
+            return self._run(mode, instructions_limit, profiler, tracer, watchdog)
+        # The memory hash is only kept up to date while the watchdog compares states
+        self._memory.track_hash(watchdog.detects_loops)
+        try:
+            status, ticks = self._run(mode, instructions_limit, profiler, tracer, watchdog)
+        finally:
+            self._memory.track_hash(False)
+        watchdog.ticks_before += ticks
+        return status, ticks
+
+    def _run(self, mode: EmulatorRunModes, instructions_limit: int, profiler: Optional[Profiler],
+             tracer: Optional[Union[TraceWriter, TraceRingBuffer]], watchdog: Optional[Watchdog]):
+        if profiler is None and tracer is None:
+            if mode == EmulatorRunModes.COMPILED:
+                return self._run_compiled(instructions_limit, watchdog)
+            if mode == EmulatorRunModes.TRANSLATED:
+                return self._run_translated(instructions_limit, watchdog)
+        elif mode in (EmulatorRunModes.COMPILED, EmulatorRunModes.TRANSLATED):
+            mode = EmulatorRunModes.RUN
+        try:
+            return self._run_interpreted(mode, instructions_limit, profiler, tracer, watchdog)
+        except Exception as e:
+            if tracer is not None:
+                dump_path = tracer.fail(self._state.mic, e)
+                if dump_path is not None and not self._quiet:
+                    print("Trace of the last {} ticks dumped to {}".format(len(tracer), dump_path))
+            raise
+        finally:
+            if profiler is not None:
+                profiler.finish()
+            if tracer is not None:
+                tracer.close()
+
+    def _run_interpreted(self, mode: EmulatorRunModes, instructions_limit: int, profiler: Optional[Profiler],
+                         tracer: Optional[Union[TraceWriter, TraceRingBuffer]], watchdog: Optional[Watchdog]):
+        decoded_micro_program = self._decoded_micro_program
+        memory = self._memory
+        state = self._state
+        validated = self._validated
+        prom = self._micro_macro_mapping_PROM
+        alu_run, ssc_unit_run, control_unit_run = self._alu.run, self._ssc_unit.run, self._control_unit.run
         for tick in range(instructions_limit):
-            current_mic = self._control_unit.get_mic()
-            mi_instruction = MicroInstruction(self._micro_program_memory[current_mic])
+            current_mic = state.mic
+            mi_instruction = decoded_micro_program[current_mic]
 
-            if mi_instruction._raw_instruction == (1 << 75) - 1:
-                print("----------------------------- PROGRAM FINISHED -----------------------------")
-                print("Final state of the system\n")
-                print(self)
-                return self.get_status(), tick
+            if mi_instruction.halt:
+                return self._finish(tick)
+            if watchdog is not None and (current_mic == 0 or not tick & 0xFFF) and watchdog.check(self, tick, current_mic == 0):
+                return self._stop(watchdog.reason, tick)
             
             if mode == EmulatorRunModes.FULL_DEBUG or (mode == EmulatorRunModes.DEBUG and current_mic > 2):
                 print("Evaluating microinstruction on address: " + str(current_mic))
@@ -82,57 +354,64 @@ class Emulator:
                 print()
             
             # IC
-            if (mi_instruction.ic & 0b0001) + ((mi_instruction.ic & 0b0010) >> 1) + ((mi_instruction.ic & 0b0100) >> 2) + ((mi_instruction.ic & 0b1000)  >> 3) > 1:
+            if not validated and mi_instruction.ic_error:
                 raise Exception("More than 1 instruction counter control bits were set to 1")
-            if mi_instruction.ic == 0b0001:
-                self._address_BUS = self._instruction_counter
-            if mi_instruction.ic == 0b0010:
-                self._instruction_counter += 1
-            if mi_instruction.ic == 0b0100:
-                self._data_BUS = self._instruction_counter
+            ic = mi_instruction.ic
+            instruction_counter = state.instruction_counter
+            if ic == 0b0001:
+                state.address_bus = instruction_counter
+            elif ic == 0b0010:
+                state.instruction_counter = (instruction_counter + 1) & 0xFFFF
+            elif ic == 0b0100:
+                state.data_bus = instruction_counter
 
             # ALU
-            alu_y_output, alu_status = self._alu.run(
+            alu_y_output, alu_status = alu_run(
                 instruction=mi_instruction.alu_instruction,
-                a=mi_instruction.ra_addr if mi_instruction.a_mux else (self._instruction_register >> 4) & 0b1111,
-                b=mi_instruction.rb_addr if mi_instruction.b_mux else self._instruction_register & 0b1111,
-                c_n=self._ssc_unit.get_c0(),
-                d=mi_instruction.constant if mi_instruction.k_mux else self._data_BUS
+                a=mi_instruction.ra_addr if mi_instruction.a_mux else (state.instruction_register >> 4) & 0b1111,
+                b=mi_instruction.rb_addr if mi_instruction.b_mux else state.instruction_register & 0b1111,
+                c_n=(state.micro_status & 0b0100) >> 2,
+                d=mi_instruction.constant if mi_instruction.k_mux else state.data_bus
             )
             if mi_instruction.y_mux & 0b01:
-                self._address_BUS = alu_y_output
+                state.address_bus = alu_y_output
             if mi_instruction.y_mux & 0b10:
-                self._data_BUS = alu_y_output
+                state.data_bus = alu_y_output
 
-            if mi_instruction.ic == 0b1000:
-                self._instruction_counter = self._data_BUS
+            if ic == 0b1000:
+                state.instruction_counter = state.data_bus
             # IR
             if mi_instruction.ir:
-                self._instruction_register = self._data_BUS
+                state.instruction_register = state.data_bus
             # SSCU
-            status_test = self._ssc_unit.run(
+            status_test = ssc_unit_run(
                 status=alu_status,
                 ce_macro=mi_instruction.srM,
                 ce_micro=mi_instruction.srm,
                 instruction=mi_instruction.sscu_instruction
             )
             # Controller
-            opcode = (self._instruction_register >> 8) & 0b11111111
-            if opcode not in self._micro_macro_mapping_PROM and opcode != 0:
+            opcode = (state.instruction_register >> 8) & 0b11111111
+            if (mi_instruction.ir or not validated) and opcode not in prom and opcode != 0:
                 raise Exception(f"Opcode {opcode} is not present in PROM")
-            self._control_unit.run(
+            control_unit_run(
                 bar=mi_instruction.bar,
                 ccen=mi_instruction.ccen,
                 cc=status_test,
-                d=self._micro_macro_mapping_PROM[opcode] if opcode != 0 else 0,
+                d=prom[opcode] if opcode != 0 else 0,
                 instruction=mi_instruction.controller_instruction
             )
+            if profiler is not None:
+                profiler.record(current_mic, mi_instruction, status_test, opcode, state.stack_pointer, instruction_counter)
 
             # Memory
             if mi_instruction.mwe:
-                self._memory[self._address_BUS] = self._data_BUS
+                memory[state.address_bus] = state.data_bus
             else:
-                self._data_BUS = self._memory[self._address_BUS] if self._address_BUS in self._memory else 0
+                state.data_bus = memory._words[state.address_bus & 0xFFFF]
+            if tracer is not None:
+                tracer.record(tick, current_mic, state.instruction_register, state.instruction_counter, state.address_bus, state.data_bus,
+                              alu_y_output, alu_status, status_test, FLAG_WRITE if mi_instruction.mwe else 0)
             
             if mode == EmulatorRunModes.FULL_DEBUG or (mode == EmulatorRunModes.DEBUG and current_mic > 2):
                 print("State of the system after the instruction\n")
@@ -142,16 +421,75 @@ class Emulator:
                 os.system('cls' if os.name == 'nt' else 'clear')
             
                 
-        print("Emulator terminated after " + str(instructions_limit) + " instructions")
+        return self._terminate(instructions_limit)
+
+    def _run_compiled(self, instructions_limit: int, watchdog: Optional[Watchdog]):
+        if self._compiled_micro_program is None:
+            self._compiled_micro_program = MicroCompiler(self._micro_macro_mapping_PROM, self._decoded_micro_program).compile()
+        compiled_micro_program = self._compiled_micro_program
+        state, memory = self._state, self._memory
+        current_mic = state.mic
+        try:
+            for tick in range(instructions_limit):
+                microinstruction = compiled_micro_program[current_mic]
+                if microinstruction is None:
+                    return self._finish(tick)
+                if watchdog is not None and (current_mic == 0 or not tick & 0xFFF):
+                    state.mic = current_mic
+                    if watchdog.check(self, tick, current_mic == 0):
+                        return self._stop(watchdog.reason, tick)
+                current_mic = microinstruction(state, memory)
+        finally:
+            state.mic = current_mic
+        return self._terminate(instructions_limit)
+
+    def _run_translated(self, instructions_limit: int, watchdog: Optional[Watchdog]):
+        if self._block_cache is None:
+            self._block_cache = BlockCache(MicroCompiler(self._micro_macro_mapping_PROM, self._decoded_micro_program))
+        block_cache = self._block_cache
+        blocks = block_cache.blocks
+        state, memory = self._state, self._memory
+        tick = 0
+        while tick < instructions_limit:
+            block = blocks.get((state.mic, state.instruction_register))
+            if block is None:
+                if self._decoded_micro_program[state.mic].halt:
+                    return self._finish(tick)
+                block = block_cache.translate(state.mic, state.instruction_register)
+            if watchdog is None:
+                tick += block(state, memory, instructions_limit - tick)
+                continue
+            # Blocks end at macro-instruction boundaries unless their budget ran out first
+            budget = min(instructions_limit - tick, 0x1000)
+            ticks = block(state, memory, budget)
+            tick += ticks
+            if watchdog.check(self, tick, ticks < budget):
+                return self._stop(watchdog.reason, tick)
+        return self._terminate(instructions_limit)
+
+    def get_stop_reason(self) -> Optional[str]:
+        return self._stop_reason
+
+    def _finish(self, tick: int):
+        self._stop_reason = "halted"
+        if not self._quiet:
+            print("----------------------------- PROGRAM FINISHED -----------------------------")
+            print("Final state of the system\n")
+            print(self)
+        return self.get_status(), tick
+
+    def _terminate(self, instructions_limit: int):
+        self._stop_reason = "instructions limit"
+        if not self._quiet:
+            print("Emulator terminated after " + str(instructions_limit) + " instructions")
         return None, instructions_limit
 
+    def _stop(self, reason: str, tick: int):
+        self._stop_reason = reason
+        if not self._quiet:
+            print("Emulator stopped after " + str(tick) + " instructions: " + reason)
+        return None, tick
+
 
     def __str__(self):
-        memory_table = [["Address", "Data"]]
-        for i in sorted(self._memory.keys()):
-            if (self._run_mode == EmulatorRunModes.FULL_DEBUG or i > self._last_instruction_address) and self._memory[i] != 0:
-                memory_table.append(["0x{:04X} ({})".format(i,i), "0x{:04X} ({})".format(self._memory[i], self._memory[i])])
-        return "" + str(self._alu) + "\n" + str(self._ssc_unit) + "\n" + str(self._control_unit) + \
-            "\nInstruction counter: " + str(self._instruction_counter) + "\nInstruction register: 0x{:04X} ({})".format(self._instruction_register, self._instruction_register) + \
-            "\nAddress bus: 0x{:04X} ({})".format(self._address_BUS, self._address_BUS) + "\nData bus: 0x{:04X} ({})".format(self._data_BUS, self._data_BUS) +\
-            "\n\n------------ Memory ------------\n" + tabulate(memory_table, headers="firstrow", tablefmt="grid") + "\n"
+        return self._renderer.render()
@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import importlib
+import itertools
+import json
+import multiprocessing
+import os
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+from Assembler import Assembler
+from Emulator import Emulator, EmulatorRunModes
+from ObjectFile import ObjectFile
+from Watchdog import Watchdog
+
+'''
+Long-lived emulation service on localhost. Clients send JSON lines and get JSON lines back:
+
+    {"op": "submit", "source": "<.prd text>", "microcode": "MicroProgram", "mode": "TRANSLATED", "limit": 1000000,
+     "time_limit": 10, "detect_loops": false, "progress_interval": 100000, "memory_image": null}
+    {"op": "cancel", "job": 3}
+    {"op": "stats"}
+
+Instead of "source" a job may name a "program" (.prd, assembled through the object cache) or an "object" (.mpo)
+on the local disk. Every job answers with "queued", "started", "progress" every progress_interval cycles and ends
+with "finished", "failed" or "cancelled". Only the microcode modules the service was started with can be named.
+The jobs are queued and run by a pool of worker processes which keep their emulators resident, with the
+micro-program decoded and the compiled and translated code of earlier jobs.
+
+    python EmulatorService.py serve -j 4
+    python EmulatorService.py submit programms/test1.prd --mode TRANSLATED
+'''
+
+DEFAULT_PORT = 8765
+MODES = ("RUN", "COMPILED", "TRANSLATED")
+DEFAULT_MICROCODE = "MicroProgram"
+
+
+def _warm(microcode_module: str) -> Tuple[Emulator, bytes]:
+    '''An emulator of the microcode with its fetch and halt words compiled, and the snapshot of its blank state.'''
+    module = importlib.import_module(microcode_module)
+    emulator = Emulator(micro_macro_mapping_PROM=module.micro_macro_mapping_PROM,
+                        micro_program_memory=module.micro_program_memory)
+    emulator.validate()
+    blank = emulator.snapshot()
+    emulator.insert_program([0xFF << 8])
+    for mode in (EmulatorRunModes.COMPILED, EmulatorRunModes.TRANSLATED):
+        try:
+            emulator.run(mode, 1000, quiet=True)
+        except Exception:
+            # A microcode which can not run the empty program still serves the jobs, they report the error
+            pass
+        emulator.restore(blank)
+        emulator.insert_program([0xFF << 8])
+    emulator.restore(blank)
+    return emulator, blank
+
+
+def _cancelled(connection, job_id: int) -> bool:
+    while connection.poll():
+        message = connection.recv()
+        if message[0] == "cancel" and message[1] == job_id:
+            return True
+    return False
+
+
+def _run_job(connection, job_id: int, request: dict, machines: Dict[str, Tuple[Emulator, bytes]]) -> Tuple[str, dict]:
+    microcode = request.get("microcode", DEFAULT_MICROCODE)
+    if microcode not in machines:
+        raise Exception("EmulatorService: microcode {} is not served".format(microcode))
+    emulator, blank = machines[microcode]
+    emulator.restore(blank)
+
+    memory_image = request.get("memory_image")
+    if "source" in request:
+        program, memory = Assembler.assemble_string(request["source"])
+        if memory_image is None:
+            emulator.init_memory(memory)
+        else:
+            emulator.init_memory_image(memory_image)
+            for address, value in memory.items():
+                emulator.set_memory_value(address, value)
+        emulator.insert_program(program)
+    else:
+        if "object" in request:
+            object_file = ObjectFile(request["object"])
+        else:
+            object_file = Assembler.assemble_object(request["program"])
+        with object_file:
+            emulator.load_object(object_file, memory_image)
+
+    mode = EmulatorRunModes[request.get("mode", "TRANSLATED")]
+    limit = request.get("limit", 1000000)
+    time_limit = request.get("time_limit")
+    detect_loops = request.get("detect_loops", False)
+    interval = max(1, request.get("progress_interval", 100000))
+    # One watchdog watches the whole job, so a loop longer than a chunk is found and the time limit spans the chunks
+    watchdog = Watchdog(detect_loops, time_limit) if detect_loops or time_limit is not None else None
+    # The run goes in chunks of the progress interval, between them progress is reported and a cancel is noticed
+    ticks = 0
+    while True:
+        status, done = emulator.run(mode, min(interval, limit - ticks), quiet=True, watchdog=watchdog)
+        ticks += done
+        stop_reason = emulator.get_stop_reason()
+        if stop_reason != "instructions limit" or ticks >= limit:
+            break
+        connection.send(("progress", {"ticks": ticks}))
+        if _cancelled(connection, job_id):
+            return "cancelled", {"ticks": ticks}
+    if status is None:
+        status = emulator.get_status()
+    return "finished", {"status": status, "ticks": ticks, "stop_reason": stop_reason}
+
+
+def _worker_main(connection, microcode_modules: List[str]):
+    # A Ctrl-C reaches the whole process group, the service stops its workers itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    machines = {microcode: _warm(microcode) for microcode in microcode_modules}
+    connection.send(("ready", {"pid": os.getpid()}))
+    while True:
+        message = connection.recv()
+        if message[0] == "stop":
+            return
+        if message[0] != "run":
+            # A cancel of a job which already ended
+            continue
+        _, job_id, request = message
+        try:
+            connection.send(_run_job(connection, job_id, request, machines))
+        except Exception as e:
+            connection.send(("failed", {"error": "{}: {}".format(type(e).__name__, e)}))
+
+
+class Job:
+    def __init__(self, job_id: int, request: dict, writer: asyncio.StreamWriter):
+        self.id = job_id
+        self.request = request
+        self.writer = writer
+        self.cancelled = False
+        self.done = False
+
+    def emit(self, event: str, **fields):
+        if event in ("finished", "failed", "cancelled"):
+            self.done = True
+        if self.writer.is_closing():
+            return
+        fields.update(job=self.id, event=event)
+        self.writer.write(json.dumps(fields).encode() + b"\n")
+
+
+class Worker:
+    def __init__(self, context, microcode_modules: List[str]):
+        self._connection, child = context.Pipe()
+        self._process = context.Process(target=_worker_main, args=(child, microcode_modules), daemon=True)
+        self._process.start()
+        child.close()
+        self.job: Optional[Job] = None
+
+    @property
+    def pid(self) -> int:
+        return self._process.pid
+
+    def send(self, message):
+        self._connection.send(message)
+
+    def receive(self):
+        return self._connection.recv()
+
+    def stop(self):
+        try:
+            self._connection.send(("stop",))
+        except OSError:
+            pass
+        self._process.join(1)
+        if self._process.is_alive():
+            self._process.terminate()
+
+
+class EmulatorService:
+    '''
+    Accepts jobs over a localhost socket, queues them and runs them on the worker processes. Every worker has its own
+    dispatcher coroutine which takes the next job from the queue once its previous one ended, the blocking pipe
+    reads of the dispatchers run on a thread of their own.
+    '''
+    def __init__(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT, workers: Optional[int] = None,
+                 microcode_modules: Tuple[str, ...] = (DEFAULT_MICROCODE,)):
+        self._host = host
+        self._port = port
+        self._worker_count = workers or os.cpu_count() or 1
+        self._microcode_modules = list(microcode_modules)
+        self._context = multiprocessing.get_context("spawn")
+        self._workers: List[Worker] = []
+        self._queue: Optional[asyncio.Queue] = None
+        self._jobs: Dict[int, Job] = {}
+        self._ids = itertools.count(1)
+        self._executor = ThreadPoolExecutor(max_workers=self._worker_count)
+        self._server: Optional[asyncio.AbstractServer] = None
+        # The dispatchers and the connections of the clients, cancelled on close
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._workers = [Worker(self._context, self._microcode_modules) for _ in range(self._worker_count)]
+        # Wait for the workers to be warm before accepting jobs
+        for worker in self._workers:
+            await loop.run_in_executor(self._executor, worker.receive)
+        for index in range(self._worker_count):
+            self._track(asyncio.ensure_future(self._dispatch(index)))
+        self._server = await asyncio.start_server(self._handle_client, self._host, self._port)
+        self._port = self._server.sockets[0].getsockname()[1]
+
+    @property
+    def port(self) -> int:
+        return self._port
+
+    async def serve_forever(self):
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def _track(self, task: asyncio.Task):
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for worker in self._workers:
+            worker.stop()
+        self._executor.shutdown(wait=False)
+
+    async def _dispatch(self, index: int):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self._queue.get()
+            if job.cancelled:
+                continue
+            worker = self._workers[index]
+            worker.job = job
+            job.emit("started", worker=worker.pid)
+            try:
+                worker.send(("run", job.id, job.request))
+                while True:
+                    event, fields = await loop.run_in_executor(self._executor, worker.receive)
+                    job.emit(event, **fields)
+                    if event != "progress":
+                        break
+            except (EOFError, OSError) as e:
+                if not job.done:
+                    job.emit("failed", error="worker died: {}".format(e))
+                worker.stop()
+                self._workers[index] = Worker(self._context, self._microcode_modules)
+                await loop.run_in_executor(self._executor, self._workers[index].receive)
+            finally:
+                worker.job = None
+                del self._jobs[job.id]
+
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self._track(asyncio.current_task())
+        jobs: List[Job] = []
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    reply = self._handle_request(request, writer, jobs)
+                except Exception as e:
+                    reply = {"event": "error", "error": "{}: {}".format(type(e).__name__, e)}
+                if reply is not None:
+                    writer.write(json.dumps(reply).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            # Nobody is left to read the results of the jobs of a closed connection
+            for job in jobs:
+                if not job.done:
+                    self._cancel(job)
+            writer.close()
+
+    def _handle_request(self, request: dict, writer: asyncio.StreamWriter, jobs: List[Job]) -> Optional[dict]:
+        op = request.get("op")
+        if op == "submit":
+            self._check(request)
+            job = Job(next(self._ids), request, writer)
+            jobs.append(job)
+            self._jobs[job.id] = job
+            job.emit("queued", position=self._queue.qsize())
+            self._queue.put_nowait(job)
+            return None
+        if op == "cancel":
+            job = self._jobs.get(request.get("job"))
+            if job is None:
+                return {"event": "error", "error": "no job {}".format(request.get("job"))}
+            self._cancel(job)
+            return None
+        if op == "stats":
+            return {"event": "stats", "queued": self._queue.qsize(), "workers": len(self._workers),
+                    "running": [worker.job.id for worker in self._workers if worker.job is not None]}
+        raise Exception("EmulatorService: unknown op {}".format(op))
+
+    def _check(self, request: dict):
+        if request.get("microcode", DEFAULT_MICROCODE) not in self._microcode_modules:
+            raise Exception("EmulatorService: microcode has to be one of {}".format(", ".join(self._microcode_modules)))
+        if sum(key in request for key in ("source", "program", "object")) != 1:
+            raise Exception("EmulatorService: a job needs exactly one of source, program and object")
+        if request.get("mode", "TRANSLATED") not in MODES:
+            raise Exception("EmulatorService: mode has to be one of {}".format(", ".join(MODES)))
+        for budget in ("limit", "progress_interval"):
+            if budget in request and (not isinstance(request[budget], int) or request[budget] < 1):
+                raise Exception("EmulatorService: {} has to be a positive integer".format(budget))
+        if request.get("time_limit") is not None and not isinstance(request["time_limit"], (int, float)):
+            raise Exception("EmulatorService: time_limit has to be a number of seconds")
+
+    def _cancel(self, job: Job):
+        if job.done or job.cancelled:
+            return
+        job.cancelled = True
+        running = next((worker for worker in self._workers if worker.job is job), None)
+        if running is None:
+            # Still queued, the dispatcher skips it
+            del self._jobs[job.id]
+            job.emit("cancelled", ticks=0)
+        else:
+            try:
+                running.send(("cancel", job.id))
+            except (EOFError, OSError) as e:
+                # The dispatcher of a dead worker may not have noticed yet, the job ends here either way
+                job.emit("failed", error="worker died: {}".format(e))
+
+
+async def submit(request: dict, host: str = "127.0.0.1", port: int = DEFAULT_PORT):
+    '''Submits a job and yields its events up to the final one.'''
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(json.dumps(dict(request, op="submit")).encode() + b"\n")
+        await writer.drain()
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            event = json.loads(line)
+            yield event
+            if event["event"] in ("finished", "failed", "cancelled", "error"):
+                return
+    finally:
+        writer.close()
+
+
+async def _serve(service: EmulatorService):
+    try:
+        await service.serve_forever()
+    finally:
+        await service.close()
+
+
+async def _print_events(request: dict, host: str, port: int):
+    async for event in submit(request, host, port):
+        print(json.dumps(event), flush=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Emulation service on localhost")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_command = commands.add_parser("serve", help="run the service")
+    serve_command.add_argument("-j", "--workers", type=int, default=None,
+                               help="number of worker processes (default: CPU count)")
+    serve_command.add_argument("-m", "--microcode", nargs="+", default=[DEFAULT_MICROCODE],
+                               help="microcode modules to keep warm")
+    submit_command = commands.add_parser("submit", help="submit a program and print the events of its job")
+    submit_command.add_argument("program", help=".prd file, sent as source")
+    submit_command.add_argument("-m", "--microcode", default=DEFAULT_MICROCODE)
+    submit_command.add_argument("--mode", default="TRANSLATED", choices=MODES)
+    submit_command.add_argument("--limit", type=int, default=1000000, help="cycle budget")
+    submit_command.add_argument("--time-limit", type=float, default=None, help="wall clock budget in seconds")
+    submit_command.add_argument("--detect-loops", action="store_true")
+    submit_command.add_argument("--progress-interval", type=int, default=100000)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        service = EmulatorService(args.host, args.port, args.workers, tuple(args.microcode))
+        try:
+            asyncio.run(_serve(service))
+        except KeyboardInterrupt:
+            pass
+    else:
+        with open(args.program, "r") as f:
+            job = {"source": f.read(), "microcode": args.microcode, "mode": args.mode, "limit": args.limit,
+                   "time_limit": args.time_limit, "detect_loops": args.detect_loops,
+                   "progress_interval": args.progress_interval}
+        asyncio.run(_print_events(job, args.host, args.port))
@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+
+import argparse
+import importlib
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from Assembler import OPCODE_NAMES, Assembler
+from Emulator import Emulator, EmulatorRunModes
+from ReferenceModel import ReferenceModel, disassemble
+
+'''
+Differential fuzzing of a micro-program against the reference model of the macro-instructions. Every case is a
+random program with random initial registers, flags and data, both models run it and the first macro-instruction
+after which their registers, flags, instruction counter or memory differ is reported. Diverging cases are
+minimized and the smallest one of every diverging instruction is kept in the corpus directory.
+
+    python Fuzzer.py -m benchmarks.ReferenceMicroProgram --programs 100000
+    python Fuzzer.py --replay fuzz_corpus/add.json
+
+The generated programs only jump forwards and store into the data area, so they terminate. Cases which the
+reference model rejects anyway, for example after a store overwrote the program, are skipped.
+'''
+
+CORPUS_DIRECTORY = "fuzz_corpus"
+DATA_START = 0x8000
+DATA_SIZE = 64
+STATUS_VALUES = (0b0000, 0b0001, 0b1100, 0b1101, 0b1110, 0b1111)
+# Budget of the emulator in ticks per executed macro-instruction and per word walked by UPP
+TICKS_PER_INSTRUCTION = 1000
+# Cases which walk more words with UPP only slow the fuzzing down, they are skipped
+MAX_UPP_WORDS = 1024
+CHUNK_SIZE = 500
+
+
+class FuzzCase(NamedTuple):
+    '''A program as lines of labels and an instruction, its data and the initial registers and macro status.'''
+    seed: int
+    lines: Tuple[Tuple[Tuple[str, ...], str], ...]
+    memory: Dict[int, int]
+    registers: Tuple[int, ...]
+    status_register: int
+
+    def source(self) -> str:
+        # A line takes a single label, the ones which minimizing moved onto the same instruction get lines of their own
+        text = []
+        for labels, instruction in self.lines:
+            text += [label + ":" for label in labels[:-1]]
+            text.append("".join(label + ": " for label in labels[-1:]) + instruction)
+        text.append("memory:")
+        text += ["0x{:04X}:0x{:04X}".format(address, value) for address, value in sorted(self.memory.items())]
+        return "\n".join(text) + "\n"
+
+    def to_dict(self) -> dict:
+        return {"seed": self.seed, "lines": [[list(labels), instruction] for labels, instruction in self.lines],
+                "memory": {str(address): value for address, value in self.memory.items()},
+                "registers": list(self.registers), "status_register": self.status_register}
+
+    @staticmethod
+    def from_dict(data: dict) -> "FuzzCase":
+        return FuzzCase(data["seed"], tuple((tuple(labels), instruction) for labels, instruction in data["lines"]),
+                        {int(address): value for address, value in data["memory"].items()}, tuple(data["registers"]),
+                        data["status_register"])
+
+
+def case_seed(seed: int, index: int) -> int:
+    '''Every case has its own seed, so a case does not depend on the number of workers which checked it.'''
+    return seed << 32 | index
+
+
+def _value(rng: random.Random) -> int:
+    kind = rng.random()
+    if kind < 0.4:
+        return rng.getrandbits(16)
+    if kind < 0.7:
+        return rng.randrange(8)
+    if kind < 0.8:
+        return 0xFFFF - rng.randrange(4)
+    # Around the lowercase letters, for UPP
+    return rng.randrange(90, 130)
+
+
+def generate_case(seed: int, length: int = 32) -> FuzzCase:
+    '''
+    A program of about `length` lines. Jumps go to labels further down, register jumps load the address right
+    before, and the addresses of the stores and of UPP are loaded into the registers first.
+    '''
+    rng = random.Random(seed)
+    lines: List[str] = []
+    # line of every jump and the line of its label operand, jumps only go to the first lines of the groups
+    jumps: List[Tuple[int, int]] = []
+    targets: List[int] = []
+
+    def register() -> str:
+        return "r{}".format(rng.randrange(16))
+
+    def data_address() -> int:
+        return DATA_START + rng.randrange(DATA_SIZE)
+
+    while len(lines) < length:
+        targets.append(len(lines))
+        kind = rng.randrange(10)
+        if kind < 3:
+            lines.append("{} {} {}".format(rng.choice(("mov", "add", "sub", "cmp", "xor", "test")), register(), register()))
+        elif kind == 3:
+            lines.append("mov {} {}".format(data_address() if rng.random() < 0.3 else _value(rng), register()))
+        elif kind == 4:
+            address = register()
+            if rng.random() < 0.7:
+                lines.append("mov {} {}".format(data_address(), address))
+            lines.append("mov [{}] {}".format(address, register()))
+        elif kind == 5:
+            address = register()
+            lines.append("mov {} {}".format(data_address(), address))
+            lines.append("mov {} [{}]".format(register(), address))
+        elif kind == 6:
+            jumps.append((len(lines), len(lines)))
+            lines.append(rng.choice(("jmp", "jz", "jl", "jle")) + " {}")
+        elif kind == 7:
+            target = register()
+            jumps.append((len(lines) + 1, len(lines)))
+            lines.append("mov {} " + target)
+            lines.append("{} {}".format(rng.choice(("jmp", "jz", "jl", "jle")), target))
+        elif kind == 8:
+            start, count = rng.sample(range(16), 2)
+            lines.append("mov {} r{}".format(DATA_START + rng.randrange(DATA_SIZE // 2), start))
+            lines.append("mov {} r{}".format(rng.randrange(DATA_SIZE // 2), count))
+            lines.append("upp r{} r{}".format(start, count))
+        else:
+            lines.append("wtf")
+
+    targets.append(len(lines))
+    labels: List[List[str]] = [[] for _ in range(len(lines) + 1)]
+    for jump, operand in jumps:
+        target = rng.choice([target for target in targets if target > jump])
+        if not labels[target]:
+            labels[target].append("l{}".format(target))
+        lines[operand] = lines[operand].format(labels[target][0])
+    memory = {DATA_START + offset: _value(rng) for offset in rng.sample(range(DATA_SIZE), rng.randrange(DATA_SIZE))}
+    registers = tuple(_value(rng) for _ in range(16))
+    # The last line holds the labels of the halt word which the assembler appends
+    return FuzzCase(seed, tuple((tuple(labels[i]), line) for i, line in enumerate(lines + [""])), memory, registers,
+                    rng.choice(STATUS_VALUES))
+
+
+class DifferentialChecker:
+    '''
+    Runs cases on a warm emulator, which is restored to its blank snapshot before every case, so the translated
+    blocks are shared by all the cases. Only the final states are compared, the macro-instructions are stepped one
+    by one to find the first divergence once they differ.
+    '''
+    def __init__(self, micro_macro_mapping_PROM: Dict[int, int], micro_program_memory: Dict[int, int],
+                 mode: EmulatorRunModes = EmulatorRunModes.TRANSLATED):
+        self._emulator = Emulator(micro_macro_mapping_PROM=micro_macro_mapping_PROM, micro_program_memory=micro_program_memory)
+        self._emulator.validate()
+        self._blank = self._emulator.snapshot()
+        self._mode = mode
+
+    def _load(self, program, memory: Dict[int, int], case: FuzzCase):
+        emulator = self._emulator
+        emulator.restore(self._blank)
+        emulator.init_memory(memory)
+        emulator.insert_program(program)
+        emulator.init_registers(case.registers)
+        emulator.init_status_register(case.status_register)
+
+    def check(self, case: FuzzCase) -> Tuple[bool, Optional[dict]]:
+        '''Whether the reference model accepted the case and the first divergence, None when the models agree.'''
+        try:
+            program, memory = Assembler.assemble_string(case.source())
+            reference = ReferenceModel(program, memory, case.registers, case.status_register)
+            executed = reference.run(4 * len(program) + 16)
+        except Exception:
+            return False, None
+        if not reference.halted or reference.upp_words > MAX_UPP_WORDS:
+            return False, None
+
+        self._load(program, memory, case)
+        try:
+            self._emulator.run(self._mode, TICKS_PER_INSTRUCTION * (executed + reference.upp_words), quiet=True)
+        except Exception:
+            pass
+        else:
+            if self._emulator.get_stop_reason() == "halted" and not self._differences(reference, True):
+                return True, None
+        return True, self.first_divergence(case, program, memory, executed)
+
+    def first_divergence(self, case: FuzzCase, program, memory: Dict[int, int], executed: int) -> dict:
+        reference = ReferenceModel(program, memory, case.registers, case.status_register)
+        self._load(program, memory, case)
+        for step in range(executed):
+            address = reference.instruction_counter
+            instruction, _ = disassemble(reference.memory, address)
+            divergence = {"step": step, "address": address, "opcode": reference.memory[address & 0xFFFF] >> 8, "instruction": instruction,
+                          "error": None, "differences": []}
+            upp_words = reference.upp_words
+            reference.step()
+            try:
+                halted = self._step_emulator(TICKS_PER_INSTRUCTION * (1 + reference.upp_words - upp_words))
+            except Exception as e:
+                divergence["error"] = "{}: {}".format(type(e).__name__, e)
+                return divergence
+            divergence["differences"] = self._differences(reference, halted)
+            if divergence["differences"]:
+                return divergence
+        # The micro-instructions agree one by one, so the run mode of the emulator itself differs
+        return {"step": None, "address": None, "opcode": None, "instruction": None, "error": None,
+                "differences": ["only the {} run differs from the reference model".format(self._mode.name)]}
+
+    def _step_emulator(self, ticks: int) -> bool:
+        '''Runs the emulator to the next fetch, whether it halted instead.'''
+        emulator = self._emulator
+        decoded_micro_program = emulator.get_decoded_micro_program()
+        for _ in range(ticks):
+            emulator.run(EmulatorRunModes.RUN, 1, quiet=True)
+            mic = emulator.get_mic()
+            if mic == 0:
+                return False
+            if mic in decoded_micro_program and decoded_micro_program[mic].halt:
+                return True
+        raise Exception("Fuzzer: no fetch within {} ticks".format(ticks))
+
+    def _differences(self, reference: ReferenceModel, halted: bool) -> List[str]:
+        emulator = self._emulator
+        differences = []
+        if halted != reference.halted:
+            differences.append("halted: expected {}, got {}".format(reference.halted, halted))
+        instruction_counter = emulator.get_instruction_counter()
+        if instruction_counter != reference.instruction_counter:
+            differences.append("IC: expected 0x{:04X}, got 0x{:04X}".format(reference.instruction_counter, instruction_counter))
+        for register, (expected, value) in enumerate(zip(reference.registers, emulator.get_registers())):
+            if expected != value:
+                differences.append("r{}: expected 0x{:04X}, got 0x{:04X}".format(register, expected, value))
+        flags = emulator.get_status_register() & 0b0101
+        if flags != reference.flags():
+            differences.append("flags C, Z: expected {}, {}, got {}, {}".format(reference.flags() >> 2, reference.flags() & 1, flags >> 2, flags & 1))
+        words = emulator.get_memory_words()
+        if words != reference.memory:
+            changed = [address for address in range(len(reference.memory)) if words[address] != reference.memory[address]]
+            differences += ["memory[0x{:04X}]: expected 0x{:04X}, got 0x{:04X}".format(address, reference.memory[address], words[address])
+                            for address in changed[:8]]
+            if len(changed) > 8:
+                differences.append("{} more memory words".format(len(changed) - 8))
+        return differences
+
+    def diverges(self, case: FuzzCase) -> bool:
+        return self.check(case)[1] is not None
+
+    def minimize(self, case: FuzzCase) -> FuzzCase:
+        '''
+        Drops halves, quarters and so on of the lines while the case still diverges, then the data words, then zeroes
+        the registers and the flags. Labels of dropped lines move to the next line, the last one is never dropped, and
+        the labels which no jump uses any more go away.
+        '''
+        lines = list(case.lines)
+        chunk = max(1, (len(lines) - 1) // 2)
+        while True:
+            start = 0
+            while start < len(lines) - 1:
+                end = min(start + chunk, len(lines) - 1)
+                moved = tuple(label for labels, _ in lines[start:end] for label in labels) + lines[end][0]
+                candidate = lines[:start] + [(moved, lines[end][1])] + lines[end + 1:]
+                if self.diverges(case._replace(lines=tuple(candidate))):
+                    lines = candidate
+                else:
+                    start += 1
+            if chunk == 1:
+                break
+            chunk //= 2
+        operands = {operand for _, instruction in lines for operand in instruction.split()[1:]}
+        case = case._replace(lines=tuple((tuple(label for label in labels if label in operands), instruction)
+                                         for labels, instruction in lines))
+
+        addresses = sorted(case.memory)
+        for address in addresses:
+            memory = dict(case.memory)
+            del memory[address]
+            if self.diverges(case._replace(memory=memory)):
+                case = case._replace(memory=memory)
+        for register in range(16):
+            if case.registers[register]:
+                registers = case.registers[:register] + (0,) + case.registers[register + 1:]
+                if self.diverges(case._replace(registers=registers)):
+                    case = case._replace(registers=registers)
+        if case.status_register and self.diverges(case._replace(status_register=0)):
+            case = case._replace(status_register=0)
+        return case
+
+
+_checker: Optional[DifferentialChecker] = None
+
+
+def _init_worker(microcode_module: str, mode: str):
+    global _checker
+    module = importlib.import_module(microcode_module)
+    _checker = DifferentialChecker(module.micro_macro_mapping_PROM, module.micro_program_memory, EmulatorRunModes[mode])
+
+
+def _check_chunk(seed: int, start: int, count: int, length: int, minimize: bool) -> Tuple[int, int, List[dict]]:
+    '''Checked and skipped cases and the divergences of the cases start..start + count.'''
+    checked = skipped = 0
+    divergences = []
+    for index in range(start, start + count):
+        case = generate_case(case_seed(seed, index), length)
+        valid, divergence = _checker.check(case)
+        checked += 1
+        skipped += not valid
+        if divergence is not None:
+            if minimize:
+                case = _checker.minimize(case)
+                divergence = _checker.check(case)[1]
+            divergences.append({"index": index, "case": case.to_dict(), "source": case.source(), "divergence": divergence})
+    return checked, skipped, divergences
+
+
+class Fuzzer:
+    def __init__(self, microcode_module: str = "MicroProgram", mode: str = "TRANSLATED", workers: Optional[int] = None,
+                 length: int = 32, minimize: bool = True):
+        self._microcode_module = microcode_module
+        self._mode = mode
+        self._workers = workers
+        self._length = length
+        self._minimize = minimize
+        self.checked = 0
+        self.skipped = 0
+
+    def run(self, seed: int, programs: int, max_divergences: Optional[int] = None) -> Iterator[dict]:
+        '''Yields the divergences as the chunks of cases finish, the counts so far are kept in checked and skipped.'''
+        found = 0
+        with ProcessPoolExecutor(max_workers=self._workers, initializer=_init_worker,
+                                 initargs=(self._microcode_module, self._mode)) as executor:
+            futures = [executor.submit(_check_chunk, seed, start, min(CHUNK_SIZE, programs - start), self._length, self._minimize)
+                       for start in range(0, programs, CHUNK_SIZE)]
+            try:
+                for future in as_completed(futures):
+                    checked, skipped, divergences = future.result()
+                    self.checked += checked
+                    self.skipped += skipped
+                    for divergence in divergences:
+                        yield divergence
+                        found += 1
+                        if max_divergences is not None and found >= max_divergences:
+                            return
+            finally:
+                for future in futures:
+                    future.cancel()
+
+
+def corpus_key(divergence: dict) -> str:
+    '''Divergences of the same macro-instruction are taken as the same bug, the corpus keeps one case per key.'''
+    opcode = divergence["divergence"]["opcode"]
+    return "run_mode" if opcode is None else OPCODE_NAMES.get(opcode, "0x{:02X}".format(opcode)).lower()
+
+
+def store_in_corpus(directory: str, divergence: dict) -> Optional[str]:
+    '''Stores the divergence unless the corpus has a case of the same key with at most as many lines.'''
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, corpus_key(divergence) + ".json")
+    try:
+        with open(path, "r") as f:
+            if len(json.load(f)["case"]["lines"]) <= len(divergence["case"]["lines"]):
+                return None
+    except (OSError, ValueError, KeyError):
+        pass
+    with open(path + ".tmp", "w") as f:
+        json.dump(divergence, f, indent=2)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def format_divergence(divergence: dict) -> str:
+    details = divergence["divergence"]
+    if details["step"] is None:
+        header = "Case {}: {}".format(divergence["case"]["seed"], details["differences"][0])
+    else:
+        header = "Case {}: macro-instruction {} at 0x{:04X}: {}".format(divergence["case"]["seed"], details["step"], details["address"],
+                                                                       details["instruction"])
+        if details["error"] is not None:
+            header += "\n    " + details["error"]
+        header += "".join("\n    " + difference for difference in details["differences"])
+    return header + "\n" + "".join("    | " + line + "\n" for line in divergence["source"].splitlines())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Differential fuzzing of a micro-program against the reference model")
+    parser.add_argument("-m", "--microcode", default="MicroProgram", help="module with micro_program_memory and micro_macro_mapping_PROM")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="number of worker processes (default: CPU count)")
+    parser.add_argument("--mode", default="TRANSLATED", choices=[mode.name for mode in EmulatorRunModes if mode.name not in ("DEBUG", "FULL_DEBUG")])
+    parser.add_argument("--seed", type=int, default=0, help="seed of the cases, case i of a seed is always the same")
+    parser.add_argument("--programs", type=int, default=10000, help="number of cases")
+    parser.add_argument("--length", type=int, default=32, help="lines of every generated program")
+    parser.add_argument("--max-divergences", type=int, default=None, help="stop after this many divergences")
+    parser.add_argument("--no-minimize", action="store_true", help="report the diverging cases as generated")
+    parser.add_argument("--corpus", default=CORPUS_DIRECTORY, help="directory with the smallest case of every diverging instruction")
+    parser.add_argument("--replay", default=None, metavar="CASE", help="check a case of the corpus again instead of fuzzing")
+    args = parser.parse_args()
+
+    if args.replay is not None:
+        with open(args.replay, "r") as f:
+            case = FuzzCase.from_dict(json.load(f)["case"])
+        _init_worker(args.microcode, args.mode)
+        _, divergence = _checker.check(case)
+        if divergence is None:
+            print("The models agree")
+        else:
+            print(format_divergence({"case": case.to_dict(), "source": case.source(), "divergence": divergence}), end="")
+        exit(0 if divergence is None else 1)
+
+    fuzzer = Fuzzer(args.microcode, args.mode, args.workers, args.length, not args.no_minimize)
+    start = time.perf_counter()
+    found = 0
+    for divergence in fuzzer.run(args.seed, args.programs, args.max_divergences):
+        found += 1
+        # Only the divergences which enter the corpus are printed, the others repeat a known one
+        path = store_in_corpus(args.corpus, divergence)
+        if path is not None:
+            print(format_divergence(divergence), end="")
+            print("    stored in {}".format(path))
+    elapsed = time.perf_counter() - start
+    print("Checked {} cases ({} skipped) in {:.1f} s, {:.0f} cases/s, {} divergences".format(
+        fuzzer.checked, fuzzer.skipped, elapsed, fuzzer.checked / elapsed if elapsed else 0, found))
+    exit(1 if found else 0)
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+
+import argparse
+import importlib.util
+import os
+import runpy
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence, Set, Tuple
+
+from Assembler import IncrementalAssembler
+from Emulator import Emulator, EmulatorRunModes
+from MIInstruction import DecodedMicroInstruction
+
+'''
+Watch mode for working on a micro-program and the programs which exercise it. The micro-program and the programs
+stay loaded in one process, when a file changes only the changed micro-words and PROM entries are decoded, compiled
+and translated again and only the changed lines of a program are assembled again. The programs the edit can affect
+run again from the snapshot taken after they were loaded, the others keep their last result.
+
+    python LiveSession.py -m MicroProgram programms/test1.prd programms/test3.prd
+
+In a Python shell the same session is driven by calling reload() after saving the files.
+'''
+
+POLL_INTERVAL = 0.2
+
+
+def module_path(module: str) -> str:
+    spec = importlib.util.find_spec(module)
+    if spec is None or spec.origin is None:
+        raise Exception("LiveSession: module {} not found".format(module))
+    return spec.origin
+
+
+def load_micro_program(path: str) -> Tuple[Dict[int, int], Dict[int, int]]:
+    '''Executes the micro-program module from its source, not from the import cache, returns the PROM and the micro-words.'''
+    namespace = runpy.run_path(path)
+    return namespace["micro_macro_mapping_PROM"], namespace["micro_program_memory"]
+
+
+def reachable_micro_addresses(micro_macro_mapping_PROM: Dict[int, int], decoded_micro_program: Dict[int, DecodedMicroInstruction],
+                              opcodes: Set[int]) -> Set[int]:
+    '''
+    Micro addresses a program made of the opcodes can reach from the micro address 0, over both branches of the
+    conditional instructions and JMAP to the PROM entries of the opcodes. A return goes to an address pushed before,
+    which was reached as a successor of the push. The halt words and the missing words reached are included too, as
+    editing them changes the run.
+    '''
+    entries = [0] + [micro_macro_mapping_PROM[opcode] for opcode in opcodes if opcode in micro_macro_mapping_PROM]
+    reached: Set[int] = set()
+    pending = list(entries)
+    while pending:
+        address = pending.pop()
+        if address in reached:
+            continue
+        reached.add(address)
+        mi = decoded_micro_program.get(address)
+        if mi is None or mi.halt or mi.ic_error:
+            continue
+        instruction = mi.controller_instruction
+        if instruction == 0b0000: # JZ
+            pending.append(0)
+        elif instruction == 0b0010: # JMAP
+            pending += entries
+        elif instruction in (0b0001, 0b0011, 0b0100, 0b1011): # CJS, CJP, PUSH, CJPP
+            pending += [address + 1, mi.bar]
+        elif instruction in (0b1010, 0b1110): # CRTN, CONT
+            pending.append(address + 1)
+    return reached
+
+
+class RunResult(NamedTuple):
+    path: str
+    stop_reason: str
+    ticks: Optional[int]
+    registers: List[int]
+    macro_status: int
+    seconds: float
+
+    def __str__(self):
+        name = os.path.basename(self.path)
+        if self.ticks is None:
+            return "{}: failed after {:.1f} ms: {}".format(name, 1000 * self.seconds, self.stop_reason)
+        return "{}: {} after {} ticks in {:.1f} ms, status {:04b}, registers {}".format(
+            name, self.stop_reason, self.ticks, 1000 * self.seconds, self.macro_status,
+            " ".join("{:04X}".format(register) for register in self.registers))
+
+
+class LiveProgram:
+    def __init__(self, path: str, assembler: IncrementalAssembler, snapshot: bytes):
+        self.path = path
+        self.assembler = assembler
+        # The machine right after the program and its memory were loaded, every run starts from it
+        self.snapshot = snapshot
+
+    def opcodes(self) -> Set[int]:
+        '''Every word of the program counts, a jump may land on a constant.'''
+        return {word >> 8 for word in self.assembler.program}
+
+
+class LiveSession:
+    '''
+    One emulator shared by all programs, so the compiled micro-words and the translated blocks survive both the
+    runs and the edits. A program is affected by an edit of the micro-program when a changed PROM entry belongs to
+    one of its opcodes or when it can reach a changed micro-word, see reachable_micro_addresses.
+    '''
+    def __init__(self, micro_program_path: str, program_paths: Sequence[str], mode: EmulatorRunModes = EmulatorRunModes.TRANSLATED,
+                 instructions_limit: int = 1000000):
+        self._micro_program_path = micro_program_path
+        self._mode = mode
+        self._instructions_limit = instructions_limit
+        self._modified: Dict[str, int] = {}
+        self._modified_since(micro_program_path)
+        micro_macro_mapping_PROM, micro_program_memory = load_micro_program(micro_program_path)
+        self._emulator = Emulator(micro_macro_mapping_PROM, micro_program_memory)
+        # The state of a machine nothing was loaded into yet
+        self._reset_snapshot = self._emulator.snapshot()
+        self._programs: Dict[str, LiveProgram] = {path: self._load(path) for path in program_paths}
+        # Programs affected by the edits applied so far which did not run again yet
+        self._pending: Set[str] = set(self._programs)
+        self.results: Dict[str, RunResult] = {}
+
+    def _modified_since(self, path: str) -> bool:
+        '''True when the file changed since the last call, a file replaced by the editor right now counts later.'''
+        try:
+            modified = os.stat(path).st_mtime_ns
+        except OSError:
+            return False
+        changed = self._modified.get(path) != modified
+        self._modified[path] = modified
+        return changed
+
+    def _load(self, path: str) -> LiveProgram:
+        self._modified_since(path)
+        with open(path, "r") as f:
+            assembler = IncrementalAssembler(f.read())
+        emulator = self._emulator
+        emulator.restore(self._reset_snapshot)
+        emulator.init_memory(assembler.memory)
+        emulator.insert_program(assembler.program)
+        return LiveProgram(path, assembler, emulator.snapshot())
+
+    def reload(self) -> List[RunResult]:
+        '''
+        Applies the edits saved since the last call and runs the programs they affect again, returns their results.
+        When a file does not load, the exception propagates and the edits applied before it run on the next call.
+        '''
+        emulator = self._emulator
+        if self._modified_since(self._micro_program_path):
+            micro_macro_mapping_PROM, micro_program_memory = load_micro_program(self._micro_program_path)
+            addresses = emulator.update_micro_program(micro_program_memory)
+            opcodes = emulator.update_micro_macro_mapping_PROM(micro_macro_mapping_PROM)
+            for path, program in self._programs.items():
+                program_opcodes = program.opcodes()
+                if not opcodes.isdisjoint(program_opcodes) or not addresses.isdisjoint(reachable_micro_addresses(
+                        emulator.get_micro_macro_mapping_PROM(), emulator.get_decoded_micro_program(), program_opcodes)):
+                    self._pending.add(path)
+        for path, program in self._programs.items():
+            if not self._modified_since(path):
+                continue
+            with open(path, "r") as f:
+                changes = program.assembler.update(f.read())
+            if changes:
+                emulator.restore(program.snapshot)
+                for address, value in changes.items():
+                    if value is None:
+                        emulator.clear_memory_value(address)
+                    else:
+                        emulator.set_memory_value(address, value)
+                emulator.set_program_length(len(program.assembler.program))
+                program.snapshot = emulator.snapshot()
+                self._pending.add(path)
+        results = [self.run(path) for path in self._programs if path in self._pending]
+        self._pending.clear()
+        return results
+
+    def run(self, path: str) -> RunResult:
+        emulator = self._emulator
+        emulator.restore(self._programs[path].snapshot)
+        start = time.perf_counter()
+        try:
+            _, ticks = emulator.run(self._mode, self._instructions_limit, quiet=True)
+            stop_reason = emulator.get_stop_reason()
+        except Exception as e:
+            ticks, stop_reason = None, str(e)
+        result = RunResult(path, stop_reason, ticks, emulator.get_registers(), emulator.get_status_register(), time.perf_counter() - start)
+        self.results[path] = result
+        return result
+
+    def watch(self, interval: float = POLL_INTERVAL):
+        '''Runs every program, then polls the files and prints the results of the affected programs after every edit.'''
+        for result in self.reload():
+            print(result)
+        while True:
+            time.sleep(interval)
+            start = time.perf_counter()
+            try:
+                results = self.reload()
+            except Exception as e:
+                print("Reload failed: {}".format(e))
+                continue
+            if results:
+                for result in results:
+                    print(result)
+                print("Reloaded in {:.1f} ms".format(1000 * (time.perf_counter() - start)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run programs again whenever they or the micro-program change")
+    parser.add_argument("programs", nargs="+", help=".prd files")
+    parser.add_argument("-m", "--microcode", default="MicroProgram", help="module with micro_program_memory and micro_macro_mapping_PROM")
+    parser.add_argument("--mode", default="TRANSLATED", choices=[mode.name for mode in EmulatorRunModes if mode.name not in ("DEBUG", "FULL_DEBUG")])
+    parser.add_argument("--limit", type=int, default=1000000, help="micro-instructions per run")
+    parser.add_argument("--interval", type=float, default=POLL_INTERVAL, help="seconds between checks of the files")
+    args = parser.parse_args()
+
+    try:
+        session = LiveSession(module_path(args.microcode), args.programs, EmulatorRunModes[args.mode], args.limit)
+        session.watch(args.interval)
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        print(e)
+        exit(1)
@@ -1,4 +1,5 @@
-from tabulate import tabulate
+from Renderer import grid
+from typing import Dict
 
 class MicroInstruction:
     def __init__(self, instruction:int):
@@ -63,4 +64,43 @@ class MicroInstruction:
             ["MWE", "IR", "IC", "BAR", "Controller", "CCEN", "SRM", "SRM", "SSCU", "Y_MUX", "B_MUX", "RB_ADDR", "A_MUX", "RA_ADDR", "ALU", "CONSTANT", "K_MUX"],
             [format(self.mwe, "01b"), format(self.ir, "01b"), format(self.ic, "04b"), format(self.bar, "12b"), format(self.controller_instruction, "04b"), format(self.ccen, "01b"), format(self.srM, "01b"), format(self.srm, "01b"), format(self.sscu_instruction, "12b"), format(self.y_mux, "02b"), format(self.b_mux, "01b"), format(self.rb_addr, "04b"), format(self.a_mux, "01b"), format(self.ra_addr, "04b"), format(self.alu_instruction, "12b"), format(self.constant, "16b"), format(self.k_mux, "01b")]
         ]
-        return tabulate(table, headers="firstrow", tablefmt="grid")
\ No newline at end of file
+        return grid(table)
+
+
+HALT_INSTRUCTION = (1 << 75) - 1
+
+
+class DecodedMicroInstruction:
+    __slots__ = ("raw", "halt", "ic_error", "mwe", "ir", "ic", "bar", "controller_instruction", "ccen", "srM", "srm",
+                 "sscu_instruction", "y_mux", "b_mux", "rb_addr", "a_mux", "ra_addr", "alu_instruction", "constant", "k_mux")
+
+    def __init__(self, instruction: int):
+        mi = MicroInstruction(instruction)
+        self.raw = instruction
+        self.halt = instruction == HALT_INSTRUCTION
+        self.mwe = mi.mwe
+        self.ir = mi.ir
+        self.ic = mi.ic
+        self.bar = mi.bar
+        self.controller_instruction = mi.controller_instruction
+        self.ccen = mi.ccen
+        self.srM = mi.srM
+        self.srm = mi.srm
+        self.sscu_instruction = mi.sscu_instruction
+        self.y_mux = mi.y_mux
+        self.b_mux = mi.b_mux
+        self.rb_addr = mi.rb_addr
+        self.a_mux = mi.a_mux
+        self.ra_addr = mi.ra_addr
+        self.alu_instruction = mi.alu_instruction
+        self.constant = mi.constant
+        self.k_mux = mi.k_mux
+        # IC control bits are one-hot, the check is evaluated once here and raised when the word is executed
+        self.ic_error = not self.halt and bin(self.ic).count("1") > 1
+
+    def __str__(self):
+        return str(MicroInstruction(self.raw))
+
+
+def decode_micro_program(micro_program_memory: Dict[int, int]) -> Dict[int, DecodedMicroInstruction]:
+    return {address: DecodedMicroInstruction(instruction) for address, instruction in micro_program_memory.items()}
@@ -0,0 +1,74 @@
+import struct
+from typing import List
+
+STACK_SIZE = 5
+
+# registers, Q, micro and macro status, mic, stack pointer, stack, IC, IR, address and data bus, last instruction address
+STATE = struct.Struct("<16HHBBHB{}HIHIHi".format(STACK_SIZE))
+
+
+class MachineState:
+    '''
+    The whole state of the machine except the memory, shared by the emulator and its units. The fields are slots,
+    so the units and the generated code reach them without a dictionary, and the return stack has a fixed size
+    storage with a stack pointer, so pushing and popping never allocates. The fields are laid out in the order of
+    STATE, which packs or unpacks them with a single call.
+    '''
+    __slots__ = ("registers", "q", "micro_status", "macro_status", "mic", "stack_pointer", "stack", "instruction_counter",
+                 "instruction_register", "address_bus", "data_bus", "last_instruction_address")
+
+    def __init__(self):
+        self.registers: List[int] = [0] * 16
+        self.q = 0
+        # OVR|C|N|Z
+        self.micro_status = 0
+        self.macro_status = 0
+        self.mic = 0
+        self.stack_pointer = 0
+        self.stack: List[int] = [0] * STACK_SIZE
+        self.instruction_counter = 0
+        self.instruction_register = 0
+        self.address_bus = 0
+        self.data_bus = 0
+        self.last_instruction_address = 0
+
+    def get_stack(self) -> List[int]:
+        return self.stack[:self.stack_pointer]
+
+    def set_stack(self, stack: List[int]):
+        if len(stack) > STACK_SIZE:
+            raise Exception("MachineState: stack of {} entries does not fit into {}".format(len(stack), STACK_SIZE))
+        self.stack = list(stack) + [0] * (STACK_SIZE - len(stack))
+        self.stack_pointer = len(stack)
+
+    def key(self) -> tuple:
+        '''Every field, with the stack only up to its pointer, to compare or hash states.'''
+        return (tuple(self.registers), self.q, self.micro_status, self.macro_status, self.mic, tuple(self.get_stack()),
+                self.instruction_counter, self.instruction_register, self.address_bus, self.data_bus)
+
+    def to_bytes(self) -> bytes:
+        # The entries above the stack pointer are stale, they are stored as 0 so equal states pack equally
+        stack = self.get_stack() + [0] * (STACK_SIZE - self.stack_pointer)
+        return STATE.pack(*self.registers, self.q, self.micro_status, self.macro_status, self.mic, self.stack_pointer, *stack,
+                          self.instruction_counter, self.instruction_register, self.address_bus, self.data_bus,
+                          self.last_instruction_address)
+
+    def load_bytes(self, data: bytes, offset: int = 0) -> int:
+        '''Loads the state packed by to_bytes from data at offset, returns the offset after it.'''
+        fields = STATE.unpack_from(data, offset)
+        self.registers = list(fields[:16])
+        self.q, self.micro_status, self.macro_status, self.mic, self.stack_pointer = fields[16:21]
+        if self.stack_pointer > STACK_SIZE:
+            raise Exception("MachineState: invalid stack pointer {}".format(self.stack_pointer))
+        self.stack = list(fields[21:21 + STACK_SIZE])
+        (self.instruction_counter, self.instruction_register, self.address_bus, self.data_bus,
+         self.last_instruction_address) = fields[21 + STACK_SIZE:]
+        return offset + STATE.size
+
+    def copy(self) -> "MachineState":
+        state = MachineState.__new__(MachineState)
+        for name in MachineState.__slots__:
+            setattr(state, name, getattr(self, name))
+        state.registers = list(self.registers)
+        state.stack = list(self.stack)
+        return state
@@ -0,0 +1,200 @@
+import mmap
+import operator
+import os
+import random
+import sys
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+
+MEMORY_SIZE = 1 << 16
+PAGE_BITS = 8
+PAGE_SIZE = 1 << PAGE_BITS
+PAGE_COUNT = MEMORY_SIZE >> PAGE_BITS
+HASH_MASK = (1 << 64) - 1
+HASH_SEED = 0x4D454D
+# Independent random weights, weights derived from the address by a formula let writes cancel each other out
+HASH_WEIGHTS = array("Q", random.Random(HASH_SEED).randbytes(8 * MEMORY_SIZE))
+# A raw image is the whole memory as little-endian 16-bit words
+IMAGE_SIZE = 2 * MEMORY_SIZE
+
+
+def words_hash(words) -> int:
+    '''The hash of the whole memory given as its 64K words.'''
+    return sum(map(operator.mul, words, HASH_WEIGHTS)) & HASH_MASK
+
+
+class Memory:
+    '''
+    16-bit word addressable memory backed by a flat array. Besides the words it keeps a byte per address which was
+    ever stored to (the keys of the former dict based memory) and a dirty flag per page, so the dict view, the
+    memory dump and the copies only walk the pages which were touched. _hash is the sum of every word weighted by
+    its address, while track_hash is on every write updates it so the memory contents can be compared in constant
+    time. It is None otherwise, so the runs which do not compare the memory do not pay for it.
+    After load_image the words are a copy-on-write view of the mapped image instead of the array.
+    '''
+    def __init__(self):
+        self._words = array("H", bytes(2 * MEMORY_SIZE))
+        self._present = bytearray(MEMORY_SIZE)
+        self._dirty_pages = bytearray(PAGE_COUNT)
+        self._hash: Optional[int] = None
+        self._image: Optional[mmap.mmap] = None
+
+    def track_hash(self, enabled: bool):
+        '''Starts maintaining _hash from the current words or stops it.'''
+        self._hash = words_hash(self._words) if enabled else None
+
+    def clear(self):
+        if self._image is not None:
+            self._release_image()
+        for page in self.dirty_pages():
+            start = page << PAGE_BITS
+            self._words[start:start + PAGE_SIZE] = array("H", bytes(2 * PAGE_SIZE))
+        self._present = bytearray(MEMORY_SIZE)
+        self._dirty_pages = bytearray(PAGE_COUNT)
+        if self._hash is not None:
+            self._hash = 0
+
+    def load(self, memory: Dict[int, int]):
+        self.clear()
+        for address, value in memory.items():
+            self[address] = value
+
+    def load_image(self, path: str):
+        '''
+        Maps a raw image of the whole memory copy-on-write, so nothing is read before it is used and the writes of
+        the run never reach the file. Every word of an image counts as stored to.
+        '''
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size != IMAGE_SIZE:
+                raise Exception("Memory: image {} has {} bytes instead of {}".format(path, size, IMAGE_SIZE))
+            image = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        if self._image is not None:
+            self._release_image()
+        if sys.byteorder == "little":
+            self._words = memoryview(image).cast("H")
+            self._image = image
+        else:
+            self._words = array("H")
+            self._words.frombytes(image)
+            self._words.byteswap()
+            image.close()
+        self._present = bytearray(b"\x01") * MEMORY_SIZE
+        self._dirty_pages = bytearray(b"\x01") * PAGE_COUNT
+        if self._hash is not None:
+            self._hash = words_hash(self._words)
+
+    def _release_image(self):
+        self._words.release()
+        self._image.close()
+        self._image = None
+        self._words = array("H", bytes(2 * MEMORY_SIZE))
+
+    def image_bytes(self) -> bytes:
+        '''The whole memory as a raw image.'''
+        if sys.byteorder == "little":
+            return self._words.tobytes()
+        words = array("H", self._words)
+        words.byteswap()
+        return words.tobytes()
+
+    def write_image(self, path: str):
+        with open(path, "wb") as f:
+            f.write(self.image_bytes())
+
+    def load_words(self, start: int, words: List[int]):
+        end = start + len(words)
+        if start < 0 or end > MEMORY_SIZE:
+            raise Exception("Memory: block 0x{:04X}-0x{:04X} out of range".format(start, end))
+        if end == start:
+            return
+        if isinstance(words, array) and words.typecode == "H" or isinstance(words, memoryview) and words.format == "H":
+            block = words
+        else:
+            block = array("H", [word & 0xFFFF for word in words])
+        if self._hash is not None:
+            self._hash = (self._hash + sum((new - old) * weight for old, new, weight in
+                                           zip(self._words[start:end], block, HASH_WEIGHTS[start:end]))) & HASH_MASK
+        # Through a view, it also takes the views of a mapped object file
+        with memoryview(self._words) as view:
+            view[start:end] = block
+        self._present[start:end] = b"\x01" * (end - start)
+        first_page, last_page = start >> PAGE_BITS, (end - 1) >> PAGE_BITS
+        self._dirty_pages[first_page:last_page + 1] = b"\x01" * (last_page - first_page + 1)
+
+    def get(self, address: int, default: int = 0) -> int:
+        address &= 0xFFFF
+        return self._words[address] if self._present[address] else default
+
+    def __getitem__(self, address: int) -> int:
+        return self._words[address & 0xFFFF]
+
+    def __setitem__(self, address: int, value: int):
+        address &= 0xFFFF
+        value &= 0xFFFF
+        if self._hash is not None:
+            self._hash = (self._hash + (value - self._words[address]) * HASH_WEIGHTS[address]) & HASH_MASK
+        self._words[address] = value
+        self._present[address] = 1
+        self._dirty_pages[address >> PAGE_BITS] = 1
+
+    def discard(self, address: int):
+        '''Clears the word and its present flag, as if it was never stored to.'''
+        address &= 0xFFFF
+        if self._hash is not None:
+            self._hash = (self._hash - self._words[address] * HASH_WEIGHTS[address]) & HASH_MASK
+        self._words[address] = 0
+        self._present[address] = 0
+
+    def __contains__(self, address: int) -> bool:
+        return 0 <= address < MEMORY_SIZE and self._present[address] == 1
+
+    def dirty_pages(self) -> List[int]:
+        return [page for page in range(PAGE_COUNT) if self._dirty_pages[page]]
+
+    def items(self) -> Iterator[Tuple[int, int]]:
+        words, present = self._words, self._present
+        for page in self.dirty_pages():
+            start = page << PAGE_BITS
+            for address in range(start, start + PAGE_SIZE):
+                if present[address]:
+                    yield address, words[address]
+
+    def to_dict(self) -> Dict[int, int]:
+        return dict(self.items())
+
+    def to_bytes(self) -> bytes:
+        '''Page bitmap followed by the words and the stored-to bytes of every dirty page.'''
+        chunks = [bytes(self._dirty_pages)]
+        for page in self.dirty_pages():
+            start = page << PAGE_BITS
+            chunks.append(self._words[start:start + PAGE_SIZE].tobytes())
+            chunks.append(bytes(self._present[start:start + PAGE_SIZE]))
+        return b"".join(chunks)
+
+    def load_bytes(self, data: bytes, offset: int = 0) -> int:
+        '''Loads the memory serialized by to_bytes from data at offset, returns the offset after it.'''
+        self.clear()
+        view = memoryview(data)
+        self._dirty_pages[:] = view[offset:offset + PAGE_COUNT]
+        offset += PAGE_COUNT
+        for page in self.dirty_pages():
+            start = page << PAGE_BITS
+            if offset + 3 * PAGE_SIZE > len(view):
+                raise Exception("Memory: truncated memory image")
+            self._words[start:start + PAGE_SIZE] = array("H", view[offset:offset + 2 * PAGE_SIZE].tobytes())
+            offset += 2 * PAGE_SIZE
+            self._present[start:start + PAGE_SIZE] = view[offset:offset + PAGE_SIZE]
+            offset += PAGE_SIZE
+        if self._hash is not None:
+            self._hash = words_hash(self._words)
+        return offset
+
+    def copy(self) -> "Memory":
+        memory = Memory.__new__(Memory)
+        memory._words = array("H", self._words)
+        memory._present = bytearray(self._present)
+        memory._dirty_pages = bytearray(self._dirty_pages)
+        memory._hash = self._hash
+        memory._image = None
+        return memory
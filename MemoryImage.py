@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+import argparse
+import hashlib
+import mmap
+import struct
+import sys
+from array import array
+from typing import Dict, Optional, Tuple
+
+from Assembler import Assembler
+from Memory import IMAGE_SIZE, MEMORY_SIZE, PAGE_BITS, PAGE_COUNT, Memory
+from ObjectFile import RUN, little_endian_bytes, memory_runs
+
+'''
+Raw memory images and sparse diffs between them. An image is the whole memory as little-endian 16-bit words, a
+diff holds the words which differ from a base image as runs of consecutive words, together with the SHA-256 of
+the base image so it is never applied to another one. Without a base image the base is the zeroed memory.
+
+    python MemoryImage.py compile program.prd data.img      # the memory: section of a program as an image
+    python MemoryImage.py show final.mdiff                   # the changed words
+    python MemoryImage.py apply data.img final.mdiff final.img
+'''
+
+DIFF_MAGIC = b"MPMD"
+DIFF_VERSION = 1
+DIFF_SUFFIX = ".mdiff"
+# magic, version, reserved, SHA-256 of the base image, runs
+DIFF_HEADER = struct.Struct("<4sHH32sI")
+PAGE_BYTES = 2 << PAGE_BITS
+
+
+def compile_image(memory: Dict[int, int]) -> bytes:
+    '''The image of a memory: section, the words it does not set are 0.'''
+    words = array("H", bytes(IMAGE_SIZE))
+    for address, value in memory.items():
+        words[address & 0xFFFF] = value & 0xFFFF
+    return little_endian_bytes(words)
+
+
+def _read_image(path: Optional[str]) -> bytes:
+    if path is None:
+        return bytes(IMAGE_SIZE)
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as image:
+            if len(image) != IMAGE_SIZE:
+                raise Exception("MemoryImage: image {} has {} bytes instead of {}".format(path, len(image), IMAGE_SIZE))
+            return image[:]
+
+
+def diff_images(base: bytes, final: bytes) -> Dict[int, int]:
+    '''The words of final which differ from base, only the pages which differ as a whole are compared word by word.'''
+    changed = {}
+    for page in range(PAGE_COUNT):
+        start = page * PAGE_BYTES
+        if base[start:start + PAGE_BYTES] == final[start:start + PAGE_BYTES]:
+            continue
+        for offset in range(start, start + PAGE_BYTES, 2):
+            if base[offset:offset + 2] != final[offset:offset + 2]:
+                changed[offset >> 1] = final[offset] | final[offset + 1] << 8
+    return changed
+
+
+def diff_bytes(changed: Dict[int, int], base_digest: bytes) -> bytes:
+    runs = memory_runs(changed)
+    chunks = [DIFF_HEADER.pack(DIFF_MAGIC, DIFF_VERSION, 0, base_digest, len(runs))]
+    for start, words in runs:
+        chunks.append(RUN.pack(start, len(words)))
+        chunks.append(little_endian_bytes(words))
+    return b"".join(chunks)
+
+
+def write_diff(path: str, memory: Memory, base_path: Optional[str] = None):
+    '''Writes the words of the memory which differ from the base image.'''
+    base = _read_image(base_path)
+    with open(path, "wb") as f:
+        f.write(diff_bytes(diff_images(base, memory.image_bytes()), hashlib.sha256(base).digest()))
+
+
+def read_diff(path: str) -> Tuple[bytes, Dict[int, int]]:
+    '''The SHA-256 of the base image and the changed words of a diff.'''
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < DIFF_HEADER.size:
+        raise Exception("MemoryImage: truncated diff header")
+    magic, version, _, base_digest, run_count = DIFF_HEADER.unpack_from(data, 0)
+    if magic != DIFF_MAGIC:
+        raise Exception("MemoryImage: not a memory diff")
+    if version != DIFF_VERSION:
+        raise Exception("MemoryImage: unsupported diff version {}".format(version))
+    changed = {}
+    offset = DIFF_HEADER.size
+    for _ in range(run_count):
+        start, length = RUN.unpack_from(data, offset)
+        offset += RUN.size
+        if offset + 2 * length > len(data) or start + length > MEMORY_SIZE:
+            raise Exception("MemoryImage: truncated diff")
+        for i, (value,) in enumerate(struct.iter_unpack("<H", data[offset:offset + 2 * length])):
+            changed[start + i] = value
+        offset += 2 * length
+    return base_digest, changed
+
+
+def apply_diff(base_path: Optional[str], diff_path: str) -> bytes:
+    '''The final image of a diff applied to its base image.'''
+    base = _read_image(base_path)
+    base_digest, changed = read_diff(diff_path)
+    if hashlib.sha256(base).digest() != base_digest:
+        raise Exception("MemoryImage: {} is not the base image of {}".format(base_path or "the zeroed memory", diff_path))
+    final = bytearray(base)
+    for address, value in changed.items():
+        final[2 * address] = value & 0xFF
+        final[2 * address + 1] = value >> 8
+    return bytes(final)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory images and diffs")
+    commands = parser.add_subparsers(dest="command", required=True)
+    compile_command = commands.add_parser("compile", help="write the memory: section of a program as an image")
+    compile_command.add_argument("program")
+    compile_command.add_argument("image")
+    show_command = commands.add_parser("show", help="print the changed words of a diff")
+    show_command.add_argument("diff")
+    apply_command = commands.add_parser("apply", help="apply a diff to its base image")
+    apply_command.add_argument("base", help="base image, - for the zeroed memory")
+    apply_command.add_argument("diff")
+    apply_command.add_argument("image")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "compile":
+            _, memory = Assembler.assemble(args.program)
+            with open(args.image, "wb") as f:
+                f.write(compile_image(memory))
+        elif args.command == "show":
+            base_digest, changed = read_diff(args.diff)
+            print("Base image SHA-256: {}".format(base_digest.hex()))
+            for address, value in sorted(changed.items()):
+                print("0x{:04X} ({}): 0x{:04X} ({})".format(address, address, value, value))
+        else:
+            final = apply_diff(None if args.base == "-" else args.base, args.diff)
+            with open(args.image, "wb") as f:
+                f.write(final)
+    except Exception as e:
+        print(e)
+        sys.exit(1)
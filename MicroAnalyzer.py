@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+import argparse
+import importlib
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from Assembler import OPCODE_NAMES
+from ControlUnit import STACK_SIZE
+from MIInstruction import DecodedMicroInstruction, decode_micro_program
+
+CONTROLLER_INSTRUCTIONS = (0b0000, 0b0001, 0b0010, 0b0011, 0b0100, 0b1010, 0b1011, 0b1110)
+SSCU_TESTS = (0b000100, 0b000101, 0b001010, 0b001011, 0b001100, 0b001101)
+HALT_OPCODE = 0xff
+
+# A node of the control flow graph is a micro-address together with the return stack the word is reached with
+Node = Tuple[int, Tuple[int, ...]]
+
+
+class Issue(NamedTuple):
+    severity: str
+    address: Optional[int]
+    message: str
+
+    def __str__(self):
+        where = "" if self.address is None else "0x{:03X}: ".format(self.address)
+        return "{}: {}{}".format(self.severity, where, self.message)
+
+
+class MicroAnalysis(NamedTuple):
+    issues: List[Issue]
+    cfg: Dict[int, Set[int]]
+    reachable: Set[int]
+    unreachable: List[int]
+    max_stack_depth: int
+    fetch_cycles: Tuple[int, Optional[int]]
+    opcode_cycles: Dict[int, Tuple[int, Optional[int]]]
+
+    @property
+    def valid(self) -> bool:
+        return not any(issue.severity == "error" for issue in self.issues)
+
+    def __str__(self):
+        lines = [str(issue) for issue in self.issues]
+        lines.append("Reachable words: {}, unreachable words: {}".format(len(self.reachable), len(self.unreachable)))
+        lines.append("Worst-case stack depth: {}".format(self.max_stack_depth))
+        lines.append("Fetch cycles: {}".format(_cycles(self.fetch_cycles)))
+        for opcode, cycles in sorted(self.opcode_cycles.items()):
+            lines.append("0x{:02X} {:<14} {}".format(opcode, OPCODE_NAMES.get(opcode, ""), _cycles(cycles)))
+        return "\n".join(lines)
+
+
+def _cycles(cycles: Tuple[int, Optional[int]]) -> str:
+    low, high = cycles
+    if high is None:
+        return "{}+ (data dependent loop)".format(low)
+    return str(low) if low == high else "{}-{}".format(low, high)
+
+
+class MicroAnalyzer:
+    '''
+    Checks a micro-program without running it. The control flow graph is explored from the micro-address 0 with the
+    ControlUnit semantics, every node carries the concrete return stack, so CRTN targets, the stack depth and stack
+    over- and underflows are exact. JMAP may lead to the start of any instruction in the PROM. A condition is
+    treated as possibly true and false unless the word fixes it (ccen 0 or a test which always yields 0).
+    Cycle counts of an instruction run from its PROM address to the word which returns to the micro-address 0.
+    '''
+    def __init__(self, micro_macro_mapping_PROM: Dict[int, int], decoded_micro_program: Dict[int, DecodedMicroInstruction]):
+        self._micro_macro_mapping_PROM = micro_macro_mapping_PROM
+        self._decoded_micro_program = decoded_micro_program
+        self._issues: List[Issue] = []
+        self._graph: Dict[Node, List[Node]] = {}
+
+    def analyze(self) -> MicroAnalysis:
+        self._issues = []
+        for address, mi in sorted(self._decoded_micro_program.items()):
+            self._check_fields(address, mi)
+        self._check_prom()
+        self._explore()
+
+        reachable = {address for address, _ in self._graph}
+        cfg: Dict[int, Set[int]] = {}
+        for (address, _), successors in self._graph.items():
+            cfg.setdefault(address, set()).update(successor for successor, _ in successors)
+        unreachable = sorted(address for address, mi in self._decoded_micro_program.items() if address not in reachable and not mi.halt)
+        for address in unreachable:
+            self._issue("warning", address, "word is unreachable")
+
+        jmap_nodes = [node for node in self._graph if self._decoded_micro_program[node[0]].controller_instruction == 0b0010]
+        fetch_cycles = self._path_lengths([(0, ())], self._ends_fetch)
+        opcode_cycles = {}
+        for opcode, target in sorted(self._micro_macro_mapping_PROM.items()):
+            if opcode == HALT_OPCODE or target not in self._decoded_micro_program:
+                continue
+            starts = list({(target, stack) for _, stack in jmap_nodes} & set(self._graph)) or [(target, ())]
+            opcode_cycles[opcode] = self._path_lengths(starts, self._ends_instruction)
+        return MicroAnalysis(self._issues, cfg, reachable, unreachable, max((len(stack) for _, stack in self._graph), default=0),
+                             fetch_cycles, opcode_cycles)
+
+    def _issue(self, severity: str, address: Optional[int], message: str):
+        issue = Issue(severity, address, message)
+        if issue not in self._issues:
+            self._issues.append(issue)
+
+    def _check_fields(self, address: int, mi: DecodedMicroInstruction):
+        if mi.halt:
+            return
+        if not 0 <= address < 1 << 12:
+            self._issue("error", address, "micro-address out of range")
+        if mi.ic_error:
+            self._issue("error", address, "more than 1 instruction counter control bit set (IC 0b{:04b})".format(mi.ic))
+        if mi.alu_instruction >> 6 > 0b011:
+            self._issue("error", address, "unsupported ALU result select 0b{:03b}".format(mi.alu_instruction >> 6))
+        select = (mi.sscu_instruction >> 10) & 0b11
+        if select == 0b11:
+            self._issue("error", address, "SSCU select 0b11")
+        if mi.controller_instruction not in CONTROLLER_INSTRUCTIONS:
+            self._issue("error", address, "invalid controller instruction 0b{:04b}".format(mi.controller_instruction))
+        if mi.ccen and mi.controller_instruction in (0b0001, 0b0011, 0b1010, 0b1011) and (select == 0b00 or (mi.sscu_instruction & 0b111111) not in SSCU_TESTS):
+            self._issue("warning", address, "condition enabled but the SSCU test always yields 0, the word always falls through")
+
+    def _check_prom(self):
+        for opcode, target in sorted(self._micro_macro_mapping_PROM.items()):
+            if opcode == HALT_OPCODE:
+                mi = self._decoded_micro_program.get(target)
+                if mi is None or not mi.halt:
+                    self._issue("error", None, "PROM entry 0xFF does not point to the halt word")
+            elif target == 0:
+                self._issue("warning", None, "PROM entry 0x{:02X} ({}) points to 0x000".format(opcode, OPCODE_NAMES.get(opcode, "?")))
+            elif target not in self._decoded_micro_program:
+                self._issue("error", None, "PROM entry 0x{:02X} points to the missing word 0x{:03X}".format(opcode, target))
+        if HALT_OPCODE not in self._micro_macro_mapping_PROM:
+            self._issue("error", None, "PROM has no entry 0xFF, programs can not halt")
+
+    def _explore(self):
+        self._graph = {}
+        pending: List[Node] = [(0, ())]
+        while pending:
+            node = pending.pop()
+            if node in self._graph:
+                continue
+            address, _ = node
+            mi = self._decoded_micro_program.get(address)
+            if mi is None:
+                self._issue("error", address, "reachable micro-address has no word")
+                self._graph[node] = []
+                continue
+            successors = [] if mi.halt else self._successors(node, mi)
+            self._graph[node] = successors
+            pending += successors
+        # Nodes of missing words are only kept to report them
+        words = self._decoded_micro_program
+        self._graph = {node: [successor for successor in successors if successor[0] in words]
+                       for node, successors in self._graph.items() if node[0] in words}
+
+    def _successors(self, node: Node, mi: DecodedMicroInstruction) -> List[Node]:
+        address, stack = node
+        instruction = mi.controller_instruction
+        select = (mi.sscu_instruction >> 10) & 0b11
+        condition_fixed = mi.ccen == 0 or select == 0b00 or (mi.sscu_instruction & 0b111111) not in SSCU_TESTS
+        falls_through = mi.ccen == 1 and condition_fixed
+        following = (address + 1, stack)
+        if instruction == 0b0000: # JZ
+            return [(0, ())]
+        if instruction == 0b0010: # JMAP
+            return [(0, stack)] + [(target, stack) for opcode, target in sorted(self._micro_macro_mapping_PROM.items())]
+        if instruction == 0b1110: # CONT
+            return [following]
+        if instruction == 0b0100: # PUSH
+            if len(stack) == STACK_SIZE:
+                self._issue("error", address, "stack overflow")
+                return []
+            return [(address + 1, stack + (mi.bar,))]
+        if instruction not in (0b0001, 0b0011, 0b1010, 0b1011):
+            return []
+
+        if instruction == 0b0001: # CJS
+            if len(stack) == STACK_SIZE and not falls_through:
+                self._issue("error", address, "stack overflow")
+                taken = []
+            else:
+                taken = [(mi.bar, stack + (address + 1,))]
+        elif instruction == 0b0011: # CJP
+            taken = [(mi.bar, stack)]
+        elif len(stack) == 0:
+            if not falls_through:
+                self._issue("error", address, "stack underflow")
+            taken = []
+        elif instruction == 0b1010: # CRTN
+            taken = [(stack[-1], stack[:-1])]
+        else: # CJPP
+            taken = [(mi.bar, stack[:-1])]
+
+        if falls_through:
+            return [following]
+        if condition_fixed:
+            return taken
+        return [following] + taken
+
+    def _ends_fetch(self, node: Node, successor: Optional[Node]) -> bool:
+        return self._decoded_micro_program[node[0]].controller_instruction == 0b0010
+
+    def _ends_instruction(self, node: Node, successor: Optional[Node]) -> bool:
+        return successor is None or successor[0] == 0 or self._decoded_micro_program[node[0]].controller_instruction == 0b0010
+
+    def _path_lengths(self, starts: List[Node], ends) -> Tuple[int, Optional[int]]:
+        '''Fewest and most words executed from a start node up to and including an ending word, None when unbounded.'''
+        longest: Dict[Node, Optional[int]] = {}
+        active: Set[Node] = set()
+
+        def most(node: Node) -> Optional[int]:
+            if node in longest:
+                return longest[node]
+            if node in active:
+                return None
+            if self._decoded_micro_program[node[0]].halt:
+                return 0
+            active.add(node)
+            inner = [most(successor) for successor in self._graph.get(node, []) if not ends(node, successor)]
+            active.discard(node)
+            longest[node] = None if None in inner else 1 + max(inner, default=0)
+            return longest[node]
+
+        fewest = None
+        frontier = list(starts)
+        seen = set(frontier)
+        depth = 1
+        while frontier and fewest is None:
+            following = []
+            for node in frontier:
+                successors = self._graph.get(node, [])
+                if self._decoded_micro_program[node[0]].halt:
+                    fewest = depth - 1
+                    break
+                if not successors or any(ends(node, successor) for successor in successors):
+                    fewest = depth
+                    break
+                for successor in successors:
+                    if successor not in seen:
+                        seen.add(successor)
+                        following.append(successor)
+            frontier = following
+            depth += 1
+        highs = [most(start) for start in starts]
+        return fewest or 0, None if None in highs else max(highs, default=0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Statically check a micro-program")
+    parser.add_argument("microcode", nargs="?", default="MicroProgram", help="module with micro_program_memory and micro_macro_mapping_PROM")
+    args = parser.parse_args()
+
+    module = importlib.import_module(args.microcode)
+    analysis = MicroAnalyzer(module.micro_macro_mapping_PROM, decode_micro_program(module.micro_program_memory)).analyze()
+    print(analysis)
+    exit(0 if analysis.valid else 1)
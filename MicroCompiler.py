@@ -0,0 +1,441 @@
+import re
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from MachineState import STACK_SIZE
+from Memory import HASH_MASK, HASH_WEIGHTS
+from MIInstruction import DecodedMicroInstruction
+
+# Names of the machine state used by the generated code, every entry has to be an assignable expression.
+# The generated functions get the MachineState and the Memory, the register file is always accessed through a
+# local variable `regs`.
+ATTRIBUTE_STATE = {
+    "data": "state.data_bus",
+    "address": "state.address_bus",
+    "ic": "state.instruction_counter",
+    "ir": "state.instruction_register",
+    "words": "memory._words",
+    "present": "memory._present",
+    "dirty_pages": "memory._dirty_pages",
+    "memory_hash": "memory._hash",
+    "q": "state.q",
+    "micro": "state.micro_status",
+    "macro": "state.macro_status",
+    "stack": "state.stack",
+    "stack_pointer": "state.stack_pointer",
+}
+
+# Translated blocks keep the state they touch in local variables of the same names and write it back when they exit
+LOCAL_STATE = {name: name for name in ATTRIBUTE_STATE}
+
+
+ALU_OPERATIONS = {
+    0b000: "{R} + {S} + {C}",        # ADD
+    0b001: "{S} - {R} - {C}",        # SUBR
+    0b010: "{R} - {S} - {C}",        # SUBS
+    0b011: "{R} | {S}",              # OR
+    0b100: "{R} & {S}",              # AND
+    0b101: "({R} ^ 0xFFFF) & {S}",   # NOTRS
+    0b110: "{R} ^ {S}",              # EXOR
+    0b111: "({R} ^ {S}) ^ 0xFFFF",   # EXNOR
+}
+
+# Expression which is true when the SSCU test result is 0 (the controller condition fails), {s} is the status source
+SSCU_CONDITIONS = {
+    0b000100: "{s} & 0b0001",
+    0b000101: "not {s} & 0b0001",
+    0b001010: "not {s} & 0b0100",
+    0b001011: "{s} & 0b0100",
+    0b001100: "{s} & 0b0101",
+    0b001101: "not {s} & 0b0101",
+}
+
+CONDITIONAL_INSTRUCTIONS = (0b0001, 0b0011, 0b1010, 0b1011)
+
+
+class MicroCompiler:
+    def __init__(self, micro_macro_mapping_PROM: Dict[int, int], decoded_micro_program: Dict[int, DecodedMicroInstruction]):
+        self._micro_macro_mapping_PROM = micro_macro_mapping_PROM
+        self._decoded_micro_program = decoded_micro_program
+
+    def compile(self, addresses: Optional[Iterable[int]] = None) -> Dict[int, Optional[Callable]]:
+        '''Compiles every word, or only the words at `addresses`, a word does not depend on any other one.'''
+        decoded_micro_program = self._decoded_micro_program
+        if addresses is not None:
+            decoded_micro_program = {address: decoded_micro_program[address] for address in addresses}
+        source = []
+        for address, mi in decoded_micro_program.items():
+            if mi.halt:
+                continue
+            source.append("def _mi_{}(state, memory):".format(address))
+            source.append("    regs = state.registers")
+            source += ["    " + line for line in generate_microinstruction(address, mi, ATTRIBUTE_STATE)]
+            source.append("    return next_mic")
+        namespace = self.namespace()
+        exec(compile("\n".join(source), "<micro-program>", "exec"), namespace)
+        return {address: None if mi.halt else namespace["_mi_{}".format(address)] for address, mi in decoded_micro_program.items()}
+
+    def namespace(self) -> dict:
+        return {"prom": self._micro_macro_mapping_PROM, "STACK_SIZE": STACK_SIZE, "hash_weights": HASH_WEIGHTS}
+
+    def depends_on_ir(self, entry: int) -> bool:
+        return any(_uses_ir(self._decoded_micro_program[address]) for address in self._reachable(entry, None))
+
+    def block_dependencies(self, entry: int, ir: Optional[int]) -> Set[int]:
+        '''Micro addresses the block of compile_block(entry, ir) is built from: its words and the words which follow them.'''
+        reachable = self._reachable(entry, ir)
+        dependencies = set(reachable)
+        for address in reachable:
+            dependencies.update(successor for successor in self._successors(address, self._decoded_micro_program[address], ir)
+                                if successor is not None)
+        return dependencies
+
+    def compile_block(self, entry: int, ir: Optional[int]) -> Callable:
+        '''
+        Fuses every micro-word reachable from `entry` into one function specialized for the instruction register
+        value `ir`. As the block stays valid until the instruction register changes, it covers the execute part of
+        one macro-instruction together with the fetch of the next one. The block stops after a word which loads the
+        instruction register, on a micro address outside of the block and when the tick budget is spent. It returns
+        the number of ticks it took.
+        '''
+        reachable = self._reachable(entry, ir)
+        heads = self._trace_heads(entry, ir, reachable)
+        body = []
+        for index, head in enumerate([entry] + sorted(heads - {entry})):
+            body.append("{} mic == {}:".format("elif" if index else "if", head))
+            body += ["    " + line for line in self._generate_trace(head, ir, heads)]
+        body += ["else:", "    break"]
+        prologue, epilogue = _block_state_transfer(body)
+
+        source = ["def _block(state, memory, budget):"]
+        source += ["    " + line for line in prologue]
+        source += ["    mic = {}".format(entry), "    ticks = 0", "    try:", "        while ticks < budget:"]
+        source += ["            " + line for line in body]
+        source.append("    finally:")
+        source += ["        " + line for line in epilogue]
+        source.append("    return ticks")
+        namespace = self.namespace()
+        exec(compile("\n".join(source), "<block {} ir={}>".format(entry, ir), "exec"), namespace)
+        return namespace["_block"]
+
+    def _generate_trace(self, head: int, ir: Optional[int], heads: Set[int]) -> List[str]:
+        '''Straight-line code of the words following `head` for as long as the next word is statically known.'''
+        lines = []
+        address = head
+        while True:
+            mi = self._decoded_micro_program[address]
+            successors = self._successors(address, mi, ir)
+            following = successors[0] if len(successors) == 1 and not mi.ir else None
+            if following is not None and (following in heads or not self._is_translated(following)):
+                following = None
+            # The memory read at the end of a word is dead when the word inlined after it overwrites the data bus first
+            skip_read = following is not None and not mi.mwe and _ignores_data_bus(self._decoded_micro_program[following])
+            lines += generate_microinstruction(address, mi, LOCAL_STATE, ir, self._micro_macro_mapping_PROM, read_memory=not skip_read)
+            lines.append("ticks += 1")
+            if mi.ir:
+                return lines + ["mic = next_mic", "break"]
+            if following is None:
+                return lines + ["mic = next_mic"]
+            lines += ["mic = {}".format(following), "if ticks == budget: {}break".format("data = words[address & 0xFFFF]; " if skip_read else "")]
+            address = following
+
+    def _trace_heads(self, entry: int, ir: Optional[int], reachable: Set[int]) -> Set[int]:
+        heads = {entry}
+        predecessors: Dict[int, int] = {entry: 1}
+        for address in reachable:
+            mi = self._decoded_micro_program[address]
+            successors = self._successors(address, mi, ir)
+            if mi.controller_instruction == 0b0001: # CJS return address
+                heads.add(address + 1)
+            if mi.controller_instruction == 0b0100: # PUSH
+                heads.add(mi.bar)
+            for successor in successors:
+                predecessors[successor] = predecessors.get(successor, 0) + 1
+                if len(successors) > 1:
+                    heads.add(successor)
+        heads.update(address for address, count in predecessors.items() if count > 1)
+        return {address for address in heads if address in reachable}
+
+    def _is_translated(self, address: int) -> bool:
+        mi = self._decoded_micro_program.get(address)
+        return mi is not None and not mi.halt
+
+    def _reachable(self, entry: int, ir: Optional[int]) -> Set[int]:
+        reachable = set()
+        pending = [entry]
+        while pending:
+            address = pending.pop()
+            mi = self._decoded_micro_program.get(address)
+            if address in reachable or mi is None or mi.halt:
+                continue
+            reachable.add(address)
+            if not mi.ir:
+                pending += [successor for successor in self._successors(address, mi, ir) if successor is not None]
+        return reachable
+
+    def _successors(self, address: int, mi: DecodedMicroInstruction, ir: Optional[int]) -> List[Optional[int]]:
+        '''Statically known next micro addresses of a word, None stands for a target only known at run time.'''
+        instruction = mi.controller_instruction
+        condition = mi.ccen == 1 and ((mi.sscu_instruction >> 10) & 0b11) != 0b00 and (mi.sscu_instruction & 0b111111) in SSCU_CONDITIONS
+        always_fails = mi.ccen == 1 and not condition
+        if mi.ic_error or mi.alu_instruction >> 6 > 0b011 or (mi.sscu_instruction >> 10) & 0b11 == 0b11:
+            return []
+        if instruction == 0b0000: # JZ
+            return [0]
+        if instruction in (0b0100, 0b1110): # PUSH, CONT
+            return [address + 1]
+        if instruction == 0b0010: # JMAP
+            target = _resolve_jmap(ir, self._micro_macro_mapping_PROM) if not mi.ir else None
+            return [target]
+        if instruction in (0b0001, 0b0011, 0b1011): # CJS, CJP, CJPP
+            return [address + 1] if always_fails else [mi.bar] if mi.ccen == 0 else [address + 1, mi.bar]
+        if instruction == 0b1010: # CRTN
+            return [address + 1] if always_fails else [None] if mi.ccen == 0 else [address + 1, None]
+        return []
+
+
+class BlockCache:
+    def __init__(self, compiler: MicroCompiler):
+        self._compiler = compiler
+        # Every (micro address, instruction register) pair seen so far, pairs of blocks which do not depend on the
+        # instruction register share one translation
+        self.blocks: Dict[Tuple[int, int], Callable] = {}
+        self._translations: Dict[Tuple[int, Optional[int]], Callable] = {}
+        self._dependencies: Dict[Tuple[int, Optional[int]], Set[int]] = {}
+        self._depends_on_ir: Dict[int, bool] = {}
+
+    def translate(self, entry: int, ir: int) -> Callable:
+        depends_on_ir = self._depends_on_ir.get(entry)
+        if depends_on_ir is None:
+            depends_on_ir = self._depends_on_ir[entry] = self._compiler.depends_on_ir(entry)
+        key = (entry, ir if depends_on_ir else None)
+        block = self._translations.get(key)
+        if block is None:
+            block = self._translations[key] = self._compiler.compile_block(*key)
+            self._dependencies[key] = self._compiler.block_dependencies(*key)
+        self.blocks[(entry, ir)] = block
+        return block
+
+    def invalidate(self, addresses: Set[int], opcodes: Set[int]) -> int:
+        '''
+        Drops the translations built from a word at one of the micro addresses and the ones specialized for an
+        instruction register with one of the opcodes, whose JMAP target was resolved from the PROM. The other ones
+        are looked up again on their next use. Returns the number of dropped translations.
+        '''
+        stale = [key for key, dependencies in self._dependencies.items()
+                 if not addresses.isdisjoint(dependencies) or (key[1] is not None and (key[1] >> 8) & 0xFF in opcodes)]
+        for key in stale:
+            del self._translations[key]
+            del self._dependencies[key]
+        self.blocks = {}
+        self._depends_on_ir = {}
+        return len(stale)
+
+    def clear(self):
+        self.blocks = {}
+        self._translations = {}
+        self._dependencies = {}
+        self._depends_on_ir = {}
+
+    def __len__(self):
+        return len(self._translations)
+
+
+def generate_microinstruction(address: int, mi: DecodedMicroInstruction, state: Dict[str, str], ir: Optional[int] = None,
+                              prom: Optional[Dict[int, int]] = None, read_memory: bool = True) -> List[str]:
+    '''
+    Emits the statements of one microinstruction in the same order of phases as Emulator.run. The next micro
+    address is left in the `next_mic` variable. When `ir` is given the instruction register is treated as that
+    constant until the word itself loads it, JMAP is then resolved through `prom` at compile time.
+    '''
+    lines = []
+    if mi.ic_error:
+        return ['raise Exception("More than 1 instruction counter control bits were set to 1")']
+
+    # IC
+    if mi.ic == 0b0001:
+        lines.append("{address} = {ic}".format(**state))
+    elif mi.ic == 0b0010:
+        lines.append("{ic} = ({ic} + 1) & 0xFFFF".format(**state))
+    elif mi.ic == 0b0100:
+        lines.append("{data} = {ic}".format(**state))
+
+    # ALU
+    data_select = mi.alu_instruction & 0b111
+    opcode = (mi.alu_instruction >> 3) & 0b111
+    result_select = mi.alu_instruction >> 6
+    if result_select > 0b011:
+        return lines + ['raise Exception("ALU: unsupported result select")']
+
+    status_needed = mi.srM or mi.srm
+    if result_select != 0b000 or mi.y_mux or status_needed:
+        if mi.a_mux:
+            a = str(mi.ra_addr)
+        elif ir is not None:
+            a = str((ir >> 4) & 0b1111)
+        else:
+            a = "(({ir} >> 4) & 0b1111)".format(**state)
+        if mi.b_mux:
+            b = str(mi.rb_addr)
+        elif ir is not None:
+            b = str(ir & 0b1111)
+        else:
+            b = "({ir} & 0b1111)".format(**state)
+        d = str(mi.constant) if mi.k_mux else state["data"]
+        R = "regs[{}]".format(a) if data_select <= 0b001 else "0" if data_select <= 0b100 else d
+        S = state["q"] if data_select in (0b000, 0b010, 0b110) else "regs[{}]".format(b) if data_select in (0b001, 0b011) \
+            else "regs[{}]".format(a) if data_select in (0b100, 0b101) else "0"
+        C = "((({micro}) & 0b0100) >> 2)".format(**state)
+        expression = ALU_OPERATIONS[opcode].format(R=R, S=S, C=C)
+
+        if result_select == 0b010 and mi.y_mux:
+            lines.append("alu_output = regs[{}]".format(a))
+        if status_needed:
+            lines.append("alu_result = {}".format(expression))
+            lines.append("alu_status = (0b1100 if alu_result > 0xFFFF or alu_result < 0 else 0) | (0b0010 if alu_result < 0 else 0)")
+            lines.append("alu_result &= 0xFFFF")
+            lines.append("if alu_result == 0: alu_status |= 0b0001")
+        else:
+            lines.append("alu_result = ({}) & 0xFFFF".format(expression))
+        if result_select == 0b001:
+            lines.append("{q} = alu_result".format(**state))
+        elif result_select != 0b000:
+            lines.append("regs[{}] = alu_result".format(b))
+
+        output = "alu_output" if result_select == 0b010 else "alu_result"
+        if mi.y_mux & 0b01:
+            lines.append("{} = {}".format(state["address"], output))
+        if mi.y_mux & 0b10:
+            lines.append("{} = {}".format(state["data"], output))
+
+    if mi.ic == 0b1000:
+        lines.append("{ic} = {data}".format(**state))
+    # IR
+    if mi.ir:
+        lines.append("{ir} = {data}".format(**state))
+        ir = None
+
+    # SSCU
+    sscu_opcode = mi.sscu_instruction & 0b111111
+    select = (mi.sscu_instruction >> 10) & 0b11
+    if select == 0b11:
+        return lines + ['raise Exception("SSCUnit: select can not be 0b11")']
+    instruction = mi.controller_instruction
+    condition = "True"
+    if mi.ccen == 0:
+        condition = "False"
+    elif select != 0b00 and sscu_opcode in SSCU_CONDITIONS:
+        condition = SSCU_CONDITIONS[sscu_opcode].format(s=state["micro"] if select == 0b10 else state["macro"])
+    if instruction in CONDITIONAL_INSTRUCTIONS and condition not in ("True", "False"):
+        lines.append("condition = {}".format(condition))
+        condition = "condition"
+    if mi.srM:
+        lines.append("{macro} = alu_status".format(**state))
+    if mi.srm:
+        lines.append("{micro} = alu_status".format(**state))
+
+    # Controller
+    if mi.ir:
+        lines.append("opcode = ({ir} >> 8) & 0b11111111".format(**state))
+        lines.append("if opcode not in prom and opcode != 0: raise Exception(f\"Opcode {opcode} is not present in PROM\")")
+    lines += _generate_controller(address, mi, instruction, condition, state, _resolve_jmap(ir, prom))
+
+    # Memory
+    if mi.mwe:
+        lines.append("memory_address = {address} & 0xFFFF".format(**state))
+        lines.append("memory_value = {data} & 0xFFFF".format(**state))
+        lines.append("if {memory_hash} is not None: {memory_hash} = ({memory_hash} + (memory_value - {words}[memory_address]) * hash_weights[memory_address]) & {mask}"
+                     .format(mask=HASH_MASK, **state))
+        lines.append("{words}[memory_address] = memory_value".format(**state))
+        lines.append("{present}[memory_address] = 1".format(**state))
+        lines.append("{dirty_pages}[memory_address >> 8] = 1".format(**state))
+    elif read_memory:
+        lines.append("{data} = {words}[{address} & 0xFFFF]".format(**state))
+    return lines
+
+
+def _generate_controller(address: int, mi: DecodedMicroInstruction, instruction: int, condition: str, state: Dict[str, str],
+                         jmap_target: Optional[int]) -> List[str]:
+    following = address + 1
+    overflow = "if {stack_pointer} == STACK_SIZE: raise Exception(\"ControlUnit: stack overflow\")".format(**state)
+    underflow = "if {stack_pointer} == 0: raise Exception(\"ControlUnit: stack underflow\")".format(**state)
+    push = "{stack}[{stack_pointer}] = {{}}; {stack_pointer} += 1".format(**state)
+    pop = "{stack_pointer} -= 1".format(**state)
+    if instruction == 0b0000: # JZ
+        return ["{stack_pointer} = 0".format(**state), "next_mic = 0"]
+    if instruction == 0b0010: # JMAP
+        if jmap_target is not None:
+            return ["next_mic = {}".format(jmap_target)]
+        # The opcode is checked when the instruction register is loaded, but a restored state brings its own
+        return ["opcode = ({ir} >> 8) & 0b11111111".format(**state),
+                "if opcode not in prom and opcode != 0: raise Exception(f\"Opcode {opcode} is not present in PROM\")",
+                "next_mic = prom[opcode] if opcode != 0 else 0"]
+    if instruction == 0b0100: # PUSH
+        return [overflow, push.format(mi.bar), "next_mic = {}".format(following)]
+    if instruction == 0b1110: # CONT
+        return ["next_mic = {}".format(following)]
+    if instruction not in CONDITIONAL_INSTRUCTIONS:
+        return ["raise Exception(\"ControlUnit: invalid instruction 0b{}\")".format(format(instruction, "04b"))]
+
+    if instruction == 0b0001: # CJS
+        taken = [overflow, push.format(following), "next_mic = {}".format(mi.bar)]
+    elif instruction == 0b0011: # CJP
+        taken = ["next_mic = {}".format(mi.bar)]
+    elif instruction == 0b1010: # CRTN
+        taken = [underflow, pop, "next_mic = {stack}[{stack_pointer}]".format(**state)]
+    else: # CJPP
+        taken = [underflow, pop, "next_mic = {}".format(mi.bar)]
+
+    if condition == "True":
+        return ["next_mic = {}".format(following)]
+    if condition == "False":
+        return taken
+    return ["if {}:".format(condition), "    next_mic = {}".format(following), "else:"] + ["    " + line for line in taken]
+
+
+def _resolve_jmap(ir: Optional[int], prom: Optional[Dict[int, int]]) -> Optional[int]:
+    if ir is None or prom is None:
+        return None
+    opcode = (ir >> 8) & 0b11111111
+    if opcode == 0:
+        return 0
+    return prom.get(opcode)
+
+
+def _uses_ir(mi: DecodedMicroInstruction) -> bool:
+    if mi.controller_instruction == 0b0010 and not mi.ir:
+        return True
+    data_select = mi.alu_instruction & 0b111
+    result_select = mi.alu_instruction >> 6
+    if result_select == 0b000 and not mi.y_mux and not (mi.srM or mi.srm):
+        return False
+    uses_a = data_select in (0b000, 0b001, 0b100, 0b101) or result_select == 0b010
+    uses_b = data_select in (0b001, 0b011) or result_select in (0b010, 0b011)
+    return (uses_a and not mi.a_mux) or (uses_b and not mi.b_mux)
+
+
+def _ignores_data_bus(mi: DecodedMicroInstruction) -> bool:
+    '''True when the word neither reads the incoming data bus value nor can raise an exception.'''
+    instruction = mi.controller_instruction
+    if mi.ic_error or mi.mwe or mi.ir or mi.alu_instruction >> 6 > 0b011 or (mi.sscu_instruction >> 10) & 0b11 == 0b11:
+        return False
+    if instruction not in (0b0000, 0b0010, 0b0011, 0b1110) and not (mi.ccen == 1 and instruction in CONDITIONAL_INSTRUCTIONS
+                                                                    and (mi.sscu_instruction >> 10) & 0b11 == 0b00):
+        return False
+    if mi.ic == 0b0100:
+        return True
+    uses_d = not mi.k_mux and mi.alu_instruction & 0b111 >= 0b101
+    alu_active = mi.alu_instruction >> 6 != 0b000 or mi.y_mux or mi.srM or mi.srm
+    if alu_active and uses_d:
+        return False
+    return bool(mi.y_mux & 0b10) or mi.ic != 0b1000
+
+
+def _block_state_transfer(body: List[str]) -> Tuple[List[str], List[str]]:
+    '''Loads of the state variables used by a block and stores of the ones it assigns.'''
+    text = "\n".join(body)
+    used = [name for name in ATTRIBUTE_STATE if re.search(r"\b{}\b".format(name), text)]
+    assigned = [name for name in used if re.search(r"(^|[:;]) *{} *[+-]?=(?!=)".format(name), text, re.MULTILINE)]
+    prologue = ["{} = {}".format(name, ATTRIBUTE_STATE[name]) for name in used]
+    if "regs[" in text:
+        prologue.append("regs = state.registers")
+    epilogue = ["{} = {}".format(ATTRIBUTE_STATE[name], name) for name in assigned] + ["state.mic = mic"]
+    return prologue, epilogue
@@ -0,0 +1,125 @@
+import hashlib
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Dict, List, Sequence, Tuple
+
+OBJECT_MAGIC = b"MPOB"
+OBJECT_VERSION = 1
+OBJECT_SUFFIX = ".mpo"
+OBJECT_CACHE_DIRECTORY = os.path.join(".emulator_cache", "objects")
+# magic, version, reserved, SHA-256 of the source, program words, memory runs
+HEADER = struct.Struct("<4sHH32sII")
+# start address and length of a run of consecutive memory words, the words follow
+RUN = struct.Struct("<HH")
+
+
+def source_digest(source: bytes) -> bytes:
+    return hashlib.sha256(source).digest()
+
+
+def little_endian_bytes(words: Sequence[int]) -> bytes:
+    block = array("H", words)
+    if sys.byteorder != "little":
+        block.byteswap()
+    return block.tobytes()
+
+
+def memory_runs(memory: Dict[int, int]) -> List[Tuple[int, List[int]]]:
+    runs: List[Tuple[int, List[int]]] = []
+    for address, value in sorted(memory.items()):
+        if runs and runs[-1][0] + len(runs[-1][1]) == address and len(runs[-1][1]) < 0xFFFF:
+            runs[-1][1].append(value & 0xFFFF)
+        else:
+            runs.append((address, [value & 0xFFFF]))
+    return runs
+
+
+def object_bytes(program: Sequence[int], memory: Dict[int, int], digest: bytes) -> bytes:
+    '''Header, the program as little-endian 16-bit words and the memory as runs of consecutive words.'''
+    runs = memory_runs(memory)
+    chunks = [HEADER.pack(OBJECT_MAGIC, OBJECT_VERSION, 0, digest, len(program), len(runs)), little_endian_bytes(program)]
+    for start, words in runs:
+        chunks.append(RUN.pack(start, len(words)))
+        chunks.append(little_endian_bytes(words))
+    return b"".join(chunks)
+
+
+def write_object(path: str, program: Sequence[int], memory: Dict[int, int], digest: bytes):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Written aside and renamed, so parallel runs never map a half written object
+    with open(path + ".tmp", "wb") as f:
+        f.write(object_bytes(program, memory, digest))
+    os.replace(path + ".tmp", path)
+
+
+class ObjectFile:
+    '''
+    An assembled program mapped from disk. `program` and the words of `memory_runs` are views of the mapping, so
+    loading an object copies its words once, straight into the emulator memory. Views of a big-endian host would
+    be byte swapped, there the words are copied into arrays instead.
+    '''
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._views: List[memoryview] = []
+        try:
+            self._parse()
+        except Exception:
+            self.close()
+            raise
+
+    def _parse(self):
+        if len(self._mmap) < HEADER.size:
+            raise Exception("ObjectFile: truncated header")
+        magic, version, _, self.digest, word_count, run_count = HEADER.unpack_from(self._mmap, 0)
+        if magic != OBJECT_MAGIC:
+            raise Exception("ObjectFile: not an object file")
+        if version != OBJECT_VERSION:
+            raise Exception("ObjectFile: unsupported version {}".format(version))
+        offset = HEADER.size
+        self.program = self._words(offset, word_count)
+        offset += 2 * word_count
+        self.memory_runs: List[Tuple[int, Sequence[int]]] = []
+        for _ in range(run_count):
+            if offset + RUN.size > len(self._mmap):
+                raise Exception("ObjectFile: truncated memory run")
+            start, length = RUN.unpack_from(self._mmap, offset)
+            offset += RUN.size
+            self.memory_runs.append((start, self._words(offset, length)))
+            offset += 2 * length
+        if offset != len(self._mmap):
+            raise Exception("ObjectFile: {} trailing bytes".format(len(self._mmap) - offset))
+
+    def _words(self, offset: int, count: int) -> Sequence[int]:
+        if offset + 2 * count > len(self._mmap):
+            raise Exception("ObjectFile: truncated words")
+        view = memoryview(self._mmap)[offset:offset + 2 * count]
+        if sys.byteorder != "little":
+            words = array("H")
+            words.frombytes(view)
+            view.release()
+            words.byteswap()
+            return words
+        words = view.cast("H")
+        self._views += [view, words]
+        return words
+
+    def memory(self) -> Dict[int, int]:
+        return {start + i: value for start, words in self.memory_runs for i, value in enumerate(words)}
+
+    def close(self):
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,137 @@
+import json
+from typing import Dict, List, Mapping, NamedTuple, Optional
+
+from ALU import OPERATION_NAMES
+from MIInstruction import DecodedMicroInstruction
+from Profiler import BRANCH_INSTRUCTIONS, CONTROLLER_NAMES, FETCH, Profiler, opcode_name
+from Renderer import grid
+
+# Events a micro-word causes every time it executes, they only depend on its fields
+EVENTS = ("memory_reads", "memory_writes", "address_bus_loads", "data_bus_loads", "macro_status_updates", "micro_status_updates")
+
+
+def word_events(mi: DecodedMicroInstruction) -> Dict[str, int]:
+    '''
+    Every cycle latches the data bus from the memory unless it writes, so a read is counted only for the cycles
+    which also drive the address bus, that is the cycles which read on purpose.
+    '''
+    address_bus = int(mi.ic == 0b0001) + (mi.y_mux & 0b01)
+    return {
+        "memory_reads": int(not mi.mwe and address_bus > 0),
+        "memory_writes": mi.mwe,
+        "address_bus_loads": address_bus,
+        "data_bus_loads": int(mi.ic == 0b0100) + (mi.y_mux >> 1) + int(not mi.mwe),
+        "macro_status_updates": mi.srM,
+        "micro_status_updates": mi.srm,
+    }
+
+
+def uses_alu(mi: DecodedMicroInstruction) -> bool:
+    '''Every word runs the ALU, its operation only counts when the result is written, put on a bus or sets a status.'''
+    return mi.alu_instruction >> 6 != 0b000 or bool(mi.y_mux) or bool(mi.srM or mi.srm)
+
+
+class TimingModel(NamedTuple):
+    '''Estimated duration of a micro-word: a cycle plus the latencies of its memory accesses and its controller instruction.'''
+    cycle: float = 1.0
+    memory_read: float = 0.0
+    memory_write: float = 0.0
+    controller: Optional[Mapping[str, float]] = None
+
+    def word_time(self, mi: DecodedMicroInstruction) -> float:
+        events = word_events(mi)
+        return (self.cycle + self.memory_read * events["memory_reads"] + self.memory_write * events["memory_writes"] +
+                (self.controller or {}).get(CONTROLLER_NAMES.get(mi.controller_instruction, ""), 0.0))
+
+
+class PerformanceCounters:
+    '''
+    Counters of a profiled run. The profiler only counts how often every micro-address executed for every opcode, the
+    counters multiply those counts with the events every word causes, so they cost nothing beyond the profiled run
+    and the runs without a profiler stay as fast as before. The timing model turns the same counts into an
+    estimated execution time.
+    '''
+    def __init__(self, profiler: Profiler, decoded_micro_program: Dict[int, DecodedMicroInstruction],
+                 timing_model: Optional[TimingModel] = None):
+        self._profiler = profiler
+        self._decoded_micro_program = decoded_micro_program
+        timing_model = timing_model or TimingModel()
+        self._timing_model = timing_model._replace(controller=dict(timing_model.controller or {}))
+        self._rows = profiler.opcode_micro_address_counts()
+
+    def _row_counters(self, counts: Dict[int, int]) -> dict:
+        counters = {event: 0 for event in EVENTS}
+        alu = {}
+        time = 0.0
+        for mic, count in counts.items():
+            mi = self._decoded_micro_program[mic]
+            if mi.halt:
+                continue
+            for event, value in word_events(mi).items():
+                counters[event] += value * count
+            if uses_alu(mi):
+                operation = OPERATION_NAMES[(mi.alu_instruction >> 3) & 0b111]
+                alu[operation] = alu.get(operation, 0) + count
+            time += self._timing_model.word_time(mi) * count
+        counters["cycles"] = sum(counts.values())
+        counters["alu_operations"] = dict(sorted(alu.items()))
+        counters["estimated_time"] = time
+        return counters
+
+    def counters(self) -> dict:
+        total: Dict[int, int] = {}
+        for counts in self._rows.values():
+            for mic, count in counts.items():
+                total[mic] = total.get(mic, 0) + count
+        counters = self._row_counters(total)
+        counters["macro_instructions"] = self._profiler.macro_instructions()
+        taken = not_taken = 0
+        for mic in total:
+            mi = self._decoded_micro_program[mic]
+            if mi.controller_instruction in BRANCH_INSTRUCTIONS and mi.ccen:
+                word_taken, word_not_taken = self._profiler.word_branch_counts(mic)
+                taken += word_taken
+                not_taken += word_not_taken
+        counters["conditional_branches"] = {"taken": taken, "not_taken": not_taken}
+        counters["cpi"] = counters["cycles"] / counters["macro_instructions"] if counters["macro_instructions"] else None
+        return counters
+
+    def opcode_breakdown(self) -> List[dict]:
+        '''
+        A row per opcode and one for FETCH. The execute cycles are the words after the JMAP, the CPI spans the whole
+        instruction from the micro-address 0 on, fetch included.
+        '''
+        rows = []
+        for opcode, counts in sorted(self._rows.items()):
+            row = self._row_counters(counts)
+            if opcode == FETCH:
+                count = counts.get(0, 0)
+                cpi = row["cycles"] / count if count else None
+            else:
+                count, cycles = self._profiler.opcode_counts(opcode)
+                cpi = cycles / count if count else None
+            row.update(opcode=opcode_name(opcode), count=count, cpi=cpi,
+                       execute_cpi=row["cycles"] / count if count else None,
+                       time_per_instruction=row["estimated_time"] / count if count else None)
+            rows.append(row)
+        return rows
+
+    def to_dict(self) -> dict:
+        return {"timing_model": self._timing_model._asdict(), "counters": self.counters(), "opcodes": self.opcode_breakdown()}
+
+    def write_json(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def __str__(self):
+        counters = self.counters()
+        lines = ["{}: {}".format(name, value) for name, value in counters.items()]
+        table = [["Opcode", "Count", "CPI", "Execute CPI", "Reads", "Writes", "Time/instr."]]
+        for row in self.opcode_breakdown():
+            table.append([row["opcode"], row["count"], _number(row["cpi"]), _number(row["execute_cpi"]), row["memory_reads"],
+                          row["memory_writes"], _number(row["time_per_instruction"])])
+        return "\n".join(lines) + "\n" + grid(table)
+
+
+def _number(value: Optional[float]) -> str:
+    return "-" if value is None else "{:.2f}".format(value)
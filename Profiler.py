@@ -0,0 +1,157 @@
+import json
+from array import array
+from typing import Dict, List, Tuple
+
+from Assembler import OPCODE_NAMES
+
+MICRO_ADDRESSES = 1 << 12
+OPCODES = 1 << 8
+FETCH = OPCODES
+CONTROLLER_NAMES = {0b0000: "JZ", 0b0001: "CJS", 0b0010: "JMAP", 0b0011: "CJP", 0b0100: "PUSH", 0b1010: "CRTN", 0b1011: "CJPP", 0b1110: "CONT"}
+BRANCH_INSTRUCTIONS = (0b0001, 0b0011, 0b1010, 0b1011)
+
+
+def opcode_name(opcode: int) -> str:
+    if opcode == FETCH:
+        return "FETCH"
+    return OPCODE_NAMES.get(opcode, "0x{:02X}".format(opcode))
+
+
+class Profiler:
+    '''
+    Collects where the micro-cycles of a run go. A macro-instruction instance starts every time the micro-address 0
+    is executed and takes its opcode from the following JMAP, the words executed before the JMAP are accounted to
+    the FETCH pseudo opcode. All counters live in arrays allocated up front, so recording a tick only bumps indices.
+    '''
+    def __init__(self):
+        self._counts = array("Q", bytes(8 * (OPCODES + 1) * MICRO_ADDRESSES))
+        self._opcode_counts = array("Q", bytes(8 * OPCODES))
+        self._opcode_cycles = array("Q", bytes(8 * OPCODES))
+        self._taken = array("Q", bytes(8 * MICRO_ADDRESSES))
+        self._not_taken = array("Q", bytes(8 * MICRO_ADDRESSES))
+        self._controllers = array("B", bytes(MICRO_ADDRESSES))
+        self._rows = bytearray(OPCODES + 1)
+        self._instance_addresses = array("L")
+        self._instance_opcodes = array("H")
+        self._instance_cycles = array("L")
+        self._stack_high_water = 0
+        self._cycles = 0
+
+        self._row = FETCH * MICRO_ADDRESSES
+        self._rows[FETCH] = 1
+        self._opcode = FETCH
+        self._instance_start = -1
+        self._instance_address = 0
+
+    def record(self, mic: int, mi, cc: int, opcode: int, stack_depth: int, instruction_counter: int):
+        if mic == 0:
+            self._close_instance()
+            self._instance_start = self._cycles
+            self._instance_address = instruction_counter
+            self._opcode = FETCH
+            self._row = FETCH * MICRO_ADDRESSES
+        self._counts[self._row + mic] += 1
+        self._cycles += 1
+
+        instruction = mi.controller_instruction
+        if instruction == 0b0010:
+            self._opcode = opcode
+            self._row = opcode * MICRO_ADDRESSES
+            self._rows[opcode] = 1
+            self._opcode_counts[opcode] += 1
+        elif instruction in BRANCH_INSTRUCTIONS:
+            self._controllers[mic] = instruction
+            if mi.ccen == 1 and cc == 0:
+                self._not_taken[mic] += 1
+            else:
+                self._taken[mic] += 1
+        if stack_depth > self._stack_high_water:
+            self._stack_high_water = stack_depth
+
+    def finish(self):
+        '''Closes the instance executing when the run stopped.'''
+        self._close_instance()
+        self._instance_start = -1
+
+    def _close_instance(self):
+        if self._instance_start < 0:
+            return
+        cycles = self._cycles - self._instance_start
+        self._instance_addresses.append(self._instance_address)
+        self._instance_opcodes.append(self._opcode)
+        self._instance_cycles.append(cycles)
+        if self._opcode != FETCH:
+            self._opcode_cycles[self._opcode] += cycles
+
+    def _used_rows(self) -> List[int]:
+        return [row for row in range(OPCODES + 1) if self._rows[row]]
+
+    def micro_address_counts(self) -> Dict[int, int]:
+        counts = {}
+        for row in self._used_rows():
+            base = row * MICRO_ADDRESSES
+            for mic in range(MICRO_ADDRESSES):
+                if self._counts[base + mic]:
+                    counts[mic] = counts.get(mic, 0) + self._counts[base + mic]
+        return dict(sorted(counts.items()))
+
+    def opcode_micro_address_counts(self) -> Dict[int, Dict[int, int]]:
+        '''Executions of every micro-address per opcode, FETCH included.'''
+        counts = {}
+        for row in self._used_rows():
+            base = row * MICRO_ADDRESSES
+            counts[row] = {mic: self._counts[base + mic] for mic in range(MICRO_ADDRESSES) if self._counts[base + mic]}
+        return counts
+
+    def macro_instructions(self) -> int:
+        return sum(self._opcode_counts)
+
+    def opcode_counts(self, opcode: int) -> Tuple[int, int]:
+        '''Executions of the opcode and the cycles they took, fetch included.'''
+        return self._opcode_counts[opcode], self._opcode_cycles[opcode]
+
+    def word_branch_counts(self, mic: int) -> Tuple[int, int]:
+        '''Taken and not taken executions of the branch at the micro-address.'''
+        return self._taken[mic], self._not_taken[mic]
+
+    def branch_counts(self) -> Dict[str, Dict[str, int]]:
+        branches = {CONTROLLER_NAMES[instruction]: {"taken": 0, "not_taken": 0} for instruction in BRANCH_INSTRUCTIONS}
+        for mic in range(MICRO_ADDRESSES):
+            if self._controllers[mic]:
+                branch = branches[CONTROLLER_NAMES[self._controllers[mic]]]
+                branch["taken"] += self._taken[mic]
+                branch["not_taken"] += self._not_taken[mic]
+        return branches
+
+    def to_dict(self) -> dict:
+        return {
+            "cycles": self._cycles,
+            "micro_addresses": [{"address": mic, "count": count} for mic, count in self.micro_address_counts().items()],
+            "opcodes": [{"opcode": opcode, "name": opcode_name(opcode), "count": self._opcode_counts[opcode], "cycles": self._opcode_cycles[opcode]}
+                        for opcode in range(OPCODES) if self._opcode_counts[opcode]],
+            "instances": [{"address": address, "opcode": opcode_name(opcode), "cycles": cycles}
+                          for address, opcode, cycles in zip(self._instance_addresses, self._instance_opcodes, self._instance_cycles)],
+            "branches": self.branch_counts(),
+            "branch_words": [{"address": mic, "instruction": CONTROLLER_NAMES[self._controllers[mic]], "taken": self._taken[mic], "not_taken": self._not_taken[mic]}
+                             for mic in range(MICRO_ADDRESSES) if self._controllers[mic]],
+            "stack_high_water": self._stack_high_water
+        }
+
+    def folded_stacks(self) -> List[str]:
+        '''Lines of the folded-stack format ("opcode;micro-address count") read by flamegraph.pl and speedscope.'''
+        lines = []
+        for row in self._used_rows():
+            base = row * MICRO_ADDRESSES
+            for mic in range(MICRO_ADDRESSES):
+                count = self._counts[base + mic]
+                if count:
+                    lines.append("{};0x{:03X} {}".format(opcode_name(row), mic, count))
+        return lines
+
+    def write_json(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def write_folded(self, path: str):
+        with open(path, "w") as f:
+            f.write("\n".join(self.folded_stacks()) + "\n")
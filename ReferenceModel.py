@@ -0,0 +1,181 @@
+from array import array
+from typing import Dict, Optional, Sequence, Tuple
+
+from Assembler import HALT_WORD, INSTRUCTIONS, MEMORY_REQUEST, REGISTER
+from Memory import IMAGE_SIZE
+
+'''
+Reference interpreter of the macro-instructions of Assembler.py, independent of any micro-program. Operands are
+"source destination", the instruction word is opcode << 8 | r_a << 4 | r_b and the constant of the 2-word
+instructions follows it.
+
+MOV <r_a> <r_b>      r_b = r_a
+MOV const <r_b>      r_b = const
+MOV [<r_a>] <r_b>    r_b = memory[r_a]
+MOV <r_a> [<r_b>]    memory[r_b] = r_a
+ADD <r_a> <r_b>      r_b = r_b + r_a, sets the flags
+SUB <r_a> <r_b>      r_b = r_b - r_a, sets the flags
+CMP <r_a> <r_b>      flags of r_a - r_b
+XOR <r_a> <r_b>      r_b = r_b ^ r_a, sets the flags
+TEST <r_a> <r_b>     flags of r_a & r_b
+JMP, JZ, JL, JLE     jump to r_b or to the constant: always, when Z, when C, when C or Z
+WTF                  nothing
+UPP <r_a> <r_b>      while r_b: r_b -= 1, the word at r_a + r_b is uppercased when it is a lowercase ASCII letter
+HALT                 0xFF00, stops the machine
+
+The flags are those of the macro status register (OVR|C|N|Z): C is set when the result wrapped around, a carry of
+ADD or a borrow of SUB and CMP, Z when the wrapped result is 0. The instruction counter points after the instruction,
+after the halt word too, and wraps around at 16 bits like every register.
+'''
+
+FLAGS_MASK = 0b0101
+
+# Opcode -> mnemonic, operand kinds and size in words, for disassembling
+FORMS: Dict[int, Tuple[str, Tuple[int, ...], int]] = {opcode: (mnemonic, kinds, size) for mnemonic, forms in INSTRUCTIONS.items()
+                                                       for kinds, (opcode, size, _) in forms.items()}
+
+
+def status(value: int) -> Tuple[int, int]:
+    '''The 16-bit result and the status nibble of an arithmetic or logic result.'''
+    if value < 0:
+        value &= 0xFFFF
+        return value, 0b1110 if value else 0b1111
+    if value > 0xFFFF:
+        value &= 0xFFFF
+        return value, 0b1100 if value else 0b1101
+    return value, 0 if value else 0b0001
+
+
+def disassemble(words: Sequence[int], address: int) -> Tuple[str, int]:
+    '''The text and the size in words of the instruction at the address.'''
+    word = words[address & 0xFFFF]
+    if word == HALT_WORD:
+        return "HALT", 1
+    form = FORMS.get(word >> 8)
+    if form is None:
+        return "0x{:04X}".format(word), 1
+    mnemonic, kinds, size = form
+    # Single register instructions encode it as r_b, the constant comes after the instruction word
+    registers = [(word >> 4) & 0xF, word & 0xF] if len(kinds) == 2 else [word & 0xF]
+    operands = []
+    for kind, register in zip(kinds, registers):
+        if kind == REGISTER:
+            operands.append("r{}".format(register))
+        elif kind == MEMORY_REQUEST:
+            operands.append("[r{}]".format(register))
+        else:
+            operands.append("0x{:04X}".format(words[(address + 1) & 0xFFFF]))
+    return " ".join([mnemonic.upper()] + operands), size
+
+
+class ReferenceModel:
+    def __init__(self, program: Sequence[int], memory: Optional[Dict[int, int]] = None, registers: Optional[Sequence[int]] = None,
+                 status_register: int = 0):
+        '''The memory is loaded first and the program over it at the address 0, like the emulator does.'''
+        self.memory = array("H", bytes(IMAGE_SIZE))
+        for address, value in (memory or {}).items():
+            self.memory[address & 0xFFFF] = value & 0xFFFF
+        self.memory[:len(program)] = array("H", program)
+        self.registers = [register & 0xFFFF for register in registers] if registers is not None else [0] * 16
+        self.status_register = status_register
+        self.instruction_counter = 0
+        self.halted = False
+        # Words walked by UPP so far, the only macro-instruction whose duration depends on the data
+        self.upp_words = 0
+        self._instructions = {
+            0x01: self._mov, 0x02: self._mov_const, 0x03: self._load, 0x04: self._store, 0x05: self._add, 0x06: self._sub,
+            0x07: self._cmp, 0x08: self._xor, 0x09: self._test, 0x0A: self._jump, 0x0B: self._jump_const,
+            0x0C: self._jump, 0x0D: self._jump_const, 0x0E: self._jump, 0x0F: self._jump_const, 0x10: self._jump,
+            0x11: self._jump_const, 0x12: self._wtf, 0x13: self._upp,
+        }
+
+    def step(self) -> int:
+        '''Executes one macro-instruction, returns its address.'''
+        if self.halted:
+            raise Exception("ReferenceModel: the machine is halted")
+        address = self.instruction_counter
+        word = self.memory[address]
+        self.instruction_counter = (address + 1) & 0xFFFF
+        if word == HALT_WORD:
+            self.halted = True
+            return address
+        instruction = self._instructions.get(word >> 8)
+        if instruction is None:
+            raise Exception("ReferenceModel: invalid instruction 0x{:04X} at 0x{:04X}".format(word, address))
+        instruction(word >> 8, (word >> 4) & 0xF, word & 0xF)
+        return address
+
+    def run(self, instructions_limit: int = 1000000) -> int:
+        '''Runs until the halt or the limit, returns the number of executed macro-instructions, the halt included.'''
+        for executed in range(instructions_limit):
+            if self.halted:
+                return executed
+            self.step()
+        return instructions_limit
+
+    def flags(self) -> int:
+        return self.status_register & FLAGS_MASK
+
+    def _condition(self, opcode: int) -> bool:
+        C, Z = (self.status_register >> 2) & 1, self.status_register & 1
+        if opcode <= 0x0B:
+            return True
+        if opcode <= 0x0D:
+            return bool(Z)
+        if opcode <= 0x0F:
+            return bool(C)
+        return bool(C | Z)
+
+    def _constant(self) -> int:
+        value = self.memory[self.instruction_counter]
+        self.instruction_counter = (self.instruction_counter + 1) & 0xFFFF
+        return value
+
+    def _mov(self, opcode: int, a: int, b: int):
+        self.registers[b] = self.registers[a]
+
+    def _mov_const(self, opcode: int, a: int, b: int):
+        self.registers[b] = self._constant()
+
+    def _load(self, opcode: int, a: int, b: int):
+        self.registers[b] = self.memory[self.registers[a]]
+
+    def _store(self, opcode: int, a: int, b: int):
+        self.memory[self.registers[b]] = self.registers[a]
+
+    def _add(self, opcode: int, a: int, b: int):
+        self.registers[b], self.status_register = status(self.registers[b] + self.registers[a])
+
+    def _sub(self, opcode: int, a: int, b: int):
+        self.registers[b], self.status_register = status(self.registers[b] - self.registers[a])
+
+    def _cmp(self, opcode: int, a: int, b: int):
+        _, self.status_register = status(self.registers[a] - self.registers[b])
+
+    def _xor(self, opcode: int, a: int, b: int):
+        self.registers[b], self.status_register = status(self.registers[b] ^ self.registers[a])
+
+    def _test(self, opcode: int, a: int, b: int):
+        _, self.status_register = status(self.registers[a] & self.registers[b])
+
+    def _jump(self, opcode: int, a: int, b: int):
+        if self._condition(opcode):
+            self.instruction_counter = self.registers[b]
+
+    def _jump_const(self, opcode: int, a: int, b: int):
+        target = self._constant()
+        if self._condition(opcode):
+            self.instruction_counter = target
+
+    def _wtf(self, opcode: int, a: int, b: int):
+        pass
+
+    def _upp(self, opcode: int, a: int, b: int):
+        registers, memory = self.registers, self.memory
+        # r_a is read on every word, so UPP rX rX walks its own decremented counter twice
+        while registers[b]:
+            registers[b] -= 1
+            self.upp_words += 1
+            address = (registers[a] + registers[b]) & 0xFFFF
+            if 97 <= memory[address] <= 122:
+                memory[address] -= 32
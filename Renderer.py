@@ -0,0 +1,107 @@
+from typing import Callable, Dict, List, Tuple
+
+from Memory import PAGE_BITS, PAGE_SIZE
+
+_tabulate = None
+
+
+def grid(table: List[List[str]]) -> str:
+    '''tabulate is only imported by the first rendering, runs which never print the state do not pay for it.'''
+    global _tabulate
+    if _tabulate is None:
+        from tabulate import tabulate as _tabulate
+    return _tabulate(table, headers="firstrow", tablefmt="grid")
+
+
+class Renderer:
+    '''
+    Renders the state of an emulator region by region. Every region remembers the state it was rendered from and
+    is only rebuilt when that state changed, the memory table is rebuilt from per-page rows of which only the pages
+    with changed contents are formatted again.
+    '''
+    def __init__(self, emulator):
+        self._emulator = emulator
+        self._regions: Dict[str, Tuple[object, str]] = {}
+        self._pages: Dict[int, Tuple[bytes, List[List[str]]]] = {}
+        self._changed: List[str] = []
+        self._changed_pages: List[int] = []
+
+    def render(self, changed_only: bool = False) -> str:
+        '''
+        With changed_only only the regions which changed since the previous render are returned, of the memory only
+        the pages which changed.
+        '''
+        emulator = self._emulator
+        alu, ssc_unit, control_unit = emulator.get_units()
+        self._changed = []
+        regions = [
+            self._region("alu", (tuple(emulator.get_registers()), emulator.get_q_register()), lambda: str(alu) + "\n"),
+            self._region("sscu", (emulator.get_micro_status_register(), emulator.get_status_register()),
+                         lambda: str(ssc_unit) + "\n"),
+            self._region("control_unit", tuple(emulator.get_cu_stack()), lambda: str(control_unit)),
+            self._region("counters", (emulator.get_instruction_counter(), emulator.get_instruction_register(),
+                                      emulator.get_address_bus(), emulator.get_data_bus()), self._render_counters),
+            self._region("memory", self._memory_key(), self._render_memory)
+        ]
+        if changed_only:
+            return "".join(self._memory_table(self._changed_pages) if name == "memory" else text
+                           for name, text in regions if name in self._changed)
+        return "".join(text for _, text in regions)
+
+    def changed_regions(self) -> List[str]:
+        return list(self._changed)
+
+    def _region(self, name: str, key, render: Callable[[], str]) -> Tuple[str, str]:
+        cached = self._regions.get(name)
+        if cached is None or cached[0] != key:
+            cached = (key, render())
+            self._regions[name] = cached
+            self._changed.append(name)
+        return name, cached[1]
+
+    def _render_counters(self) -> str:
+        emulator = self._emulator
+        instruction_register, address_bus, data_bus = (emulator.get_instruction_register(), emulator.get_address_bus(),
+                                                       emulator.get_data_bus())
+        return "\nInstruction counter: " + str(emulator.get_instruction_counter()) + \
+            "\nInstruction register: 0x{:04X} ({})".format(instruction_register, instruction_register) + \
+            "\nAddress bus: 0x{:04X} ({})".format(address_bus, address_bus) + \
+            "\nData bus: 0x{:04X} ({})".format(data_bus, data_bus)
+
+    def _visible_from(self) -> int:
+        emulator = self._emulator
+        return 0 if emulator.get_run_mode().name == "FULL_DEBUG" else emulator.get_program_length()
+
+    def _page_key(self, words, page: int) -> bytes:
+        start = page << PAGE_BITS
+        return words[start:start + PAGE_SIZE].tobytes()
+
+    def _memory_key(self):
+        emulator = self._emulator
+        words = emulator.get_memory_words()
+        return self._visible_from(), tuple((page, self._page_key(words, page)) for page in emulator.get_memory_pages())
+
+    def _render_memory(self) -> str:
+        words = self._emulator.get_memory_words()
+        visible_from = self._visible_from()
+        pages = {}
+        self._changed_pages = []
+        for page in self._emulator.get_memory_pages():
+            key = self._page_key(words, page) + visible_from.to_bytes(4, "little")
+            cached = self._pages.get(page)
+            if cached is None or cached[0] != key:
+                start = page << PAGE_BITS
+                # The words never stored to are 0, so they are left out with the stored zeros
+                rows = [["0x{:04X} ({})".format(i, i), "0x{:04X} ({})".format(words[i], words[i])]
+                        for i in range(max(start, visible_from), start + PAGE_SIZE) if words[i] != 0]
+                cached = (key, rows)
+                self._changed_pages.append(page)
+            pages[page] = cached
+        self._pages = pages
+        return self._memory_table(list(pages))
+
+    def _memory_table(self, pages: List[int]) -> str:
+        memory_table = [["Address", "Data"]]
+        for page in pages:
+            memory_table.extend(self._pages[page][1])
+        return "\n\n------------ Memory ------------\n" + grid(memory_table) + "\n"
@@ -1,51 +1,55 @@
-from tabulate import tabulate
+from typing import Optional
+
+from MachineState import MachineState
+from Renderer import grid
+
+SSCU_TESTS = {
+    0b000100: lambda C, Z: Z ^ 1,
+    0b000101: lambda C, Z: Z,
+    0b001010: lambda C, Z: C,
+    0b001011: lambda C, Z: C ^ 1,
+    0b001100: lambda C, Z: (C ^ 1) & (Z ^ 1),
+    0b001101: lambda C, Z: C | Z,
+}
+
+# Test result indexed by opcode << 4 | status nibble (OVR|C|N|Z), unknown opcodes yield 0
+CONDITIONS = bytes(SSCU_TESTS[opcode]((status & 0b0100) >> 2, status & 0b0001) if opcode in SSCU_TESTS else 0
+                   for opcode in range(1 << 6) for status in range(1 << 4))
+
 
 class SSCUnit:
-    def __init__(self):
-        # OVR|C|N|Z
-        self._micro_status = 0 
-        self._macro_status = 0
+    def __init__(self, state: Optional[MachineState] = None):
+        # The micro and macro status registers (OVR|C|N|Z) live in the state shared with the other units
+        self._state = state if state is not None else MachineState()
 
     def get_c0(self):
-        return (self._micro_status & 0b0100) >> 2
+        return (self._state.micro_status & 0b0100) >> 2
 
     def run(self, status: int, ce_macro: int, ce_micro: int, instruction: int):
-        res = 0
-        opcode = instruction & 0b111111
+        state = self._state
         select = (instruction >> 10) & 0b11
-
-        if select == 0b11:
+        if select == 0b01:
+            res = CONDITIONS[(instruction & 0b111111) << 4 | state.macro_status & 0b1111]
+        elif select == 0b10:
+            res = CONDITIONS[(instruction & 0b111111) << 4 | state.micro_status & 0b1111]
+        elif select == 0b11:
             raise Exception("SSCUnit: select can not be 0b11")
-        
-        source = self._micro_status if select == 0b10 else self._macro_status if select == 0b01 else None
-        if source is not None:
-            C = (source & 0b0100) >> 2
-            Z = source & 0b0001
-            if opcode == 0b000100:
-                res = Z ^ 1
-            if opcode == 0b000101:
-                res = Z
-            if opcode == 0b001010:
-                res = C
-            if opcode == 0b001011:
-                res = C ^ 1
-            if opcode == 0b001100:
-                res = (C ^ 1) & (Z ^ 1)
-            if opcode == 0b001101:
-                res = C | Z
-        
+        else:
+            res = 0
+
         if ce_macro == 1:
-            self._macro_status = status
+            state.macro_status = status
         if ce_micro == 1:
-            self._micro_status = status
+            state.micro_status = status
 
         return res
     
     def __str__(self):
+        micro, macro = self._state.micro_status, self._state.macro_status
         table = [
             ["","OVR", "C", "N", "Z"],
-            ["Micro status register", "{}".format((self._micro_status & 0b1000) >> 3), "{}".format((self._micro_status & 0b0100) >> 2), "{}".format((self._micro_status & 0b0010) >> 1), "{}".format(self._micro_status & 0b0001)],
-            ["Macro status register", "{}".format((self._macro_status & 0b1000) >> 3), "{}".format((self._macro_status & 0b0100) >> 2), "{}".format((self._macro_status & 0b0010) >> 1), "{}".format(self._macro_status & 0b0001)],
+            ["Micro status register", "{}".format((micro & 0b1000) >> 3), "{}".format((micro & 0b0100) >> 2), "{}".format((micro & 0b0010) >> 1), "{}".format(micro & 0b0001)],
+            ["Macro status register", "{}".format((macro & 0b1000) >> 3), "{}".format((macro & 0b0100) >> 2), "{}".format((macro & 0b0010) >> 1), "{}".format(macro & 0b0001)],
         ]
-        return "------------ Status and Shift Control Unit status ------------\n" + tabulate(table, headers="firstrow", tablefmt="grid") + "\n"
+        return "------------ Status and Shift Control Unit status ------------\n" + grid(table) + "\n"
         
\ No newline at end of file
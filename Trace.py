@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+import argparse
+import struct
+from collections import deque
+from typing import Iterator, NamedTuple, Optional
+
+TRACE_MAGIC = b"MPTR"
+TRACE_VERSION = 1
+HEADER = struct.Struct("<4sHH")
+# tick, micro-address, IR, IC, address bus, data bus, ALU output, ALU status, SSCU test, flags
+RECORD = struct.Struct("<IHHHHHHBBBx")
+
+FLAG_WRITE = 0b01
+FLAG_ERROR = 0b10
+
+
+class TraceRecord(NamedTuple):
+    tick: int
+    mic: int
+    instruction_register: int
+    instruction_counter: int
+    address_bus: int
+    data_bus: int
+    alu_output: int
+    alu_status: int
+    status_test: int
+    flags: int
+
+    def __str__(self):
+        if self.flags & FLAG_ERROR:
+            return "{:>10} 0x{:03X} ERROR".format(self.tick, self.mic)
+        return "{:>10} 0x{:03X} IR=0x{:04X} IC=0x{:04X} A=0x{:04X} D=0x{:04X} Y=0x{:04X} S={:04b} T={} {}".format(
+            self.tick, self.mic, self.instruction_register, self.instruction_counter, self.address_bus, self.data_bus,
+            self.alu_output, self.alu_status, self.status_test, "W" if self.flags & FLAG_WRITE else "R")
+
+
+class TraceWriter:
+    '''Streams one fixed-size record per tick to a file, the records are packed into a buffer flushed when full.'''
+    def __init__(self, path: str, buffered_records: int = 4096):
+        self._file = open(path, "wb")
+        self._file.write(HEADER.pack(TRACE_MAGIC, TRACE_VERSION, RECORD.size))
+        self._buffer = bytearray(RECORD.size * buffered_records)
+        self._capacity = len(self._buffer)
+        self._offset = 0
+        self._last_tick = -1
+
+    def record(self, tick: int, mic: int, ir: int, ic: int, address: int, data: int, alu_output: int, alu_status: int, status_test: int, flags: int):
+        RECORD.pack_into(self._buffer, self._offset, tick, mic, ir & 0xFFFF, ic & 0xFFFF, address & 0xFFFF, data & 0xFFFF,
+                         alu_output & 0xFFFF, alu_status, status_test, flags)
+        self._offset += RECORD.size
+        self._last_tick = tick
+        if self._offset == self._capacity:
+            self.flush()
+
+    def fail(self, mic: int, error: Exception) -> Optional[str]:
+        self.record(self._last_tick + 1, mic, 0, 0, 0, 0, 0, 0, 0, FLAG_ERROR)
+        return None
+
+    def flush(self):
+        self._file.write(memoryview(self._buffer)[:self._offset])
+        self._offset = 0
+
+    def close(self):
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+
+class TraceRingBuffer:
+    '''
+    Keeps the records of the last ticks in memory. When the run raises, the ring is dumped to dump_path (if any)
+    in the trace file format.
+    '''
+    def __init__(self, capacity: int = 65536, dump_path: Optional[str] = None):
+        self._buffer = bytearray(RECORD.size * capacity)
+        self._capacity = len(self._buffer)
+        self._offset = 0
+        self._wrapped = False
+        self._last_tick = -1
+        self._dump_path = dump_path
+
+    def record(self, tick: int, mic: int, ir: int, ic: int, address: int, data: int, alu_output: int, alu_status: int, status_test: int, flags: int):
+        RECORD.pack_into(self._buffer, self._offset, tick, mic, ir & 0xFFFF, ic & 0xFFFF, address & 0xFFFF, data & 0xFFFF,
+                         alu_output & 0xFFFF, alu_status, status_test, flags)
+        self._offset += RECORD.size
+        self._last_tick = tick
+        if self._offset == self._capacity:
+            self._offset = 0
+            self._wrapped = True
+
+    def fail(self, mic: int, error: Exception) -> Optional[str]:
+        '''Records the failed tick and dumps the ring, returns the path of the dump if there is one.'''
+        self.record(self._last_tick + 1, mic, 0, 0, 0, 0, 0, 0, 0, FLAG_ERROR)
+        if self._dump_path is None:
+            return None
+        self.dump(self._dump_path)
+        return self._dump_path
+
+    def dump(self, path: str):
+        with open(path, "wb") as f:
+            f.write(HEADER.pack(TRACE_MAGIC, TRACE_VERSION, RECORD.size))
+            if self._wrapped:
+                f.write(memoryview(self._buffer)[self._offset:])
+            f.write(memoryview(self._buffer)[:self._offset])
+
+    def records(self) -> Iterator[TraceRecord]:
+        if self._wrapped:
+            for record in RECORD.iter_unpack(memoryview(self._buffer)[self._offset:]):
+                yield TraceRecord(*record)
+        for record in RECORD.iter_unpack(memoryview(self._buffer)[:self._offset]):
+            yield TraceRecord(*record)
+
+    def close(self):
+        pass
+
+    def __len__(self):
+        return (self._capacity if self._wrapped else self._offset) // RECORD.size
+
+
+def read_trace(path: str) -> Iterator[TraceRecord]:
+    with open(path, "rb") as f:
+        magic, version, record_size = HEADER.unpack(f.read(HEADER.size))
+        if magic != TRACE_MAGIC or version != TRACE_VERSION or record_size != RECORD.size:
+            raise Exception("Trace: {} is not a trace file of version {}".format(path, TRACE_VERSION))
+        while True:
+            chunk = f.read(RECORD.size * 4096)
+            if not chunk:
+                return
+            for record in RECORD.iter_unpack(chunk[:len(chunk) - len(chunk) % RECORD.size]):
+                yield TraceRecord(*record)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Decode an execution trace of the emulator")
+    parser.add_argument("trace", help="trace file written by TraceWriter or dumped by TraceRingBuffer")
+    parser.add_argument("--mic", type=lambda s: int(s, 0), default=None, help="only records of this micro-address")
+    parser.add_argument("--writes", action="store_true", help="only records which wrote to the memory")
+    parser.add_argument("--tail", type=int, default=None, help="only the last N matching records")
+    args = parser.parse_args()
+
+    records = (record for record in read_trace(args.trace)
+               if (args.mic is None or record.mic == args.mic) and (not args.writes or record.flags & FLAG_WRITE))
+    if args.tail is not None:
+        records = deque(records, maxlen=args.tail)
+    for record in records:
+        print(record)
@@ -0,0 +1,57 @@
+import time
+from typing import Optional, Tuple
+
+
+class Watchdog:
+    '''
+    Stops runs which can not terminate or which take too long. The loop detection hashes the machine state at
+    macro-instruction boundaries and looks for a repeated hash with Brent's algorithm, so it needs constant memory:
+    the state saved at every power of two boundaries is compared with every following one. The memory enters the
+    hash through its incrementally maintained hash, a matching hash is confirmed against the exact state and memory
+    saved with it, so a collision never stops a run. The wall clock is read at most every `clock_interval` checks.
+    One watchdog may watch several consecutive runs of the same machine, like the chunks of a longer run, the ticks
+    of the runs it watched before are kept in `ticks_before`.
+    '''
+    def __init__(self, detect_loops: bool = True, time_limit: Optional[float] = None, clock_interval: int = 64):
+        self._detect_loops = detect_loops
+        self._deadline = None if time_limit is None else time.perf_counter() + time_limit
+        self._time_limit = time_limit
+        self._clock_interval = clock_interval
+        self._checks = 0
+        self._saved: Optional[int] = None
+        # Machine state and memory words of the saved hash
+        self._saved_exact: Optional[Tuple[tuple, bytes]] = None
+        self._saved_tick = 0
+        self._power = 1
+        self._distance = 0
+        self.ticks_before = 0
+        self.reason: Optional[str] = None
+        self.cycle_length: Optional[int] = None
+
+    @property
+    def detects_loops(self) -> bool:
+        return self._detect_loops
+
+    def check(self, emulator, tick: int, boundary: bool = True) -> bool:
+        '''True when the run should stop, the reason is left in `reason`.'''
+        self._checks += 1
+        if self._deadline is not None and self._checks % self._clock_interval == 0 and time.perf_counter() > self._deadline:
+            self.reason = "time limit of {} s exceeded".format(self._time_limit)
+            return True
+        if not self._detect_loops or not boundary:
+            return False
+
+        tick += self.ticks_before
+        key = emulator._state.key()
+        state = hash((key, emulator._memory._hash))
+        if state == self._saved and self._saved_exact == (key, emulator._memory.image_bytes()):
+            self.cycle_length = tick - self._saved_tick
+            self.reason = "non-terminating, cycle length {}".format(self.cycle_length)
+            return True
+        self._distance += 1
+        if self._distance == self._power:
+            self._saved, self._saved_tick = state, tick
+            self._saved_exact = (key, emulator._memory.image_bytes())
+            self._power *= 2
+            self._distance = 0
+        return False
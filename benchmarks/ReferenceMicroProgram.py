@@ -0,0 +1,80 @@
+from typing import Dict
+
+'''
+Reference micro-program implementing all 19 macro-instructions of Assembler.py, used by the benchmarks.
+
+Operands are "source destination": MOV ra rb copies ra to rb, ADD/SUB/XOR store to rb and set the macro
+status register, CMP and TEST only set it. JL tests C (borrow of CMP), JZ tests Z, JLE tests C or Z.
+UPP ra rb uppercases the bytes 97..122 of the rb words starting at ra, rb ends as 0 and Q is clobbered.
+WTF does nothing, but goes through 5 nested CJS/CRTN micro-subroutines to exercise the return stack.
+'''
+
+
+# controller
+JZ, CJS, JMAP, CJP, PUSH, CRTN, CJPP, CONT = 0b0000, 0b0001, 0b0010, 0b0011, 0b0100, 0b1010, 0b1011, 0b1110
+# alu sources
+AQ, AB, ZQ, ZB, ZA, DA, DQ, DZ = range(8)
+ADD, SUBR, SUBS, OR, AND, NOTRS, EXOR, EXNOR = range(8)
+NONE, QREG, RAMA, RAMF = range(4)
+MACRO, MICRO = 0b01, 0b10
+T_NZ, T_Z, T_C, T_NC, T_A, T_BE = 0b000100, 0b000101, 0b001010, 0b001011, 0b001100, 0b001101
+
+
+def word(mwe=0, ir=0, ic=0, bar=0, cu=CONT, ccen=0, srM=0, srm=0, test=0, sel=0, y=0, b_mux=0, rb=0, a_mux=0, ra=0, src=ZA, op=OR, dst=NONE, const=0, k_mux=0):
+    sscu = (sel << 10) | test
+    alu = src | op << 3 | dst << 6
+    return (mwe | ir << 1 | ic << 2 | bar << 6 | cu << 18 | ccen << 22 | srM << 23 | srm << 24 | sscu << 25 | y << 37
+            | b_mux << 39 | rb << 40 | a_mux << 44 | ra << 45 | alu << 49 | const << 58 | k_mux << 74)
+
+
+UPP_LOOP, UPP_NEXT, UPP_END = 32, 40, 41
+micro_program_memory: Dict[int, int] = {
+    0: 0b00000_0000000000_0000000000_0000000000_0000000000_0000000011_1000000000_0000000100,
+    1: 0b00000_0000000000_0000000000_0000000000_0000000000_0000000011_1000000000_0000001010,
+    2: 0b00000_0000000000_0000000000_0000000000_0000000000_0000000000_1000000000_0000000000,
+    3: word(src=ZA, op=OR, dst=RAMF, cu=JZ),
+    4: word(ic=1),
+    5: word(ic=2, src=DZ, op=OR, dst=RAMF, cu=JZ),
+    6: word(src=ZA, op=OR, y=0b01),
+    7: word(src=DZ, op=OR, dst=RAMF, cu=JZ),
+    8: word(src=ZB, op=OR, y=0b01),
+    9: word(src=ZA, op=OR, y=0b10, mwe=1, cu=JZ),
+    10: word(src=AB, op=ADD, dst=RAMF, srM=1, cu=JZ),
+    11: word(src=AB, op=SUBR, dst=RAMF, srM=1, cu=JZ),
+    12: word(src=AB, op=SUBS, srM=1, cu=JZ),
+    13: word(src=AB, op=EXOR, dst=RAMF, srM=1, cu=JZ),
+    14: word(src=AB, op=AND, srM=1, cu=JZ),
+    15: word(src=ZB, op=OR, y=0b10, ic=8, cu=JZ),
+    16: word(ic=1),
+    17: word(ic=8, cu=JZ),
+    18: word(cu=CJP, ccen=1, sel=MACRO, test=T_Z, bar=15), 19: word(cu=JZ),
+    20: word(cu=CJP, ccen=1, sel=MACRO, test=T_Z, bar=16), 21: word(ic=2, cu=JZ),
+    22: word(cu=CJP, ccen=1, sel=MACRO, test=T_C, bar=15), 23: word(cu=JZ),
+    24: word(cu=CJP, ccen=1, sel=MACRO, test=T_C, bar=16), 25: word(ic=2, cu=JZ),
+    26: word(cu=CJP, ccen=1, sel=MACRO, test=T_BE, bar=15), 27: word(cu=JZ),
+    28: word(cu=CJP, ccen=1, sel=MACRO, test=T_BE, bar=16), 29: word(ic=2, cu=JZ),
+    31: word(src=ZB, op=OR, srm=1),
+    32: word(cu=CJP, ccen=1, sel=MICRO, test=T_Z, bar=UPP_END, src=ZB, op=SUBS, srm=1),
+    33: word(src=ZB, op=SUBR, dst=RAMF, srm=1),
+    34: word(src=AB, op=ADD, y=0b01),
+    35: word(src=DZ, op=OR, dst=QREG, k_mux=1, const=97),
+    36: word(src=DQ, op=SUBS, dst=QREG, srm=1),
+    37: word(cu=CJP, ccen=1, sel=MICRO, test=T_C, bar=UPP_NEXT, src=DQ, op=SUBR, k_mux=1, const=26, srm=1),
+    38: word(cu=CJP, ccen=1, sel=MICRO, test=T_NC, bar=UPP_NEXT, src=DQ, op=ADD, dst=QREG, k_mux=1, const=64),
+    39: word(src=ZQ, op=OR, y=0b10, mwe=1),
+    40: word(cu=CJP, bar=UPP_LOOP, src=ZB, op=OR, srm=1),
+    41: word(cu=JZ),
+    # WTF, 5 nested micro-subroutine calls
+    42: word(cu=CJS, bar=44), 43: word(cu=JZ),
+    44: word(cu=CJS, bar=46), 45: word(cu=CRTN),
+    46: word(cu=CJS, bar=48), 47: word(cu=CRTN),
+    48: word(cu=CJS, bar=50), 49: word(cu=CRTN),
+    50: word(cu=CJS, bar=52), 51: word(cu=CRTN),
+    52: word(cu=CRTN),
+    0b1111_1111_1111: (1 << 75) - 1,
+}
+micro_macro_mapping_PROM: Dict[int, int] = {
+    0x01: 3, 0x02: 4, 0x03: 6, 0x04: 8, 0x05: 10, 0x06: 11, 0x07: 12, 0x08: 13, 0x09: 14,
+    0x0A: 15, 0x0B: 16, 0x0C: 18, 0x0D: 20, 0x0E: 22, 0x0F: 24, 0x10: 26, 0x11: 28, 0x12: 42, 0x13: 31,
+    0xff: 0b1111_1111_1111,
+}
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from Assembler import Assembler
+from Emulator import Emulator, EmulatorRunModes
+from benchmarks import ReferenceMicroProgram
+from benchmarks.workloads import WORKLOADS
+
+'''
+Runs every workload in every mode in a fresh interpreter and reports micro-cycles per second, assembled lines per
+second and the peak RSS of the process, plus the interpreter startup time of importing the emulator. The results
+are stored as JSON and compared with a baseline, throughput below or startup and RSS above the baseline by more
+than the tolerance are reported as regressions.
+
+    python -m benchmarks.runner                    # run, store benchmarks/results.json, compare with the baseline
+    python -m benchmarks.runner --save-baseline    # run and store the results as the new baseline
+'''
+
+RESULTS_PATH = os.path.join(ROOT, "benchmarks", "results.json")
+BASELINE_PATH = os.path.join(ROOT, "benchmarks", "baseline.json")
+MODES = ("RUN", "COMPILED", "TRANSLATED")
+# Higher is better for the throughputs, lower for the rest
+METRICS = {"cycles_per_second": 1, "assembly_lines_per_second": 1, "peak_rss_kb": -1}
+
+
+def run_case(workload: str, mode: str, scale: int) -> dict:
+    source = WORKLOADS[workload](scale)
+    lines = sum(1 for line in source.split("\n") if line.strip())
+    assembled = 0
+    start = time.perf_counter()
+    while assembled == 0 or time.perf_counter() - start < 0.2:
+        program, memory = Assembler.assemble_string(source)
+        assembled += 1
+    assembly_seconds = (time.perf_counter() - start) / assembled
+
+    emulator = Emulator(ReferenceMicroProgram.micro_macro_mapping_PROM, ReferenceMicroProgram.micro_program_memory)
+    emulator.init_memory(memory)
+    emulator.insert_program(program)
+    start = time.perf_counter()
+    _, cycles = emulator.run(EmulatorRunModes[mode], 1 << 62, quiet=True)
+    seconds = time.perf_counter() - start
+    if emulator.get_stop_reason() != "halted":
+        raise Exception("Benchmark: {} did not halt in mode {}".format(workload, mode))
+    return {
+        "workload": workload,
+        "mode": mode,
+        "cycles": cycles,
+        "seconds": seconds,
+        "cycles_per_second": cycles / seconds,
+        "assembly_lines_per_second": lines / assembly_seconds,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def measure_startup(repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import Emulator, Assembler"], cwd=ROOT, check=True)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_suite(workloads: List[str], modes: List[str], scale: int, repeat: int) -> dict:
+    cases = []
+    for workload in workloads:
+        for mode in modes:
+            runs = []
+            for _ in range(repeat):
+                output = subprocess.run([sys.executable, "-m", "benchmarks.runner", "--case", workload, mode, "--scale", str(scale)],
+                                        cwd=ROOT, check=True, capture_output=True, text=True).stdout
+                runs.append(json.loads(output))
+            case = max(runs, key=lambda run: run["cycles_per_second"])
+            case["assembly_lines_per_second"] = max(run["assembly_lines_per_second"] for run in runs)
+            case["peak_rss_kb"] = min(run["peak_rss_kb"] for run in runs)
+            cases.append(case)
+            print("{:<16} {:<11} {:>10} cycles {:>12,.0f} cycles/s {:>10,.0f} lines/s {:>8} KiB".format(
+                workload, mode, case["cycles"], case["cycles_per_second"], case["assembly_lines_per_second"], case["peak_rss_kb"]))
+    startup = measure_startup(max(repeat, 3))
+    print("startup {:.3f} s".format(startup))
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scale": scale,
+        "startup_seconds": startup,
+        "cases": cases,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    regressions = []
+    if baseline.get("scale") != results["scale"]:
+        return ["baseline was measured with scale {}, not {}".format(baseline.get("scale"), results["scale"])]
+    previous = {(case["workload"], case["mode"]): case for case in baseline.get("cases", [])}
+    for case in results["cases"]:
+        old = previous.get((case["workload"], case["mode"]))
+        if old is None:
+            continue
+        if old["cycles"] != case["cycles"]:
+            regressions.append("{} {}: {} cycles instead of {}".format(case["workload"], case["mode"], case["cycles"], old["cycles"]))
+        for metric, direction in METRICS.items():
+            ratio = case[metric] / old[metric]
+            if (ratio - 1) * direction < -tolerance:
+                regressions.append("{} {}: {} {:,.0f} vs {:,.0f} ({:+.1%})".format(case["workload"], case["mode"], metric, case[metric], old[metric], ratio - 1))
+    if "startup_seconds" in baseline and results["startup_seconds"] > baseline["startup_seconds"] * (1 + tolerance):
+        regressions.append("startup {:.3f} s vs {:.3f} s".format(results["startup_seconds"], baseline["startup_seconds"]))
+    return regressions
+
+
+def _write(path: str, results: dict):
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Emulator benchmark suite")
+    parser.add_argument("--workloads", nargs="+", default=list(WORKLOADS), choices=list(WORKLOADS))
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    parser.add_argument("--scale", type=int, default=1, help="multiplies the iteration counts of the workloads")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case, the best one is reported")
+    parser.add_argument("--output", default=RESULTS_PATH)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative slowdown reported as a regression")
+    parser.add_argument("--case", nargs=2, metavar=("WORKLOAD", "MODE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case is not None:
+        print(json.dumps(run_case(args.case[0], args.case[1], args.scale)))
+        exit()
+
+    results = run_suite(args.workloads, args.modes, args.scale, args.repeat)
+    _write(args.output, results)
+    if args.save_baseline:
+        _write(args.baseline, results)
+        exit()
+    baseline: Optional[Dict] = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+    if baseline is None:
+        print("No baseline at {}, store one with --save-baseline".format(args.baseline))
+        exit()
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print("REGRESSION " + regression)
+    exit(1 if regressions else 0)
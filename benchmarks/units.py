@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+import argparse
+import importlib
+import random
+import sys
+import time
+from typing import Callable, List, Tuple
+
+'''
+Calls per second of ALU.run, SSCUnit.run and ControlUnit.run on a fixed random mix of valid inputs.
+--path measures the units of another checkout, e.g. a worktree of an older revision.
+'''
+
+
+def measure(call: Callable[[int], object], calls: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.process_time()
+        for i in range(calls):
+            call(i)
+        best = min(best, time.process_time() - start)
+    return calls / best
+
+
+def alu_benchmark(module, calls: int) -> Callable[[int], object]:
+    alu = module.ALU()
+    registers = [random.randrange(0x10000) for _ in range(16)]
+    # Older checkouts keep the registers in the ALU itself instead of the shared machine state
+    if hasattr(alu, "_state"):
+        alu._state.registers = registers
+    else:
+        alu._registers = registers
+    inputs: List[Tuple[int, int, int, int, int]] = [(random.randrange(0b100_000_000), random.randrange(16), random.randrange(16),
+                                                     random.randrange(0x10000), random.randrange(2)) for _ in range(calls)]
+    run = alu.run
+    return lambda i: run(*inputs[i])
+
+
+def sscu_benchmark(module, calls: int) -> Callable[[int], object]:
+    ssc_unit = module.SSCUnit()
+    inputs = [(random.randrange(16), random.randrange(2), random.randrange(2), random.randrange(3) << 10 | random.choice((4, 5, 10, 11, 12, 13, 0)))
+              for _ in range(calls)]
+    run = ssc_unit.run
+    return lambda i: run(*inputs[i])
+
+
+def control_unit_benchmark(module, calls: int) -> Callable[[int], object]:
+    control_unit = module.ControlUnit()
+    # JZ keeps the stack bounded, the other instructions never over- or underflow with this mix
+    inputs = []
+    depth = 0
+    for _ in range(calls):
+        instruction = random.choice((0b0000, 0b0001, 0b0010, 0b0011, 0b0100, 0b1010, 0b1011, 0b1110))
+        if instruction in (0b0001, 0b0100) and depth == module.STACK_SIZE or instruction in (0b1010, 0b1011) and depth == 0:
+            instruction = 0b0000
+        ccen = 0 if instruction in (0b0001, 0b1010, 0b1011) else random.randrange(2)
+        depth = 0 if instruction == 0b0000 else depth + (instruction in (0b0001, 0b0100)) - (instruction in (0b1010, 0b1011))
+        inputs.append((instruction, random.randrange(0x1000), ccen, random.randrange(2), random.randrange(0x1000)))
+    run = control_unit.run
+    return lambda i: run(*inputs[i])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Microbenchmark of the ALU, SSCU and control unit")
+    parser.add_argument("--path", default=None, help="directory to import the units from")
+    parser.add_argument("--calls", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    if args.path is not None:
+        sys.path.insert(0, args.path)
+
+    for name, module_name, benchmark in (("ALU", "ALU", alu_benchmark), ("SSCUnit", "SSCUnit", sscu_benchmark),
+                                         ("ControlUnit", "ControlUnit", control_unit_benchmark)):
+        random.seed(0)
+        module = importlib.import_module(module_name)
+        print("{:<12} {:>12,.0f} calls/s".format(name, measure(benchmark(module, args.calls), args.calls, args.repeat)))
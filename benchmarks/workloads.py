@@ -0,0 +1,114 @@
+from typing import Callable, Dict, List, Tuple
+
+'''
+Generators of reproducible .prd workloads for the reference micro-program.
+'''
+
+
+class Program:
+    def __init__(self):
+        self._lines: List[str] = []
+        self._memory: Dict[int, int] = {}
+
+    def emit(self, line: str):
+        self._lines.append(line)
+
+    def data(self, address: int, value: int):
+        self._memory[address] = value
+
+    def source(self) -> str:
+        lines = list(self._lines)
+        if self._memory:
+            lines.append("memory:")
+            lines += ["{}:{}".format(address, value) for address, value in sorted(self._memory.items())]
+        return "\n".join(lines) + "\n"
+
+
+def _counted_loop(program: Program, iterations: int, body: Callable[[Program], None]):
+    '''Runs body `iterations` times, r1 counts, r2 holds the bound and r3 the 1, the body must keep them.'''
+    program.emit("mov 0 r1")
+    program.emit("mov {} r2".format(iterations))
+    program.emit("mov 1 r3")
+    program.emit("loop:")
+    body(program)
+    program.emit("add r3 r1")
+    program.emit("cmp r1 r2")
+    program.emit("jl loop")
+
+
+def long_loop(scale: int = 1) -> str:
+    '''Arithmetic in a long counted loop.'''
+    program = Program()
+    program.emit("mov 7 r4")
+    program.emit("mov 0 r6")
+
+    def body(p: Program):
+        p.emit("add r4 r6")
+        p.emit("xor r1 r6")
+        p.emit("sub r3 r6")
+        p.emit("mov r6 r7")
+        p.emit("test r7 r4")
+
+    _counted_loop(program, min(20000 * scale, 0xFFFF), body)
+    return program.source()
+
+
+def memory_sweep(scale: int = 1) -> str:
+    '''Stores to and loads back from a sweeping pointer with MOV r [r] and MOV [r] r.'''
+    program = Program()
+    program.emit("mov 4096 r5")
+
+    def body(p: Program):
+        p.emit("mov r1 [r5]")
+        p.emit("mov [r5] r4")
+        p.emit("add r4 r6")
+        p.emit("add r3 r5")
+
+    _counted_loop(program, min(15000 * scale, 0xFFFF - 4096), body)
+    return program.source()
+
+
+def upp_table_walk(scale: int = 1) -> str:
+    '''Uppercases a text table over and over with UPP, every pass first lowercases it again with XOR.'''
+    program = Program()
+    table, length = 0x2000, 64
+    text = "the quick brown fox jumps over the lazy dog, 0123456789 {}~`@[]!"
+    for i in range(length):
+        program.data(table + i, ord(text[i % len(text)]))
+    program.emit("mov {} r5".format(table))
+    program.emit("mov 32 r8")
+
+    def body(p: Program):
+        p.emit("mov {} r6".format(length))
+        p.emit("upp r5 r6")
+        # lowercase the first word again, so the next pass has something to convert
+        p.emit("mov [r5] r9")
+        p.emit("xor r8 r9")
+        p.emit("mov r9 [r5]")
+
+    _counted_loop(program, min(400 * scale, 0xFFFF), body)
+    return program.source()
+
+
+def nested_calls(scale: int = 1) -> str:
+    '''WTF goes through 5 nested CJS/CRTN micro-subroutines in the reference micro-program.'''
+    program = Program()
+
+    def body(p: Program):
+        for _ in range(8):
+            p.emit("wtf")
+
+    _counted_loop(program, min(4000 * scale, 0xFFFF), body)
+    return program.source()
+
+
+WORKLOADS: Dict[str, Callable[[int], str]] = {
+    "long_loop": long_loop,
+    "memory_sweep": memory_sweep,
+    "upp_table_walk": upp_table_walk,
+    "nested_calls": nested_calls,
+}
+
+
+def generate(scale: int = 1) -> List[Tuple[str, str]]:
+    return [(name, generator(scale)) for name, generator in WORKLOADS.items()]
@@ -1,22 +1,44 @@
 #!/usr/bin/env python3
 
-from sys import argv
+import argparse
+import os
 from Emulator import Emulator, EmulatorRunModes
 from Assembler import Assembler
+from Profiler import Profiler
 
 from MicroProgram import micro_macro_mapping_PROM, micro_program_memory
 
 
 if __name__ == "__main__":
-    mode = EmulatorRunModes.RUN if len(argv) == 1 else EmulatorRunModes[argv[1]]
-    file = input("Path to the file to emulate: ") if len(argv) < 3 else argv[2]
+    parser = argparse.ArgumentParser(description="Assemble and emulate a program")
+    parser.add_argument("mode", nargs="?", default="RUN", choices=[mode.name for mode in EmulatorRunModes])
+    parser.add_argument("program", nargs="?", default=None, help=".prd file, asked for when it is not given")
+    parser.add_argument("--profile", default=None, metavar="PREFIX",
+                        help="profile the run into PREFIX.json, PREFIX.folded and PREFIX.counters.json")
+    args = parser.parse_args()
+    mode = EmulatorRunModes[args.mode]
+    file = input("Path to the file to emulate: ") if args.program is None else args.program
+    # The assembled objects are cached only when EMULATOR_OBJECT_CACHE names the directory to keep them in
+    cache_directory = os.environ.get("EMULATOR_OBJECT_CACHE")
     try:
-        program, memory = Assembler.assemble(file)
+        if cache_directory:
+            object_file = Assembler.assemble_object(file, cache_directory)
+        else:
+            program, memory = Assembler.assemble(file)
     except Exception as e:
         print("Failed to assemble the program: {}".format(e))
         exit()
 
     emulator = Emulator(micro_macro_mapping_PROM=micro_macro_mapping_PROM, micro_program_memory=micro_program_memory)
-    emulator.init_memory(memory)
-    emulator.insert_program(program)
-    emulator.run(mode)
\ No newline at end of file
+    if cache_directory:
+        with object_file:
+            emulator.load_object(object_file)
+    else:
+        emulator.init_memory(memory)
+        emulator.insert_program(program)
+    profiler = Profiler() if args.profile is not None else None
+    emulator.run(mode, profiler=profiler)
+    if profiler is not None:
+        profiler.write_json(args.profile + ".json")
+        profiler.write_folded(args.profile + ".folded")
+        emulator.performance_counters(profiler).write_json(args.profile + ".counters.json")
\ No newline at end of file
@@ -0,0 +1,49 @@
+import glob
+import os
+import re
+import sys
+from typing import List, Tuple
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from Assembler import Assembler
+from Emulator import Emulator, EmulatorRunModes
+from benchmarks import ReferenceMicroProgram, workloads
+
+PROGRAMS_DIRECTORY = os.path.join(ROOT, "programms")
+MODES = [EmulatorRunModes.RUN, EmulatorRunModes.COMPILED, EmulatorRunModes.TRANSLATED]
+
+
+def reference_emulator() -> Emulator:
+    '''An emulator of the reference micro-program, with copies of its tables as updates change them in place.'''
+    return Emulator(dict(ReferenceMicroProgram.micro_macro_mapping_PROM), dict(ReferenceMicroProgram.micro_program_memory))
+
+
+def load_source(emulator: Emulator, source: str) -> Emulator:
+    program, memory = Assembler.assemble_string(source)
+    emulator.init_memory(memory)
+    emulator.insert_program(program)
+    return emulator
+
+
+def sample_programs() -> List[Tuple[str, str]]:
+    '''
+    The programs in programms/ and the benchmark workloads, as names and sources. The counted loops of the workloads
+    are cut down to 100 iterations, which still runs every path of their bodies.
+    '''
+    programs = []
+    for path in sorted(glob.glob(os.path.join(PROGRAMS_DIRECTORY, "*.prd"))):
+        with open(path, "r") as f:
+            programs.append((os.path.basename(path), f.read()))
+    for name, source in workloads.generate(1):
+        programs.append((name, re.sub(r"^mov (\d+) r2$", lambda match: "mov {} r2".format(min(int(match.group(1)), 100)), source,
+                                      flags=re.MULTILINE)))
+    return programs
+
+
+@pytest.fixture(params=MODES, ids=lambda mode: mode.name)
+def mode(request) -> EmulatorRunModes:
+    return request.param
@@ -0,0 +1,69 @@
+import os
+
+import pytest
+
+from Assembler import Assembler, AssemblerError
+from conftest import PROGRAMS_DIRECTORY
+
+# Program words and memory of the sample programs as the assembler before the rewrite produced them
+OLD_ASSEMBLER_OUTPUT = {
+    "test1.prd": ([0x201, 0xFF0D, 0x112, 0x421, 0x323, 0xFF00], {}),
+    "test2.prd": ([0x201, 0xD, 0x202, 0xF, 0x512, 0x203, 0xA, 0x613, 0x912, 0x204, 0xC, 0x814, 0x901, 0xFF00], {}),
+    "test3.prd": ([0x200, 0x1, 0x202, 0xA, 0x501, 0x912, 0xD00, 0xA, 0xB00, 0x0, 0xFF00], {}),
+    "test4.prd": ([0x200, 0x1, 0x202, 0xA, 0x501, 0x712, 0xE0A, 0xFF00], {}),
+    "test5.prd": ([0x200, 0x1, 0x202, 0xA, 0x501, 0x712, 0x1100, 0x0, 0xFF00], {}),
+    "test6.prd": ([0x200, 0x45, 0x20F, 0x50F, 0x4F0, 0x20F, 0xFFFF, 0x200, 0x46, 0x4F0, 0x20F, 0xEB, 0x1200, 0x6F0, 0xFF00], {}),
+    "test7.prd": ([0x204, 0x45, 0x20F, 0x50F, 0x4F4, 0x20F, 0xFFFF, 0x204, 0x46, 0x4F4, 0x20F, 0xEB, 0x1F0, 0x1200, 0x146,
+                   0xFF00], {}),
+    "test8.prd": ([0x200, 0x29E, 0x201, 0x8, 0x1301, 0xFF00],
+                  {669: 100, 670: 97, 671: 108, 672: 96, 673: 116, 674: 123, 675: 158, 676: 122, 677: 105, 678: 102, 679: 250}),
+}
+
+
+def assemble(source: str):
+    program, memory = Assembler.assemble_string(source)
+    return list(program), memory
+
+
+@pytest.mark.parametrize("name", sorted(OLD_ASSEMBLER_OUTPUT))
+def test_sample_programs_match_the_old_assembler(name):
+    program, memory = Assembler.assemble(os.path.join(PROGRAMS_DIRECTORY, name))
+    assert (list(program), memory) == OLD_ASSEMBLER_OUTPUT[name]
+
+
+def test_forward_and_backward_labels():
+    source = """jmp end      ; forward
+back: mov 1 r1
+jmp back     ; backward
+end:
+mov back r2
+memory:
+100: end
+back: 0x10
+"""
+    assert assemble(source) == ([0xB00, 6, 0x201, 1, 0xB00, 2, 0x202, 2, 0xFF00], {100: 6, 2: 0x10})
+
+
+def test_comments_blank_lines_and_constant_bases():
+    assert assemble("\n  ; nothing\nMOV 0x1F r1 ; hex\nmov 0b101 r2\nmov 7 r3\n") == (
+        [0x201, 0x1F, 0x202, 0b101, 0x203, 7, 0xFF00], {})
+
+
+@pytest.mark.parametrize("source, line, message", [
+    ("a: mov 1 r1\nmov 2 r2\na: mov 3 r3", 3, "label a is already defined"),
+    ("mov 1 r1\njmp nowhere", 2, "undefined label nowhere"),
+    ("mov 1 r1\nmemory:\n5: nowhere", 3, "undefined label nowhere"),
+    ("mov 1 r16", 1, "invalid register r16"),
+    ("mov 1 r1\nmov 0x10000 r1", 2, "constant 0x10000 does not fit into 16 bits"),
+    ("mov 1 r1\nmemory:\n65536: 1", 3, "constant 65536 does not fit into 16 bits"),
+    ("mov 1 r1\n\nfoo r1 r2", 3, "unknown instruction foo"),
+    ("add 1 r2", 1, "invalid operands for add: add 1 r2"),
+    ("mov r1 r2 r3", 1, "invalid syntax: mov r1 r2 r3"),
+    ("r1: mov 1 r1", 1, "r1 can not be a label"),
+    ("mov 1 r1\nmemory:\nnot a memory line", 3, "invalid memory request: not a memory line"),
+])
+def test_errors_name_their_line(source, line, message):
+    with pytest.raises(AssemblerError) as error:
+        Assembler.assemble_string(source)
+    assert error.value.line == line
+    assert str(error.value) == "Assembler: line {}: {}".format(line, message)
@@ -0,0 +1,63 @@
+import pytest
+
+from Assembler import Assembler
+from conftest import load_source, reference_emulator, sample_programs
+from benchmarks import ReferenceMicroProgram
+
+np = pytest.importorskip("numpy")
+
+from BatchEmulator import BatchEmulator  # noqa: E402
+
+PROGRAMS = sample_programs()
+
+
+def batch_emulator(lanes: int) -> BatchEmulator:
+    return BatchEmulator(dict(ReferenceMicroProgram.micro_macro_mapping_PROM), dict(ReferenceMicroProgram.micro_program_memory), lanes)
+
+
+def single_run(source: str, registers=None):
+    emulator = load_source(reference_emulator(), source)
+    if registers is not None:
+        emulator.init_registers(registers)
+    try:
+        status, ticks = emulator.run(quiet=True)
+    except Exception as e:
+        return None, str(e)
+    return status, ticks
+
+
+def test_lanes_match_single_runs():
+    # Every sample program, the first one again with other registers, so the lanes spread over many micro addresses
+    registers = list(range(16))
+    lanes = [(source, None) for _, source in PROGRAMS] + [(PROGRAMS[0][1], registers)]
+    batch = batch_emulator(len(lanes))
+    for lane, (source, lane_registers) in enumerate(lanes):
+        program, memory = Assembler.assemble_string(source)
+        batch.init_memory(lane, memory)
+        batch.insert_program(lane, program)
+        if lane_registers is not None:
+            batch.init_registers(lane, lane_registers)
+    results = batch.run()
+    for lane, (source, lane_registers) in enumerate(lanes):
+        assert batch.get_error(lane) is None
+        assert results[lane] == single_run(source, lane_registers)
+
+
+def test_unknown_opcodes_retire_their_lane():
+    batch = batch_emulator(3)
+    # Lane 0 loads an opcode without a PROM entry, lane 1 halts, lane 2 reaches a JMAP with such an opcode in IR
+    batch.insert_program(0, [0x2000])
+    batch.insert_program(1, [0xFF00])
+    jmap = next(address for address, mi in reference_emulator().get_decoded_micro_program().items()
+                if mi.controller_instruction == 0b0010 and not mi.ir and not mi.halt)
+    batch._mic[2] = jmap
+    batch._instruction_register[2] = 0x2100
+    results = batch.run()
+
+    emulator = reference_emulator()
+    emulator.insert_program([0x2000])
+    with pytest.raises(Exception) as error:
+        emulator.run(quiet=True)
+    assert results[0][0] is None and batch.get_error(0) == str(error.value)
+    assert results[1][0] is not None and batch.get_error(1) is None
+    assert results[2][0] is None and batch.get_error(2) == "Opcode 33 is not present in PROM"
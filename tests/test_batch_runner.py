@@ -0,0 +1,50 @@
+import os
+
+from BatchRunner import BatchRunner, result_key
+from conftest import PROGRAMS_DIRECTORY
+from test_watchdog import LOOP
+
+MICROCODE = "benchmarks.ReferenceMicroProgram"
+PROGRAMS = [os.path.join(PROGRAMS_DIRECTORY, name) for name in ("test1.prd", "test2.prd")]
+
+
+def run(cache, paths=PROGRAMS, **options):
+    runner = BatchRunner(MICROCODE, "TRANSLATED", options.pop("instructions_limit", 100000), 1, str(cache), **options)
+    return sorted(runner.run(paths), key=lambda result: result["program"])
+
+
+def test_result_key_covers_every_input():
+    inputs = ("mov 1 r1", "microcode", 1000, False, "image")
+    key = result_key(*inputs)
+    assert result_key(*inputs) == key
+    for index, other in enumerate(("mov 2 r1", "other microcode", 1001, True, "other image")):
+        assert result_key(*(inputs[:index] + (other,) + inputs[index + 1:])) != key
+
+
+def test_cached_results_have_no_wall_time(tmp_path):
+    fresh = run(tmp_path)
+    assert [result["cached"] for result in fresh] == [False, False]
+    assert all(result["wall_time"] is not None for result in fresh)
+    cached = run(tmp_path)
+    assert [result["cached"] for result in cached] == [True, True]
+    assert all(result["wall_time"] is None for result in cached)
+    for fresh_result, cached_result in zip(fresh, cached):
+        assert {**fresh_result, "wall_time": None, "cached": True} == cached_result
+    # Another budget is another key
+    assert [result["cached"] for result in run(tmp_path, instructions_limit=50000)] == [False, False]
+
+
+def test_time_limited_runs_are_not_cached(tmp_path):
+    path = str(tmp_path / "loop.prd")
+    with open(path, "w") as f:
+        f.write(LOOP)
+    result, = run(tmp_path, [path], instructions_limit=10 ** 9, time_limit=0.01)
+    assert result["stop_reason"].startswith("time limit")
+    result, = run(tmp_path, [path], instructions_limit=10 ** 9, time_limit=0.01)
+    assert not result["cached"]
+
+
+def test_dumped_runs_are_not_cached(tmp_path):
+    dumped = run(tmp_path, dump_directory=str(tmp_path / "dumps"))
+    assert all(os.path.exists(result["memory_diff"]) for result in dumped)
+    assert [result["cached"] for result in run(tmp_path)] == [False, False]
@@ -0,0 +1,35 @@
+from conftest import load_source, reference_emulator
+from Debugger import Debugger
+
+SOURCE = """mov 100 r5
+mov 0 r1
+mov 1 r2
+loop: add r2 r1
+mov r1 [r5]
+jmp loop
+"""
+
+
+def test_step_back_replays_the_same_run():
+    debugger = Debugger(load_source(reference_emulator(), SOURCE), checkpoint_interval=50)
+    debugger.run_to_cycle(1000)
+    forward = debugger.status()
+    debugger.step_back(600)
+    assert debugger.cycle == 400
+    debugger.run_to_cycle(1000)
+    assert debugger.status() == forward
+
+
+def test_edit_after_step_back_drops_the_old_timeline():
+    debugger = Debugger(load_source(reference_emulator(), SOURCE), checkpoint_interval=50)
+    debugger.run_to_cycle(1000)
+    old = debugger.status()["memory"][100]
+    debugger.step_back(600)
+    debugger.set_register(2, 2)
+    debugger.run_to_cycle(1000)
+    edited = debugger.status()["memory"][100]
+    assert edited != old
+    # Stepping back a little has to replay the edited run, not restore a checkpoint of the old one
+    debugger.step_back(10)
+    debugger.run_to_cycle(1000)
+    assert debugger.status()["memory"][100] == edited
@@ -0,0 +1,80 @@
+from Assembler import Assembler
+from benchmarks import ReferenceMicroProgram
+from benchmarks.ReferenceMicroProgram import AB, JZ, MACRO, RAMF, SUBR, word
+from conftest import load_source, reference_emulator, sample_programs
+from Emulator import EmulatorRunModes
+from Fuzzer import DifferentialChecker, corpus_key, generate_case
+from ReferenceModel import ReferenceModel
+
+CASES = [generate_case(seed, 16) for seed in range(40)]
+
+
+def step_to_fetch(emulator) -> bool:
+    '''Runs the emulator to the next fetch, whether it halted instead.'''
+    decoded_micro_program = emulator.get_decoded_micro_program()
+    for _ in range(100000):
+        emulator.run(EmulatorRunModes.RUN, 1, quiet=True)
+        if emulator.get_mic() == 0:
+            return False
+        if decoded_micro_program[emulator.get_mic()].halt:
+            return True
+    raise Exception("no fetch")
+
+
+def test_reference_model_and_emulator_in_lockstep():
+    stepped = 0
+    for case in CASES:
+        program, memory = Assembler.assemble_string(case.source())
+        reference = ReferenceModel(program, memory, case.registers, case.status_register)
+        emulator = load_source(reference_emulator(), case.source())
+        emulator.init_registers(case.registers)
+        emulator.init_status_register(case.status_register)
+        for _ in range(4 * len(program)):
+            try:
+                reference.step()
+            except Exception:
+                # A store overwrote the program, the fuzzer skips such cases too
+                break
+            halted = step_to_fetch(emulator)
+            assert halted == reference.halted
+            assert emulator.get_instruction_counter() == reference.instruction_counter
+            assert emulator.get_registers() == reference.registers
+            assert emulator.get_status_register() & 0b0101 == reference.flags()
+            assert emulator.get_memory_words() == reference.memory
+            stepped += 1
+            if halted:
+                break
+    assert stepped > 200
+
+
+def test_sample_programs_agree_with_the_reference_model():
+    for name, source in sample_programs():
+        program, memory = Assembler.assemble_string(source)
+        reference = ReferenceModel(program, memory)
+        reference.run()
+        emulator = load_source(reference_emulator(), source)
+        emulator.run(quiet=True)
+        assert reference.halted, name
+        assert (emulator.get_registers(), emulator.get_memory_words()) == (reference.registers, reference.memory), name
+
+
+def test_checker_finds_no_divergence_in_the_reference_micro_program():
+    checker = DifferentialChecker(ReferenceMicroProgram.micro_macro_mapping_PROM, ReferenceMicroProgram.micro_program_memory)
+    results = [checker.check(case) for case in CASES]
+    assert sum(valid for valid, _ in results) > len(CASES) // 2
+    assert [divergence for _, divergence in results if divergence is not None] == []
+
+
+def test_mutated_micro_word_is_found_and_minimized():
+    # ADD computes S - R instead of R + S
+    micro_program_memory = dict(ReferenceMicroProgram.micro_program_memory)
+    micro_program_memory[10] = word(src=AB, op=SUBR, dst=RAMF, srM=MACRO, cu=JZ)
+    checker = DifferentialChecker(ReferenceMicroProgram.micro_macro_mapping_PROM, micro_program_memory)
+    case = next(case for case in CASES if checker.diverges(case))
+    minimized = checker.minimize(case)
+    _, divergence = checker.check(minimized)
+    assert divergence["opcode"] == 0x05 and divergence["instruction"].startswith("ADD")
+    assert any(difference.startswith("r") for difference in divergence["differences"])
+    assert corpus_key({"divergence": divergence}) == "add"
+    assert len(minimized.lines) < len(case.lines)
+    assert sum(instruction.startswith("add") for _, instruction in minimized.lines) == 1
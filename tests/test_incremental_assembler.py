@@ -0,0 +1,59 @@
+import pytest
+
+from Assembler import Assembler, AssemblerError, IncrementalAssembler, loaded_changes
+
+SOURCE = """mov 100 r5
+mov 3 r1
+loop: mov [r5] r3
+add r1 r3
+mov r3 [r5]
+cmp r3 r9
+jl loop
+memory:
+100: 7
+"""
+
+EDITS = {
+    "constant": ("mov 3 r1", "mov 4 r1"),
+    "register": ("add r1 r3", "add r2 r3"),
+    "jump": ("jl loop", "jmp loop"),
+    "size": ("add r1 r3", "mov 5 r3"),
+    "label": ("loop: mov [r5] r3", "mov [r5] r3\nloop: cmp r3 r9"),
+    "inserted line": ("cmp r3 r9", "cmp r3 r9\nmov r3 r4"),
+    "memory": ("100: 7", "100: 8\n101: 9"),
+}
+
+
+def loaded(program, memory):
+    return loaded_changes([], {}, program, memory)
+
+
+@pytest.mark.parametrize("old, new", EDITS.values(), ids=EDITS.keys())
+def test_update_matches_a_full_assembly(old, new):
+    assembler = IncrementalAssembler(SOURCE)
+    program, memory = list(assembler.program), dict(assembler.memory)
+    edited = SOURCE.replace(old, new)
+    changes = assembler.update(edited)
+    expected_program, expected_memory = Assembler.assemble_string(edited)
+    assert list(assembler.program) == list(expected_program)
+    assert loaded(assembler.program, assembler.memory) == loaded(expected_program, expected_memory)
+    assert changes == loaded_changes(program, memory, expected_program, expected_memory)
+
+
+def test_update_without_changes():
+    assembler = IncrementalAssembler(SOURCE)
+    assert assembler.update(SOURCE) == {}
+
+
+def test_failed_update_keeps_the_previous_version():
+    assembler = IncrementalAssembler(SOURCE)
+    program = list(assembler.program)
+    with pytest.raises(AssemblerError):
+        assembler.update(SOURCE.replace("add r1 r3", "add r1"))
+    with pytest.raises(AssemblerError):
+        assembler.update(SOURCE.replace("jl loop", "jl nowhere"))
+    assert list(assembler.program) == program
+    edited = SOURCE.replace("mov 3 r1", "mov 4 r1")
+    changes = assembler.update(edited)
+    assert changes == loaded_changes(program, assembler.memory, Assembler.assemble_string(edited)[0], assembler.memory)
+    assert list(assembler.program) == list(Assembler.assemble_string(edited)[0])
@@ -0,0 +1,40 @@
+import os
+import shutil
+
+from LiveSession import LiveSession
+from conftest import ROOT
+
+
+def test_program_edit_runs_again(tmp_path):
+    micro_program = str(tmp_path / "micro.py")
+    shutil.copy(os.path.join(ROOT, "benchmarks", "ReferenceMicroProgram.py"), micro_program)
+    program = tmp_path / "program.prd"
+    program.write_text("mov 5 r1\nmov r1 r2\n")
+    session = LiveSession(micro_program, [str(program)])
+    first, = session.reload()
+    assert first.stop_reason == "halted"
+    assert first.registers[:3] == [0, 5, 5]
+
+    program.write_text("mov 7 r1\nmov r1 r2\n")
+    # The editor may save within the resolution of the modification time
+    os.utime(program, ns=(0, 0))
+    second, = session.reload()
+    assert second.registers[:3] == [0, 7, 7]
+    assert session.reload() == []
+
+
+def test_dropped_memory_word_is_no_longer_loaded(tmp_path):
+    micro_program = str(tmp_path / "micro.py")
+    shutil.copy(os.path.join(ROOT, "benchmarks", "ReferenceMicroProgram.py"), micro_program)
+    program = tmp_path / "program.prd"
+    program.write_text("mov 100 r5\nmov [r5] r1\nmemory:\n100: 7\n101: 9\n")
+    session = LiveSession(micro_program, [str(program)])
+    session.reload()
+
+    program.write_text("mov 100 r5\nmov [r5] r1\nmemory:\n100: 8\n")
+    os.utime(program, ns=(0, 0))
+    edited, = session.reload()
+    fresh_session = LiveSession(micro_program, [str(program)])
+    fresh, = fresh_session.reload()
+    assert edited.registers == fresh.registers
+    assert session._emulator.get_status()["memory"] == fresh_session._emulator.get_status()["memory"]
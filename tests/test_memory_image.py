@@ -0,0 +1,49 @@
+import pytest
+
+from Assembler import Assembler
+from conftest import load_source, reference_emulator, sample_programs
+from MemoryImage import apply_diff, compile_image, read_diff
+
+PROGRAMS = [(name, source) for name, source in sample_programs() if "memory:" in source]
+
+
+def read(path) -> bytes:
+    with open(str(path), "rb") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize("name, source", PROGRAMS, ids=[name for name, _ in PROGRAMS])
+def test_image_round_trip(tmp_path, mode, name, source):
+    emulator = load_source(reference_emulator(), source)
+    emulator.run(mode, quiet=True)
+    emulator.dump_memory_image(str(tmp_path / "final.img"))
+
+    copy = reference_emulator()
+    copy.init_memory_image(str(tmp_path / "final.img"))
+    copy.dump_memory_image(str(tmp_path / "copy.img"))
+    assert read(tmp_path / "copy.img") == read(tmp_path / "final.img")
+    assert copy.get_status()["memory"].items() >= emulator.get_status()["memory"].items()
+
+
+@pytest.mark.parametrize("name, source", PROGRAMS, ids=[name for name, _ in PROGRAMS])
+def test_diff_round_trip(tmp_path, name, source):
+    program, memory = Assembler.assemble_string(source)
+    base = str(tmp_path / "base.img")
+    with open(base, "wb") as f:
+        f.write(compile_image(memory))
+    emulator = reference_emulator()
+    emulator.init_memory_image(base)
+    emulator.insert_program(program)
+    emulator.run(quiet=True)
+    emulator.dump_memory_image(str(tmp_path / "final.img"))
+    final = read(tmp_path / "final.img")
+
+    emulator.dump_memory_diff(str(tmp_path / "final.mdiff"), base)
+    _, changed = read_diff(str(tmp_path / "final.mdiff"))
+    assert changed and all(final[2 * address] | final[2 * address + 1] << 8 == value for address, value in changed.items())
+    assert apply_diff(base, str(tmp_path / "final.mdiff")) == final
+    with pytest.raises(Exception, match="is not the base image"):
+        apply_diff(None, str(tmp_path / "final.mdiff"))
+
+    emulator.dump_memory_diff(str(tmp_path / "zeroed.mdiff"))
+    assert apply_diff(None, str(tmp_path / "zeroed.mdiff")) == final
@@ -0,0 +1,68 @@
+import pytest
+
+from benchmarks.ReferenceMicroProgram import CJP, CONT, CRTN, JMAP, JZ, PUSH, word
+from conftest import load_source, reference_emulator, sample_programs
+from ControlUnit import STACK_SIZE
+from Emulator import Emulator, EmulatorRunModes
+from MIInstruction import HALT_INSTRUCTION, decode_micro_program
+from MicroAnalyzer import Issue, MicroAnalyzer
+
+HALT_PROM = {0xFF: 0xFFF}
+
+
+def analyze(micro_program_memory, micro_macro_mapping_PROM=HALT_PROM):
+    return MicroAnalyzer(micro_macro_mapping_PROM, decode_micro_program(micro_program_memory)).analyze()
+
+
+def errors(analysis):
+    return [issue for issue in analysis.issues if issue.severity == "error"]
+
+
+def test_reference_micro_program_is_valid():
+    analysis = reference_emulator().validate()
+    assert analysis.valid and errors(analysis) == []
+    assert analysis.max_stack_depth <= STACK_SIZE
+
+
+def test_bad_field_is_reported():
+    analysis = analyze({0: word(ic=0b0011, cu=CONT), 1: word(cu=JZ), 0xFFF: HALT_INSTRUCTION})
+    assert errors(analysis) == [Issue("error", 0, "more than 1 instruction counter control bit set (IC 0b0011)")]
+
+
+def test_missing_words_are_reported():
+    analysis = analyze({0: word(cu=JMAP), 0xFFF: HALT_INSTRUCTION}, {0x01: 5, **HALT_PROM})
+    assert Issue("error", None, "PROM entry 0x01 points to the missing word 0x005") in analysis.issues
+    assert Issue("error", 5, "reachable micro-address has no word") in analysis.issues
+    assert Issue("error", None, "PROM has no entry 0xFF, programs can not halt") in analyze({0: word(cu=JZ)}, {}).issues
+
+
+def test_stack_overflow_and_underflow_are_reported():
+    # PUSH, then back to it: every round trip leaves one more entry on the stack
+    analysis = analyze({0: word(cu=PUSH, bar=5), 1: word(cu=CJP, bar=0), 0xFFF: HALT_INSTRUCTION})
+    assert errors(analysis) == [Issue("error", 0, "stack overflow")]
+    assert analysis.max_stack_depth == STACK_SIZE
+    analysis = analyze({0: word(cu=CRTN), 0xFFF: HALT_INSTRUCTION})
+    assert errors(analysis) == [Issue("error", 0, "stack underflow")]
+
+
+@pytest.mark.parametrize("name, source", sample_programs(), ids=[name for name, _ in sample_programs()])
+def test_validated_run_matches_the_checked_run(name, source):
+    checked = load_source(reference_emulator(), source)
+    validated = load_source(reference_emulator(), source)
+    assert validated.validate().valid
+    assert validated.run(EmulatorRunModes.RUN, quiet=True) == checked.run(EmulatorRunModes.RUN, quiet=True)
+
+
+def test_invalid_micro_program_keeps_the_checks():
+    emulator = Emulator(dict(HALT_PROM), {0: word(ic=0b0011, cu=JZ), 0xFFF: HALT_INSTRUCTION})
+    assert not emulator.validate().valid
+    with pytest.raises(Exception, match="More than 1 instruction counter control bits"):
+        emulator.run(EmulatorRunModes.RUN, 10, quiet=True)
+
+
+def test_edit_after_validation_brings_the_checks_back():
+    emulator = Emulator(dict(HALT_PROM), {0: word(cu=JZ), 0xFFF: HALT_INSTRUCTION})
+    assert emulator.validate().valid
+    emulator.update_micro_program({0: word(ic=0b0011, cu=JZ), 0xFFF: HALT_INSTRUCTION})
+    with pytest.raises(Exception, match="More than 1 instruction counter control bits"):
+        emulator.run(EmulatorRunModes.RUN, 10, quiet=True)
@@ -0,0 +1,29 @@
+import pytest
+
+from conftest import MODES, load_source, reference_emulator, sample_programs
+from Emulator import EmulatorRunModes
+
+PROGRAMS = sample_programs()
+
+
+def run(source: str, mode: EmulatorRunModes, limit: int = 1000000):
+    emulator = load_source(reference_emulator(), source)
+    status, ticks = emulator.run(mode, limit, quiet=True)
+    return emulator.get_stop_reason(), ticks, emulator.get_status()
+
+
+@pytest.mark.parametrize("name, source", PROGRAMS, ids=[name for name, _ in PROGRAMS])
+def test_modes_agree(name, source):
+    results = [run(source, mode) for mode in MODES]
+    assert results[0][0] == "halted"
+    for mode, result in zip(MODES[1:], results[1:]):
+        assert result == results[0], mode.name
+
+
+@pytest.mark.parametrize("name, source", PROGRAMS, ids=[name for name, _ in PROGRAMS])
+def test_modes_agree_on_the_instructions_limit(name, source):
+    _, ticks, _ = run(source, EmulatorRunModes.RUN)
+    results = [run(source, mode, ticks // 2) for mode in MODES]
+    assert results[0][:2] == ("instructions limit", ticks // 2)
+    for mode, result in zip(MODES[1:], results[1:]):
+        assert result == results[0], mode.name
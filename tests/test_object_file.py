@@ -0,0 +1,66 @@
+import os
+
+import pytest
+
+from Assembler import Assembler
+from conftest import load_source, reference_emulator, sample_programs
+from ObjectFile import ObjectFile, source_digest
+
+PROGRAMS = sample_programs()
+
+
+def write_source(directory, source: str) -> str:
+    path = os.path.join(str(directory), "program.prd")
+    with open(path, "w") as f:
+        f.write(source)
+    return path
+
+
+@pytest.mark.parametrize("name, source", PROGRAMS, ids=[name for name, _ in PROGRAMS])
+def test_object_round_trip(tmp_path, name, source):
+    program, memory = Assembler.assemble_string(source)
+    path = str(tmp_path / "program.mpo")
+    Assembler.write_object(write_source(tmp_path, source), path)
+    with ObjectFile(path) as object_file:
+        assert object_file.digest == source_digest(source.encode())
+        assert list(object_file.program) == list(program)
+        assert object_file.memory() == {address: value & 0xFFFF for address, value in memory.items()}
+        emulator = reference_emulator()
+        emulator.load_object(object_file)
+    assert emulator.snapshot() == load_source(reference_emulator(), source).snapshot()
+
+
+def test_cached_object_is_reused(tmp_path):
+    _, source = PROGRAMS[-1]
+    path = write_source(tmp_path, source)
+    cache = str(tmp_path / "cache")
+    with Assembler.assemble_object(path, cache) as object_file:
+        program = list(object_file.program)
+    cached, = os.listdir(cache)
+    modified = os.stat(os.path.join(cache, cached)).st_mtime_ns
+    with Assembler.assemble_object(path, cache) as object_file:
+        assert list(object_file.program) == program
+    assert os.listdir(cache) == [cached]
+    assert os.stat(os.path.join(cache, cached)).st_mtime_ns == modified
+
+
+def test_damaged_object_is_assembled_again(tmp_path):
+    _, source = PROGRAMS[-1]
+    path = write_source(tmp_path, source)
+    cache = str(tmp_path / "cache")
+    Assembler.assemble_object(path, cache).close()
+    cached = os.path.join(cache, os.listdir(cache)[0])
+    with open(cached, "r+b") as f:
+        f.truncate(os.path.getsize(cached) - 1)
+    with pytest.raises(Exception, match="ObjectFile: "):
+        ObjectFile(cached)
+    with Assembler.assemble_object(path, cache) as object_file:
+        assert list(object_file.program) == list(Assembler.assemble_string(source)[0])
+
+
+def test_invalid_object_is_rejected(tmp_path):
+    path = str(tmp_path / "program.mpo")
+    with open(path, "wb") as f:
+        f.write(b"\0" * 64)
+    with pytest.raises(Exception, match="ObjectFile: not an object file"):
+        ObjectFile(path)
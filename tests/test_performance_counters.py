@@ -0,0 +1,30 @@
+from Emulator import Emulator, EmulatorRunModes
+from MIInstruction import HALT_INSTRUCTION
+from PerformanceCounters import TimingModel
+from Profiler import Profiler
+from benchmarks.ReferenceMicroProgram import ADD, AB, EXOR, OR, RAMF, ZA, word
+
+
+def test_only_used_alu_results_are_counted():
+    micro_program_memory = {
+        0: word(ic=0b0010, src=AB, op=ADD),
+        1: word(src=ZA, op=OR, y=0b01),
+        2: word(src=AB, op=EXOR, dst=RAMF),
+        3: HALT_INSTRUCTION,
+    }
+    emulator = Emulator({}, micro_program_memory)
+    profiler = Profiler()
+    emulator.run(EmulatorRunModes.RUN, 10, profiler=profiler, quiet=True)
+    counters = emulator.performance_counters(profiler).counters()
+    assert counters["cycles"] == 3
+    assert counters["alu_operations"] == {"EXOR": 1, "OR": 1}
+
+
+def test_controller_latencies_are_added_per_word():
+    micro_program_memory = {0: word(), 1: word(), 2: HALT_INSTRUCTION}
+    emulator = Emulator({}, micro_program_memory)
+    profiler = Profiler()
+    emulator.run(EmulatorRunModes.RUN, 10, profiler=profiler, quiet=True)
+    assert emulator.performance_counters(profiler).to_dict()["timing_model"]["controller"] == {}
+    counters = emulator.performance_counters(profiler, TimingModel(controller={"CONT": 0.5})).counters()
+    assert counters["estimated_time"] == 3.0
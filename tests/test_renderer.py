@@ -0,0 +1,51 @@
+import pytest
+from tabulate import tabulate
+
+from conftest import load_source, reference_emulator, sample_programs
+from Emulator import Emulator
+from Renderer import Renderer
+
+PROGRAMS = sample_programs()
+
+SOURCE = """mov 100 r5
+mov 7 r1
+mov r1 [r5]
+"""
+
+
+def unrendered_state(emulator: Emulator) -> str:
+    '''The state as Emulator.__str__ formatted it before the renderer, straight from the status.'''
+    status = emulator.get_status()
+    memory_table = [["Address", "Data"]]
+    for i, value in sorted(status["memory"].items()):
+        if i >= emulator.get_program_length() and value != 0:
+            memory_table.append(["0x{:04X} ({})".format(i, i), "0x{:04X} ({})".format(value, value)])
+    alu, ssc_unit, control_unit = emulator.get_units()
+    return "" + str(alu) + "\n" + str(ssc_unit) + "\n" + str(control_unit) + \
+        "\nInstruction counter: " + str(status["instruction_counter"]) + \
+        "\nInstruction register: 0x{0:04X} ({0})".format(status["instruction_register"]) + \
+        "\nAddress bus: 0x{:04X} ({})".format(status["address_bus"], status["address_bus"]) + \
+        "\nData bus: 0x{:04X} ({})".format(status["data_bus"], status["data_bus"]) + \
+        "\n\n------------ Memory ------------\n" + tabulate(memory_table, headers="firstrow", tablefmt="grid") + "\n"
+
+
+@pytest.mark.parametrize("name, source", PROGRAMS, ids=[name for name, _ in PROGRAMS])
+def test_render_matches_the_unrendered_state(mode, name, source):
+    emulator = load_source(reference_emulator(), source)
+    assert str(emulator) == unrendered_state(emulator)
+    emulator.run(mode, quiet=True)
+    assert str(emulator) == unrendered_state(emulator)
+
+
+def test_changed_only_shows_the_changed_pages():
+    emulator = load_source(reference_emulator(), SOURCE)
+    emulator.run(quiet=True)
+    renderer = Renderer(emulator)
+    renderer.render()
+    emulator.set_memory_value(0x4000, 9)
+    changed = renderer.render(changed_only=True)
+    assert changed == "\n\n------------ Memory ------------\n" + \
+        tabulate([["Address", "Data"], ["0x4000 (16384)", "0x0009 (9)"]], headers="firstrow", tablefmt="grid") + "\n"
+    assert renderer.changed_regions() == ["memory"]
+    assert "0x0064 (100)" in renderer.render()
+    assert renderer.render(changed_only=True) == ""
@@ -0,0 +1,73 @@
+import asyncio
+import json
+
+import pytest
+
+from EmulatorService import EmulatorService, submit
+from test_watchdog import LOOP
+
+MICROCODE = "benchmarks.ReferenceMicroProgram"
+
+
+def serve(test) -> None:
+    '''Runs the test coroutine against a service with one worker on a free port.'''
+    async def main():
+        service = EmulatorService(port=0, workers=1, microcode_modules=(MICROCODE,))
+        await service.start()
+        try:
+            await test(service)
+        finally:
+            await service.close()
+    asyncio.run(main())
+
+
+async def events(service: EmulatorService, request: dict) -> list:
+    return [event async for event in submit(dict(request, microcode=request.get("microcode", MICROCODE)), port=service.port)]
+
+
+def test_only_served_microcode_runs():
+    async def test(service):
+        result = await events(service, {"source": LOOP, "microcode": "os"})
+        assert result[-1]["event"] == "error"
+        assert "microcode" in result[-1]["error"]
+    serve(test)
+
+
+def test_loop_longer_than_the_progress_interval_is_detected():
+    async def test(service):
+        result = await events(service, {"source": LOOP, "mode": "TRANSLATED", "detect_loops": True, "progress_interval": 5})
+        assert result[-1]["event"] == "finished"
+        assert result[-1]["stop_reason"] == "non-terminating, cycle length 10"
+    serve(test)
+
+
+def test_cancel_of_a_dead_worker_fails_the_job():
+    async def test(service):
+        reader, writer = await asyncio.open_connection("127.0.0.1", service.port)
+        request = {"op": "submit", "source": LOOP, "microcode": MICROCODE, "limit": 10 ** 9, "progress_interval": 10 ** 8}
+        writer.write(json.dumps(request).encode() + b"\n")
+        started = None
+        while started is None or started["event"] != "started":
+            started = json.loads(await reader.readline())
+        worker = next(worker for worker in service._workers if worker.job is not None)
+        worker._process.kill()
+        worker._process.join()
+        # Cancelled before the dispatcher, which waits for the loop, notices the dead worker
+        service._cancel(service._jobs[started["job"]])
+        event = json.loads(await reader.readline())
+        assert event["event"] == "failed"
+        assert "worker died" in event["error"]
+        writer.close()
+    serve(test)
+
+
+def test_close_ends_the_open_connections():
+    async def test(service):
+        reader, writer = await asyncio.open_connection("127.0.0.1", service.port)
+        writer.write(b'{"op": "stats"}\n')
+        assert json.loads(await reader.readline())["event"] == "stats"
+        await service.close()
+        assert await reader.readline() == b""
+        assert not [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        writer.close()
+    serve(test)
@@ -0,0 +1,59 @@
+import pytest
+
+from benchmarks.ReferenceMicroProgram import word
+from conftest import load_source, reference_emulator, sample_programs
+from Emulator import Emulator
+from MIInstruction import HALT_INSTRUCTION
+
+PROGRAMS = sample_programs()
+
+
+@pytest.mark.parametrize("name, source", PROGRAMS, ids=[name for name, _ in PROGRAMS])
+def test_snapshot_resumes_the_run(mode, name, source):
+    final, ticks = load_source(reference_emulator(), source).run(mode, quiet=True)
+    emulator = load_source(reference_emulator(), source)
+    emulator.run(mode, ticks // 2, quiet=True)
+    snapshot = emulator.snapshot()
+
+    copy = reference_emulator()
+    copy.restore(snapshot)
+    assert copy.snapshot() == snapshot
+    assert copy.run(mode, quiet=True) == (final, ticks - ticks // 2)
+    # Restoring rewinds the emulator which took the snapshot, a fork runs on its own
+    fork = emulator.fork()
+    assert emulator.run(mode, quiet=True) == (final, ticks - ticks // 2)
+    emulator.restore(snapshot)
+    assert emulator.snapshot() == snapshot
+    assert emulator.run(mode, quiet=True) == (final, ticks - ticks // 2)
+    assert fork.snapshot() == snapshot
+    assert fork.run(mode, quiet=True) == (final, ticks - ticks // 2)
+
+
+def test_snapshot_after_instruction_counter_on_data_bus(mode):
+    # IC++ at 0xFFFF wraps around, then the data bus gets the instruction counter
+    emulator = Emulator({}, {0: word(ic=0b0010), 1: word(ic=0b0100), 2: HALT_INSTRUCTION})
+    emulator._state.instruction_counter = 0xFFFF
+    status, ticks = emulator.run(mode, 10, quiet=True)
+    assert ticks == 2
+    assert status["instruction_counter"] == 0 and status["data_bus"] == 0
+
+    snapshot = emulator.snapshot()
+    copy = Emulator({}, {0: HALT_INSTRUCTION})
+    copy.restore(snapshot)
+    assert copy.snapshot() == snapshot
+    assert emulator.fork().snapshot() == snapshot
+
+
+def test_restored_unknown_opcode_is_reported(mode):
+    source = reference_emulator()
+    jmap = next(address for address, mi in source.get_decoded_micro_program().items()
+                if mi.controller_instruction == 0b0010 and not mi.ir and not mi.halt)
+    source._state.mic = jmap
+    source._state.instruction_register = 0x2000
+    snapshot = source.snapshot()
+
+    emulator = reference_emulator()
+    assert emulator.validate().valid
+    emulator.restore(snapshot)
+    with pytest.raises(Exception, match="Opcode 32 is not present in PROM"):
+        emulator.run(mode, 100, quiet=True)
@@ -0,0 +1,78 @@
+import pytest
+
+from Assembler import Assembler
+from conftest import load_source, reference_emulator, sample_programs
+from Trace import FLAG_ERROR, TraceRecord, TraceRingBuffer, TraceWriter, read_trace
+
+_, SOURCE = sample_programs()[0]
+
+
+def failing_emulator():
+    '''The first sample program with its halt replaced by an opcode the PROM does not have.'''
+    program, memory = Assembler.assemble_string(SOURCE)
+    program[-1] = 0x2000
+    emulator = reference_emulator()
+    emulator.init_memory(memory)
+    emulator.insert_program(program)
+    return emulator
+
+
+def test_records_round_trip(tmp_path):
+    path = str(tmp_path / "trace.bin")
+    records = [TraceRecord(tick, 0x123 + tick, 0xFF00, tick, 0xFFFF, 0x8000, 0x1234, 0b1101, tick & 1, tick % 3)
+               for tick in range(10)]
+    # A buffer of 3 records flushes in the middle of the trace
+    writer = TraceWriter(path, buffered_records=3)
+    for record in records:
+        writer.record(*record)
+    writer.close()
+    assert list(read_trace(path)) == records
+
+
+def test_trace_of_a_run(tmp_path):
+    path = str(tmp_path / "trace.bin")
+    emulator = load_source(reference_emulator(), SOURCE)
+    ring = TraceRingBuffer()
+    _, ticks = load_source(reference_emulator(), SOURCE).run(tracer=TraceWriter(path), quiet=True)
+    emulator.run(tracer=ring, quiet=True)
+    records = list(read_trace(path))
+    assert [record.tick for record in records] == list(range(ticks))
+    assert records[0].mic == 0
+    assert list(ring.records()) == records
+
+
+def test_ring_buffer_dumps_the_last_ticks_on_failure(tmp_path, capsys):
+    full = str(tmp_path / "full.bin")
+    with pytest.raises(Exception):
+        failing_emulator().run(tracer=TraceWriter(full), quiet=True)
+    dump = str(tmp_path / "dump.bin")
+    ring = TraceRingBuffer(capacity=8, dump_path=dump)
+    with pytest.raises(Exception, match="not present in PROM"):
+        failing_emulator().run(tracer=ring, quiet=True)
+    assert capsys.readouterr().out == ""
+
+    dumped = list(read_trace(dump))
+    assert len(dumped) == len(ring) == 8
+    assert dumped == list(read_trace(full))[-8:]
+    assert dumped[-1].flags & FLAG_ERROR
+
+
+def test_failed_run_reports_the_dump_unless_quiet(tmp_path, capsys):
+    dump = str(tmp_path / "dump.bin")
+    with pytest.raises(Exception):
+        failing_emulator().run(tracer=TraceRingBuffer(capacity=8, dump_path=dump))
+    assert "Trace of the last 8 ticks dumped to {}".format(dump) in capsys.readouterr().out
+
+
+def test_fail_returns_the_dump_path(tmp_path):
+    error = Exception("failed")
+    dump = str(tmp_path / "dump.bin")
+    ring = TraceRingBuffer(capacity=4, dump_path=dump)
+    ring.record(0, 1, 2, 3, 4, 5, 6, 7, 8, 0)
+    assert ring.fail(9, error) == dump
+    assert [record.mic for record in read_trace(dump)] == [1, 9]
+    assert TraceRingBuffer(capacity=4).fail(9, error) is None
+    writer = TraceWriter(str(tmp_path / "trace.bin"))
+    assert writer.fail(9, error) is None
+    writer.close()
+    assert [record.flags for record in read_trace(str(tmp_path / "trace.bin"))] == [FLAG_ERROR]
@@ -0,0 +1,123 @@
+import random
+
+import pytest
+
+from ALU import ALU, INSTRUCTIONS
+from ControlUnit import ControlUnit
+from MachineState import STACK_SIZE, MachineState
+from SSCUnit import CONDITIONS, SSCUnit
+
+# The semantics of the units written out case by case, as the if/elif units had them
+
+
+def expected_alu(instruction, registers, q, a, b, d, c_n):
+    '''Output, status, registers and Q after the instruction.'''
+    data_select, opcode, result_select = instruction & 0b111, (instruction >> 3) & 0b111, instruction >> 6
+    R = registers[a] if data_select <= 0b001 else 0 if data_select <= 0b100 else d
+    S = (q if data_select in (0b000, 0b010, 0b110) else registers[b] if data_select in (0b001, 0b011)
+         else registers[a] if data_select in (0b100, 0b101) else 0)
+    res = [R + S + c_n, S - R - c_n, R - S - c_n, R | S, R & S, (R ^ 0xFFFF) & S, R ^ S, (R ^ S) ^ 0xFFFF][opcode]
+    status = (0b1100 if res > 0xFFFF or res < 0 else 0) | (0b0010 if res < 0 else 0)
+    res &= 0xFFFF
+    status |= 0b0001 if res == 0 else 0
+    registers = list(registers)
+    output = registers[a] if result_select == 0b010 else res
+    if result_select == 0b001:
+        q = res
+    if result_select in (0b010, 0b011):
+        registers[b] = res
+    return output, status, registers, q
+
+
+def expected_condition(opcode, status):
+    C, Z = (status & 0b0100) >> 2, status & 0b0001
+    return {0b000100: Z ^ 1, 0b000101: Z, 0b001010: C, 0b001011: C ^ 1, 0b001100: (C ^ 1) & (Z ^ 1), 0b001101: C | Z}.get(opcode, 0)
+
+
+def expected_control(instruction, stack, mic, bar, ccen, cc, d):
+    '''Next mic and stack, or the message of the exception.'''
+    cond = ccen == 1 and cc == 0
+    stack = list(stack)
+    if instruction == 0b0000:
+        return 0, []
+    if instruction == 0b0010:
+        return d, stack
+    if instruction == 0b1110:
+        return mic + 1, stack
+    if instruction == 0b0100:
+        if len(stack) == STACK_SIZE:
+            return "ControlUnit: stack overflow"
+        return mic + 1, stack + [bar]
+    if instruction not in (0b0001, 0b0011, 0b1010, 0b1011):
+        return "ControlUnit: invalid instruction 0b" + format(instruction, "04b")
+    if cond:
+        return mic + 1, stack
+    if instruction == 0b0011:
+        return bar, stack
+    if instruction == 0b0001:
+        if len(stack) == STACK_SIZE:
+            return "ControlUnit: stack overflow"
+        return bar, stack + [mic + 1]
+    if not stack:
+        return "ControlUnit: stack underflow"
+    top = stack.pop()
+    return (top if instruction == 0b1010 else bar), stack
+
+
+OPERANDS = [0, 1, 2, 0x7FFF, 0x8000, 0xFFFE, 0xFFFF]
+
+
+def test_alu_table_matches_every_instruction():
+    generator = random.Random(14)
+    for instruction in range(1 << 9):
+        if instruction >> 6 > 0b011:
+            assert INSTRUCTIONS[instruction] is None
+            with pytest.raises(Exception, match="ALU: unsupported result select"):
+                ALU().run(instruction, 0, 0, 0, 0)
+            continue
+        for a, b in ((3, 5), (4, 4)):
+            for c_n in (0, 1):
+                for _ in range(6):
+                    state = MachineState()
+                    state.registers = [generator.choice(OPERANDS) for _ in range(16)]
+                    state.q = generator.choice(OPERANDS)
+                    d = generator.choice(OPERANDS)
+                    expected = expected_alu(instruction, state.registers, state.q, a, b, d, c_n)
+                    output, status = ALU(state).run(instruction, a, b, d, c_n)
+                    assert (output, status, state.registers, state.q) == expected, (instruction, a, b, d, c_n)
+
+
+def test_sscu_table_matches_every_condition():
+    for opcode in range(1 << 6):
+        for status in range(1 << 4):
+            assert CONDITIONS[opcode << 4 | status] == expected_condition(opcode, status)
+            for select, source in ((0b00, None), (0b01, "macro_status"), (0b10, "micro_status")):
+                for ce_macro, ce_micro in ((0, 0), (1, 0), (0, 1), (1, 1)):
+                    state = MachineState()
+                    state.macro_status, state.micro_status = status, status ^ 0b1111
+                    test = 0 if source is None else expected_condition(opcode, getattr(state, source))
+                    new = 0b1010
+                    assert SSCUnit(state).run(new, ce_macro, ce_micro, select << 10 | opcode) == test
+                    assert state.macro_status == (new if ce_macro else status)
+                    assert state.micro_status == (new if ce_micro else status ^ 0b1111)
+    with pytest.raises(Exception, match="SSCUnit: select can not be 0b11"):
+        SSCUnit().run(0, 0, 0, 0b11 << 10)
+
+
+def test_control_unit_actions_match_every_instruction():
+    for instruction in range(1 << 4):
+        for depth in (0, 2, STACK_SIZE):
+            for ccen in (0, 1):
+                for cc in (0, 1):
+                    stack = [100 + i for i in range(depth)]
+                    state = MachineState()
+                    state.mic = 40
+                    state.stack[:depth] = stack
+                    state.stack_pointer = depth
+                    expected = expected_control(instruction, stack, 40, 7, ccen, cc, 90)
+                    if isinstance(expected, str):
+                        with pytest.raises(Exception, match=expected):
+                            ControlUnit(state).run(instruction, 7, ccen, cc, 90)
+                        continue
+                    assert ControlUnit(state).run(instruction, 7, ccen, cc, 90) == expected[0]
+                    assert (state.mic, state.get_stack()) == expected
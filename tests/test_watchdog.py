@@ -0,0 +1,70 @@
+from conftest import load_source, reference_emulator
+from Memory import words_hash
+from Watchdog import Watchdog
+
+# Every iteration adds 203 to [100] and subtracts 201 from [101] and leaves the registers and flags as they were,
+# with address dependent hash weights (2a + 1) * K these writes cancel each other out in the memory hash
+CANCELLING_WRITES = """mov 100 r5
+mov 101 r6
+mov 203 r1
+mov 201 r2
+mov 20000 r9
+loop: mov [r5] r3
+add r1 r3
+mov r3 [r5]
+mov [r6] r3
+sub r2 r3
+mov r3 [r6]
+mov [r5] r3
+cmp r3 r9
+mov 0 r3
+jl loop
+memory:
+101: 60000
+"""
+
+LOOP = """mov 1 r1
+loop: mov r1 [r1]
+jmp loop
+"""
+
+
+def test_cancelling_writes_are_not_a_loop(mode):
+    emulator = load_source(reference_emulator(), CANCELLING_WRITES)
+    status, _ = emulator.run(mode, 100000, quiet=True, detect_loops=True)
+    assert emulator.get_stop_reason() == "halted"
+    assert status["memory"][100] == 99 * 203
+
+
+def test_loop_is_detected(mode):
+    emulator = load_source(reference_emulator(), LOOP)
+    emulator.run(mode, 100000, quiet=True, detect_loops=True)
+    assert emulator.get_stop_reason().startswith("non-terminating")
+
+
+def test_memory_hash_only_while_detecting_loops(mode):
+    emulator = load_source(reference_emulator(), LOOP)
+    emulator.run(mode, 1000, quiet=True)
+    assert emulator._memory._hash is None
+    emulator.run(mode, 1000, quiet=True, detect_loops=True)
+    assert emulator._memory._hash is None
+
+
+def test_memory_hash_follows_the_writes(mode):
+    emulator = load_source(reference_emulator(), CANCELLING_WRITES)
+    emulator._memory.track_hash(True)
+    emulator.run(mode, 100000, quiet=True)
+    assert emulator._memory._hash == words_hash(emulator._memory._words)
+
+
+def test_loop_longer_than_a_run_is_detected(mode):
+    emulator = load_source(reference_emulator(), LOOP)
+    emulator.run(mode, 100000, quiet=True, detect_loops=True)
+    reason = emulator.get_stop_reason()
+    emulator = load_source(reference_emulator(), LOOP)
+    watchdog = Watchdog()
+    for _ in range(1000):
+        emulator.run(mode, 5, quiet=True, watchdog=watchdog)
+        if emulator.get_stop_reason() != "instructions limit":
+            break
+    assert emulator.get_stop_reason() == reason